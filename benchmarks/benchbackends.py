@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""benchbackends -- compare Dice throughput across RNG backends.
+
+Usage: python benchmarks/benchbackends.py [seconds-per-case]
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'dyce'))
+
+import dice
+import rng
+
+
+def measure(func, budget):
+    """Call func repeatedly for about budget seconds; return calls/sec.
+    """
+    calls = 0
+    start = time.time()
+    elapsed = 0.0
+    while elapsed < budget:
+        for i in xrange(100):
+            func()
+        calls += 100
+        elapsed = time.time() - start
+    return calls / elapsed
+
+
+def main(budget=1.0):
+    cases = [
+        ('roll(1, 6)', lambda d: lambda: d.roll(1, 6)),
+        ('roll(100, 6)', lambda d: lambda: d.roll(100, 6)),
+        ('rollsum(3, 6)', lambda d: lambda: d.rollsum(3, 6)),
+        ('rollbell(1, 10)', lambda d: lambda: d.rollbell(1, 10)),
+        ('getrandbits(32)', lambda d: lambda: d.rand.getrandbits(32)),
+        ]
+    names = sorted(rng.available())
+    print '%-18s' % 'calls/sec', ''.join(['%14s' % n for n in names])
+    for label, make in cases:
+        row = []
+        for name in names:
+            d = dice.Dice(backend=name)
+            row.append(measure(make(d), budget))
+        print '%-18s' % label, ''.join(['%14.0f' % r for r in row])
+
+
+if __name__ == '__main__':
+    main(*[float(a) for a in sys.argv[1:]])
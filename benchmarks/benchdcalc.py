@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""benchdcalc -- compare the ways of evaluating a dcalc expression.
+
+Usage: python benchmarks/benchdcalc.py [seconds-per-case]
+
+parse: scanning and parsing the string every time.
+cached: calculate(), compiling through the expression cache.
+tree: evaluate() walking the compiled tree.
+codegen: the Python function generated from the tree.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'dyce'))
+
+import dice
+import dcalc
+
+from benchbackends import measure
+
+EXPRESSIONS = [
+    '3d6',
+    '3d6+2*bell[1 10]',
+    'fuzz(2d6*10, 0.1) + [1 5]',
+    'let x = 2d6 in x*x - 4d6kh3',
+    ]
+
+
+def main(budget=1.0):
+    d = dice.Dice()
+    ways = ['parse', 'cached', 'tree', 'codegen']
+    print '%-30s' % 'calls/sec', ''.join(['%12s' % w for w in ways])
+    for expr in EXPRESSIONS:
+        tree = dcalc.compile(expr).tree
+        function = dcalc.codegen(tree)
+        row = [measure(lambda: dcalc.evaluate(dcalc.compile(expr).tree, d),
+                       budget),
+               measure(lambda: dcalc.calculate(expr, d), budget),
+               measure(lambda: dcalc.evaluate(tree, d), budget),
+               measure(lambda: function(d), budget)]
+        print '%-30s' % expr, ''.join(['%12.0f' % r for r in row])
+
+
+if __name__ == '__main__':
+    main(*[float(a) for a in sys.argv[1:]])
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""benchmemory -- measure the memory held by each Dice.
+
+Compares Dice made from a full generator state (as every Dice used to
+be) with compact, seeded Dice, before and after their first roll.
+
+Usage: python benchmarks/benchmemory.py [count]
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+import os
+import sys
+import gc
+import random
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'dyce'))
+
+import dice
+
+
+def rss():
+    """Return the peak resident set size of this process, in bytes.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return usage
+    return usage * 1024
+
+
+def measure(label, make, count):
+    """Make count Dice with make(i); print the bytes each one adds.
+    """
+    gc.collect()
+    before = rss()
+    hoard = [make(i) for i in xrange(count)]
+    after = rss()
+    print '%-34s %10.0f bytes/Dice' % (label, float(after - before) / count)
+    return hoard
+
+
+def rolled(d):
+    d.roll()
+    return d
+
+
+def main(count=20000):
+    state = random.getstate()
+    # Each case runs in a fresh process, since peak RSS only grows.
+    cases = [
+        ('state (before)', lambda i: dice.Dice(state=state)),
+        ('seed, unrolled (after)', lambda i: dice.Dice(seed=i)),
+        ('seed, rolled (after)', lambda i: rolled(dice.Dice(seed=i))),
+        ('seed, pcg32, rolled (after)',
+         lambda i: rolled(dice.Dice(seed=i, backend='pcg32'))),
+        ]
+    for label, make in cases:
+        pid = os.fork()
+        if pid == 0:
+            measure(label, make, count)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
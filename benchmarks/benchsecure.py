@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""benchsecure -- compare SecureDice with rolling from random.SystemRandom.
+
+Usage: python benchmarks/benchsecure.py [seconds-per-case]
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'dyce'))
+
+import dice
+import dcalc
+
+from benchbackends import measure
+
+
+class PerDieRandom(random.SystemRandom):
+    """SystemRandom reading the OS once per 32 bits, i.e. once per die.
+
+    Dice draws a whole roll's bits in one getrandbits() call, which
+    SystemRandom would serve with a single read; this is the naive
+    baseline that asks the OS for every die.
+    """
+
+    def getrandbits(self, k):
+        result = 0
+        for i in xrange(0, k, 32):
+            n = min(32, k - i)
+            result = (result << n) | random.SystemRandom.getrandbits(self, n)
+        return result
+
+
+def main(budget=1.0):
+    cases = [
+        ('roll(1, 6)', lambda d: lambda: d.roll(1, 6)),
+        ('roll(10, 6)', lambda d: lambda: d.roll(10, 6)),
+        ('rollsum(3, 6)', lambda d: lambda: d.rollsum(3, 6)),
+        ('fuzz(10, 0.5)', lambda d: lambda: d.fuzz(10, 0.5)),
+        ("calculate('3d6')", lambda d: lambda: dcalc.calculate('3d6', d)),
+        ]
+    rollers = [
+        ('Dice (mt)', dice.Dice()),
+        ('SystemRandom', dice.Dice(backend=PerDieRandom)),
+        ('SecureDice', dice.SecureDice()),
+        ]
+    print '%-18s' % 'calls/sec', ''.join(['%14s' % n for n, d in rollers])
+    for label, make in cases:
+        row = [measure(make(d), budget) for name, d in rollers]
+        print '%-18s' % label, ''.join(['%14.0f' % r for r in row])
+
+
+if __name__ == '__main__':
+    main(*[float(a) for a in sys.argv[1:]])
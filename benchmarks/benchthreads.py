@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""benchthreads -- module roller throughput from many threads at once.
+
+Each case starts N threads that all roll with the module roller (both
+directly and through dcalc), first sharing one Dice, then with a Dice
+per thread. Under the GIL, threads can't roll in parallel, so expect
+totals to stay flat; the thread-local column shows the mode's own
+overhead, and what free-threaded builds have to gain.
+
+Usage: python benchmarks/benchthreads.py [calls-per-thread]
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'dyce'))
+
+import dice
+import dcalc
+
+
+CASES = [
+    ('roller.roll(10, 6)', lambda: dice.roller.roll(10, 6)),
+    ("calculate('3d6+2')", lambda: dcalc.calculate('3d6+2')),
+    ]
+
+
+def measure(func, threads, calls):
+    """Run func calls times in each of threads threads; return calls/sec.
+    """
+    def work():
+        for i in xrange(calls):
+            func()
+    workers = [threading.Thread(target=work) for i in xrange(threads)]
+    start = time.time()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return threads * calls / (time.time() - start)
+
+
+def main(calls=20000):
+    print '%-22s %8s %14s %14s' % ('calls/sec', 'threads', 'shared',
+                                   'thread-local')
+    for label, func in CASES:
+        for threads in (1, 2, 4, 8):
+            dice.setThreadLocal(False)
+            shared = measure(func, threads, calls)
+            dice.setThreadLocal(seed=1)
+            local = measure(func, threads, calls)
+            print '%-22s %8d %14.0f %14.0f' % (label, threads, shared, local)
+    dice.setThreadLocal(False)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
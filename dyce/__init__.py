@@ -12,5 +12,3 @@ __date__ = "$Date$"[7:-2]
 
 from dice import *
 from dcalc import *
-
-roller = Dice()
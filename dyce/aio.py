@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""aio -- coalesced dice calculations for asyncio event loops.
+
+A game server that wants thousands of tiny rolls a second can ask for
+them one at a time, and have them rolled in bulk:
+
+    result = await aio.calculate('1d20+5')          # asyncio
+    result = yield From(aio.calculate('1d20+5'))    # trollius
+
+calculate() returns a future at once. Requests are held for a short
+window (or until max_batch of them are waiting), grouped by
+expression, and each group is rolled in one pass: simple dice
+expressions ("NdS", "NdS+M") are rolled as a single batch, everything
+else is parsed once per request. With an executor, groups are rolled
+off the event loop.
+
+Tail latency is traded against throughput with two knobs, set on a
+RollService or, for the module-level calculate(), with configure():
+
+ - window: how long (in seconds) the first request of a batch waits
+   for others to join it. This bounds the extra latency.
+
+ - max_batch: how many requests make a batch worth rolling right
+   away, without waiting out the window.
+
+Uses asyncio where it exists, or else its Python 2 port, trollius.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__version__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import re
+from functools import partial
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+import dice
+import dcalc
+
+import logging
+logger = logging.getLogger('aio')
+
+__all__ = ['RollService', 'calculate', 'configure', 'evaluate',
+           'getService']
+
+# The default batching window, in seconds.
+WINDOW = 0.001
+
+# The default number of waiting requests that triggers a roll at once.
+MAX_BATCH = 1024
+
+_SIMPLE_DICE = re.compile(r'\s*(\d+)d(\d+)\s*(?:([-+])\s*(\d+))?\s*$')
+
+# Event loop -> the module's RollService for it, and the tunables
+# they're made with.
+_services = {}
+_tunables = {}
+
+
+def evaluate(expr, count, roller=None):
+    """Return a list of count results of the dcalc expression expr.
+
+    Simple dice expressions ("3d6", "1d20+5") are rolled in one
+    batch; others are calculated one by one.
+
+    @param roller: The Dice to roll with; defaults to dice.roller.
+    """
+    if roller is None:
+        roller = dice.roller
+    match = _SIMPLE_DICE.match(expr)
+    if match is None:
+        return [dcalc.calculate(expr, roller) for i in xrange(count)]
+    num, sides, sign, mod = match.groups()
+    mod = int(mod or 0)
+    if sign == '-':
+        mod = -mod
+    results = roller.rollsum_batch(count, int(num), int(sides), 0, mod)
+    if not isinstance(results, list):
+        results = results.tolist()
+    return results
+
+
+class RollService(object):
+    """Coalesces calculate() requests into batches, on one event loop.
+    """
+    def __init__(self, window=WINDOW, max_batch=MAX_BATCH, executor=None,
+                 roller=None, loop=None):
+        """Initialize the RollService.
+
+        @param window: How long to hold requests, in seconds.
+        @type window: float
+
+        @param max_batch: How many waiting requests to roll at once.
+        @type max_batch: int
+
+        @param executor: A concurrent.futures executor to roll in, off
+            the event loop; by default, groups are rolled on it.
+
+        @param roller: The Dice to roll with; defaults to dice.roller.
+
+        @param loop: The event loop; defaults to the current one.
+        """
+        if asyncio is None:
+            raise ImportError('dyce.aio needs asyncio (or trollius)')
+        self.window = window
+        self.max_batch = max_batch
+        self.executor = executor
+        self.roller = roller
+        self._loop = loop
+        self._pending = {}
+        self._waiting = 0
+        self._timer = None
+
+    @property
+    def loop(self):
+        """The event loop this service schedules on."""
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        return self._loop
+
+    def calculate(self, expr):
+        """Return a future for one result of the dcalc expression expr.
+        """
+        future = asyncio.Future(loop=self.loop)
+        self._pending.setdefault(expr, []).append(future)
+        self._waiting += 1
+        if self._waiting >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(self.window, self.flush)
+        return future
+
+    def flush(self):
+        """Roll every waiting request now.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending = self._pending
+        self._pending = {}
+        self._waiting = 0
+        for expr, futures in pending.iteritems():
+            futures = [f for f in futures if not f.cancelled()]
+            if not futures:
+                continue
+            if self.executor is None:
+                try:
+                    results = evaluate(expr, len(futures), self.roller)
+                except Exception, e:
+                    self._fail(futures, e)
+                else:
+                    self._resolve(futures, results)
+            else:
+                job = self.loop.run_in_executor(self.executor, evaluate, expr,
+                                                len(futures), self.roller)
+                job.add_done_callback(partial(self._deliver, futures))
+
+    def _deliver(self, futures, job):
+        if job.cancelled():
+            for future in futures:
+                future.cancel()
+        elif job.exception() is not None:
+            self._fail(futures, job.exception())
+        else:
+            self._resolve(futures, job.result())
+
+    def _resolve(self, futures, results):
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _fail(self, futures, error):
+        logger.info('Failed to roll a batch: %s', error)
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+
+def getService(loop=None):
+    """Return the module's RollService for the event loop, making it if
+    need be.
+
+    @param loop: The event loop; defaults to the current one.
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    try:
+        return _services[loop]
+    except KeyError:
+        # Services of closed loops can't be used again; drop them.
+        for old in [l for l in _services if l.is_closed()]:
+            del _services[old]
+        service = _services[loop] = RollService(loop=loop, **_tunables)
+        return service
+
+
+def configure(**tunables):
+    """Set the tunables (window, max_batch, executor, roller) of the
+    module's RollServices, now and to come.
+    """
+    for name in tunables:
+        if name not in ('window', 'max_batch', 'executor', 'roller'):
+            raise TypeError('no tunable named %r' % (name,))
+    _tunables.update(tunables)
+    for service in _services.itervalues():
+        for name, value in tunables.iteritems():
+            setattr(service, name, value)
+
+
+def calculate(expr):
+    """Return a future for one result of the dcalc expression expr.
+
+    Requests are coalesced by the module's RollService for the current
+    event loop (see configure()).
+    """
+    return getService().calculate(expr)
@@ -13,6 +13,12 @@ C{n d s} -> a dice expression, where n is the number of dice, and s is
 the number of sides per die (i.e. 2d6 for two six-sided dice. The
 result is the sum of the roll.
 
+C{n d s k h} -> a dice expression, keeping only the h highest dice
+(i.e. 4d6kh3, or 4d6k3, for "4d6, drop the lowest"). C{kl} keeps the
+lowest dice instead, and C{dl} and C{dh} drop the given number of
+lowest or highest dice: 2d20kh1 rolls with advantage, 2d20dh1 with
+disadvantage.
+
 C{[min - max]} -> return an int between min and max, inclusive, on the
 uniform distribution.
 
@@ -38,6 +44,19 @@ One can parse a dice expression using C{calculate}:
     >>> calculate('1d6 + 3d10')
     23
 
+One can compile a dice expression once, and evaluate it many times
+without parsing it again, using C{compile}:
+
+    >>> e = compile('3d6 + 2')
+    >>> e()
+    12
+
+One can roll many independent results of a dice expression at once,
+in bulk, using C{sample}:
+
+    >>> sample('fuzz(2d6*10, 0.1) + [1 5]', 5)
+    array([ 102.15...,   57.41...,   70.08...,   43.27...,   94.81...])
+
 One can use a Dstr object to store a dice expression for convenience:
 
     >>> d = Dstr('1d6')
@@ -62,21 +81,69 @@ __version__ = "$Rev$"[6:-2]
 __date__ = "$Date$"[7:-2]
 
 
+import re
+import time
+import operator
+import threading
+import __builtin__
+from array import array
 from string import strip, atoi, atof
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import dice
+import distribution as exact
 import logging
 logger = logging.getLogger('dcalc')
 
-__all__ = ['Dstr', 'calculate']
+# An Expression is evaluated by walking its tree until it has been
+# called this many times; then it is turned into Python code.
+CODEGEN_CALLS = 8
+
+# The number of compiled expressions calculate() keeps, by source, and
+# how long (in seconds) each is kept; None keeps them until evicted.
+EXPRESSION_CACHE_SIZE = 1024
+EXPRESSION_CACHE_TTL = None
+
+# The number of whole-expression distributions distribution() keeps.
+DISTRIBUTION_CACHE_SIZE = 128
+
+# compile() is left out, so star imports don't shadow the builtin, and
+# distribution(), so dyce's star import doesn't shadow dyce.distribution.
+__all__ = ['Dstr', 'Expression', 'ExpressionCache', 'calculate', 'sample']
 
 dparse = dice.parse
 dsum = dice.roller.rollsum
 dfuzz = dice.roller.fuzz
-drand = dice.roller.rand
-drandint = drand.randint
+drandint = dice.roller.randint
 dbelli = dice.roller.rollbellInt
 dbellf = dice.roller.rollbellFloat
-duni = drand.uniform
+duni = dice.roller.uniform
+
+def dkeep(d):
+    """Parse a keep/drop dice specifier (i.e. "4d6kh3").
+
+    Return (num, sides, keep, highest), for Dice.roll_keep(). Raise a
+    parser SyntaxError, reported like any other, for specifiers that
+    Dice.roll_keep() would refuse.
+    """
+    num, sides, mode, count = re.match(r'(\d+)d(\d+)([kd][hl]?)(\d+)$',
+                                       d).groups()
+    num, sides, count = int(num), int(sides), int(count)
+    if not (num > 0 and sides > 0):
+        raise runtime.SyntaxError(msg='%s: need at least one die, of at '
+                                  'least one side' % (d,))
+    if not (count <= num):
+        raise runtime.SyntaxError(msg="%s: can't keep or drop more dice "
+                                  'than are rolled' % (d,))
+    if mode[0] == 'd':
+        # Dropping the lowest keeps the highest, and vice versa.
+        return num, sides, num - count, mode != 'dh'
+    return num, sides, count, mode != 'kl'
+
 
 globalvars = {}       # We will store the calculator variables here
 
@@ -93,42 +160,45 @@ parser DiceCalculator:
     ignore:    "[ \r\t\n]+"
     token END: "$"
     token DIE: "[0-9]+d[0-9]+"
+    token KEEP: "[0-9]+d[0-9]+[kd][hl]?[0-9]+"
     token FLT: "-?[0-9]+[.][0-9]+"
     token INT: "-?[0-9]+"
     token VAR: "[a-zA-Z_]+"
 
-    # Each line can either be an expression or an assignment statement
-    rule goal:   expr<<[]>> END            {{ return expr }}
-               | "set" VAR expr<<[]>> END  {{ globalvars[VAR] = expr }}
-                                           {{ return expr }}
+    # Each line can either be an expression or an assignment statement.
+    # Rules build an expression tree of tuples (see evaluate()); the
+    # goal returns (goal, name, tree).
+    rule goal:   expr END                  {{ return ('value', None, expr) }}
+               | "set" VAR expr END        {{ return ('set', VAR, expr) }}
 
-               | "u\\(" expr<<[]>> "," VAR "\\)" END  {{ return (expr, str(VAR)) }}
+               | "u\\(" expr "," VAR "\\)" END  {{ return ('u', str(VAR), expr) }}
 
     # An expression is the sum and difference of factors
-    rule expr<<V>>:   factor<<V>>         {{ n = factor }}
-                     (  "[+]" factor<<V>> {{ n = n+factor }}
-                     |  "-"  factor<<V>>  {{ n = n-factor }}
+    rule expr:        factor              {{ n = factor }}
+                     (  "[+]" factor      {{ n = ('+', n, factor) }}
+                     |  "-"  factor       {{ n = ('-', n, factor) }}
                      )*                   {{ return n }}
 
     # A factor is the product and division of terms
-    rule factor<<V>>: term<<V>>           {{ v = term }}
-                     ( "[*]" term<<V>>    {{ v = v*term }}
-                     |  "/"  term<<V>>    {{ v = v/term }}
+    rule factor:      term                {{ v = term }}
+                     ( "[*]" term         {{ v = ('*', v, term) }}
+                     |  "/"  term         {{ v = ('/', v, term) }}
                      )*                   {{ return v }}
 
     # A term is a number, variable, or an expression surrounded by parentheses
-    rule term<<V>>:   
-                 DIE                      {{ return dsum(*dparse(DIE))}}
-               | "\\[" INT {{ a = atoi(INT) }} " " INT "\\]" {{ return drandint(a, atoi(INT)) }}
-               | "\\{" number {{ a = number }} " " number "\\}" {{ return duni(a, number) }}
-               | "bell\\[" INT {{a = atoi(INT) }} " " INT "\\]" {{ return dbelli(a, atoi(INT)) }}
-               | "bell\\{" FLT {{a = atof(FLT) }} " " FLT "\\}" {{ return dbellf(a, atof(FLT)) }}
-               | "fuzz\\(" expr<<V>> "," number "\\)" {{ return dfuzz(float(expr), float(number)) }}
-               | number                      {{ return number }}
-               | VAR                      {{ return lookup(V, VAR) }}
-               | "\\(" expr<<V>> "\\)"         {{ return expr }}
-               | "let" VAR "=" expr<<V>>  {{ V = [(VAR, expr)] + V }}
-                 "in" expr<<V>>           {{ return expr }}
+    rule term:
+                 DIE                      {{ return ('dice',) + dparse(DIE) }}
+               | KEEP                     {{ return ('keep',) + dkeep(KEEP) }}
+               | "\\[" INT {{ a = atoi(INT) }} " " INT "\\]" {{ return ('randint', a, atoi(INT)) }}
+               | "\\{" number {{ a = number }} " " number "\\}" {{ return ('uniform', a, number) }}
+               | "bell\\[" INT {{a = atoi(INT) }} " " INT "\\]" {{ return ('bellint', a, atoi(INT)) }}
+               | "bell\\{" FLT {{a = atof(FLT) }} " " FLT "\\}" {{ return ('bellfloat', a, atof(FLT)) }}
+               | "fuzz\\(" expr "," number "\\)" {{ return ('fuzz', expr, float(number)) }}
+               | number                   {{ return ('num', number) }}
+               | VAR                      {{ return ('var', VAR) }}
+               | "\\(" expr "\\)"          {{ return expr }}
+               | "let" VAR "=" expr       {{ value = expr }}
+                 "in" expr                {{ return ('let', VAR, value, expr) }}
 
     rule number:
                  FLT                       {{ return atof(FLT) }}
@@ -136,21 +206,665 @@ parser DiceCalculator:
 
 %%
 
-def calculate(dice_str):
+# Expressions roll with the module roller, unless given another.
+DiceCalculator.roller = dice.roller
+
+
+def _binary(op):
+    def evaluateBinary(node, roller, V):
+        return op(evaluate(node[1], roller, V), evaluate(node[2], roller, V))
+    return evaluateBinary
+
+
+def _evaluateLet(node, roller, V):
+    name, value, body = node[1:]
+    return evaluate(body, roller, [(name, evaluate(value, roller, V))] + V)
+
+
+# Node tag -> function(node, roller, V) returning the node's value.
+_evaluators = {
+    'num': lambda node, roller, V: node[1],
+    'var': lambda node, roller, V: lookup(V, node[1]),
+    'dice': lambda node, roller, V: roller.rollsum(*node[1:]),
+    'keep': lambda node, roller, V: sum(roller.roll_keep(*node[1:])),
+    'randint': lambda node, roller, V: roller.randint(node[1], node[2]),
+    'uniform': lambda node, roller, V: roller.uniform(node[1], node[2]),
+    'bellint': lambda node, roller, V: roller.rollbellInt(node[1], node[2]),
+    'bellfloat': lambda node, roller, V: roller.rollbellFloat(node[1],
+                                                              node[2]),
+    'fuzz': lambda node, roller, V: roller.fuzz(
+        float(evaluate(node[1], roller, V)), node[2]),
+    '+': _binary(operator.add),
+    '-': _binary(operator.sub),
+    '*': _binary(operator.mul),
+    '/': _binary(operator.div),
+    'let': _evaluateLet,
+    }
+
+
+def evaluate(node, roller, V=[]):
+    """Return the value of an expression tree, rolling with roller.
+
+    A tree is nested tuples, each tagged with its kind of node:
+    ('num', n), ('var', name), ('dice', num, sides, mod), ('keep',
+    num, sides, keep, highest), ('randint', a, b), ('uniform', a, b),
+    ('bellint', a, b), ('bellfloat', a, b), ('fuzz', tree, distance),
+    ('let', name, tree, tree), or (op, tree, tree) for op in "+-*/".
+    Operands are evaluated left to right, so a tree rolls exactly the
+    dice its source would.
+
+    @param V: The let bindings in scope, as a list of (name, value).
+    """
+    return _evaluators[node[0]](node, roller, V)
+
+
+# Node tag -> the Dice method its generated code calls.
+_methods = {
+    'dice': 'rollsum',
+    'keep': 'roll_keep',
+    'randint': 'randint',
+    'uniform': 'uniform',
+    'bellint': 'rollbellInt',
+    'bellfloat': 'rollbellFloat',
+    'fuzz': 'fuzz',
+    }
+
+
+def _hasLet(node):
+    """Does the tree hold a let anywhere?"""
+    if node[0] == 'let':
+        return True
+    for child in node[1:]:
+        if isinstance(child, tuple) and _hasLet(child):
+            return True
+    return False
+
+
+class _CodeGenerator(object):
+    """Writes the Python source of a function that evaluates a tree.
+
+    The tree becomes a single Python expression, where Python's own
+    left-to-right evaluation keeps the order of the rolls. Let values
+    are assigned to local slots first; an operand to the left of a
+    let is assigned to a temporary before it, so it is still rolled
+    first.
+    """
+    def __init__(self):
+        self.lines = []
+        self.methods = {}
+        self.locals = 0
+
+    def local(self, prefix, value):
+        name = '_%s%d' % (prefix, self.locals)
+        self.locals += 1
+        self.lines.append('    %s = %s' % (name, value))
+        return name
+
+    def generate(self, node, scope):
+        tag = node[0]
+        if tag == 'num':
+            if node[1] < 0:
+                return '(%r)' % (node[1],)
+            return repr(node[1])
+        elif tag == 'var':
+            return scope.get(node[1]) or '_lookup((), %r)' % (node[1],)
+        elif tag in '+-*/':
+            left = self.generate(node[1], scope)
+            if _hasLet(node[2]):
+                left = self.local('t', left)
+            return '(%s %s %s)' % (left, tag, self.generate(node[2], scope))
+        elif tag == 'let':
+            scope = dict(scope)
+            scope[node[1]] = self.local('v', self.generate(node[2], scope))
+            return self.generate(node[3], scope)
+
+        method = _methods[tag]
+        self.methods[method] = self.methods.get(method, 0) + 1
+        if tag == 'fuzz':
+            return '%s(float(%s), %r)' % ('%(fuzz)s',
+                                          self.generate(node[1], scope),
+                                          node[2])
+        call = '%%(%s)s(%s)' % (method,
+                                ', '.join([repr(a) for a in node[1:]]))
+        if tag == 'keep':
+            return '_sum(%s)' % (call,)
+        return call
+
+    def source(self, node):
+        value = self.generate(node, {})
+        # Bind methods called more than once; call the others in place.
+        names = {}
+        head = ['def _evaluate(roller, _lookup=lookup, _sum=sum):']
+        for method, uses in sorted(self.methods.iteritems()):
+            if uses > 1:
+                names[method] = '_' + method
+                head.append('    _%s = roller.%s' % (method, method))
+            else:
+                names[method] = 'roller.' + method
+        body = self.lines + ['    return %s' % (value,), '']
+        return '\n'.join(head + body) % names
+
+
+def codegen(tree):
+    """Return a Python function of a Dice that evaluates the tree.
+
+    The function rolls exactly as evaluate() would, with each roll a
+    direct call of a method bound from the Dice:
+
+        >>> print _CodeGenerator().source(compile('3d6+2*bell[1 10]').tree)
+        def _evaluate(roller, _lookup=lookup, _sum=sum):
+            return (roller.rollsum(3, 6, 0) + (2 * roller.rollbellInt(1, 10)))
+        <BLANKLINE>
+    """
+    source = _CodeGenerator().source(tree)
+    namespace = {'lookup': lookup}
+    code = __builtin__.compile(source, '<dcalc>', 'exec', 0, True)
+    exec code in namespace
+    return namespace['_evaluate']
+
+
+class Expression(object):
+    """A compiled dice expression: the parse of a dcalc string, ready
+    to evaluate any number of times without parsing it again.
+
+    Call it (optionally with a Dice to roll with) for a result, as
+    calculate() would return for the source string. An Expression
+    walks its tree for its first few calls; after CODEGEN_CALLS, it
+    evaluates with a Python function generated from the tree instead
+    (see codegen()).
+    """
+    __slots__ = ('source', 'goal', 'name', 'tree', '_function', '_calls')
+
+    def __init__(self, source, goal, name, tree):
+        """Initialize the Expression.
+
+        @param source: The dcalc string compiled.
+
+        @param goal: 'value' for a plain expression, 'set' to assign
+            the result to the global variable name, or 'u' to return
+            (result, name).
+
+        @param tree: The expression tree (see evaluate()).
+        """
+        self.source = source
+        self.goal = goal
+        self.name = name
+        self.tree = tree
+        self._function = None
+        self._calls = 0
+
+    def __repr__(self):
+        return "<Expression %s>" % (self.source,)
+
+    def __call__(self, roller=None):
+        if roller is None:
+            roller = DiceCalculator.roller
+        function = self._function
+        if function is not None:
+            value = function(roller)
+        elif self._calls < CODEGEN_CALLS:
+            self._calls += 1
+            value = evaluate(self.tree, roller)
+        else:
+            function = self._function = codegen(self.tree)
+            value = function(roller)
+        if self.goal == 'set':
+            globalvars[self.name] = value
+        elif self.goal == 'u':
+            return (value, self.name)
+        return value
+
+    def __getstate__(self):
+        return (self.source, self.goal, self.name, self.tree)
+
+    def __setstate__(self, state):
+        self.source, self.goal, self.name, self.tree = state
+        self._function = None
+        self._calls = 0
+
+
+def compile(dice_str):
+    """Parse the given dice expression into an Expression, once.
+
+        >>> e = compile('1d6 + 2')
+        >>> 3 <= e() <= 8
+        True
+
+    Syntax errors are reported as by calculate(), and return None.
+    """
+    goal = parseTree('goal', dice_str)
+    if goal is None:
+        return None
+    return Expression(dice_str, *goal)
+
+
+# The parser yapps generates builds trees; parseTree() keeps it.
+parseTree = parse
+
+
+def parse(rule, text):
+    """Parse text by the given grammar rule, and return its value.
+
+    parse('goal', text) rolls the expression, as calculate() does, but
+    parses it afresh every time: a "set" goal assigns and returns its
+    value, and a u() goal returns (value, name). Use parseTree() for
+    the tree (or (goal, name, tree) triple) a rule builds instead.
+
+    Syntax errors are reported, and return None.
+    """
+    result = parseTree(rule, text)
+    if result is None:
+        return None
+    if rule == 'goal':
+        return Expression(text, *result)()
+    if rule in ('expr', 'factor', 'term'):
+        return evaluate(result, DiceCalculator.roller)
+    return result
+
+
+class ExpressionCache(object):
+    """A thread-safe LRU cache of compiled expressions, by source.
+
+    Holds at most size Expressions; the least recently used go first,
+    and with a ttl, entries older than ttl seconds are compiled anew.
+    A size of 0 turns the cache off. Strings that don't parse are not
+    kept, so their errors are reported every time.
+
+    A hit only stamps its entry with a use count; a full cache finds
+    the least recently used entry by its stamp when it evicts, which
+    only happens on a miss, beside the cost of a parse.
+    """
+    def __init__(self, size=EXPRESSION_CACHE_SIZE, ttl=EXPRESSION_CACHE_TTL):
+        """Initialize the ExpressionCache, empty.
+
+        @param size: The most Expressions to keep.
+        @type size: int
+
+        @param ttl: How long to keep each Expression, in seconds, or
+            None for as long as there's room.
+        @type ttl: float
+        """
+        self.size = size
+        self.ttl = ttl
+        # source -> [expression, expiry time or None, last use]
+        self._entries = {}
+        self._uses = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def compile(self, dice_str):
+        """Return the Expression for dice_str, compiling it on a miss.
+        """
+        with self._lock:
+            self._uses += 1
+            entry = self._entries.get(dice_str)
+            if entry is not None:
+                if entry[1] is None or entry[1] > time.time():
+                    entry[2] = self._uses
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[dice_str]
+                self.expirations += 1
+            self.misses += 1
+            keep = self.size > 0
+
+        # Parse outside the lock, so threads don't wait on each other.
+        expression = compile(dice_str)
+        if keep and expression is not None:
+            expires = None
+            if self.ttl is not None:
+                expires = time.time() + self.ttl
+            with self._lock:
+                self._entries[dice_str] = [expression, expires, self._uses]
+                self._trim()
+        return expression
+
+    def configure(self, size=None, ttl=False):
+        """Change the size (0 turns the cache off) or ttl at run time.
+        """
+        with self._lock:
+            if size is not None:
+                self.size = size
+            if ttl is not False:
+                self.ttl = ttl
+            self._trim()
+
+    def clear(self):
+        """Forget every Expression, and reset the stats.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self):
+        """Return a dict of the cache's size, length and counters.
+        """
+        with self._lock:
+            return {'size': self.size, 'ttl': self.ttl,
+                    'length': len(self._entries), 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions,
+                    'expirations': self.expirations}
+
+    def _trim(self):
+        entries = self._entries
+        excess = len(entries) - max(self.size, 0)
+        if excess <= 0:
+            return
+        if excess == 1:
+            oldest = [min(entries, key=lambda k: entries[k][2])]
+        else:
+            oldest = sorted(entries, key=lambda k: entries[k][2])[:excess]
+        for key in oldest:
+            del entries[key]
+        self.evictions += excess
+
+
+# The cache calculate() compiles through.
+cache = ExpressionCache()
+
+
+def calculate(dice_str, roller=None):
     """Parse the given dice expression, and return an immediate result.
+
+    Compiled expressions are kept in the module's ExpressionCache,
+    cache, so repeated strings are parsed only once.
+
+    @param roller: The Dice to roll with; defaults to dice.roller.
+        Pass e.g. CounterDice.at(k) to reproduce the k-th evaluation
+        of a run on its own.
+    """
+    expression = cache.compile(dice_str)
+    if expression is None:
+        return None
+    return expression(roller)
+
+
+def _elementwise(op, a, b):
+    """Apply op to a and b, element by element where they are sequences.
+    """
+    if numpy is not None:
+        if isinstance(a, list):
+            a = numpy.asarray(a)
+        if isinstance(b, list):
+            b = numpy.asarray(b)
+        # NumPy would divide by zero quietly; Python raises.
+        if op is operator.div and numpy.any(numpy.asarray(b) == 0):
+            raise ZeroDivisionError('division by zero in a sample')
+        return op(a, b)
+    if isinstance(a, list):
+        if isinstance(b, list):
+            return [op(x, y) for x, y in zip(a, b)]
+        return [op(x, b) for x in a]
+    elif isinstance(b, list):
+        return [op(a, y) for y in b]
+    return op(a, b)
+
+
+def _sampleBinary(op):
+    def sampleBinary(node, roller, n, V):
+        return _elementwise(op, _sample(node[1], roller, n, V),
+                            _sample(node[2], roller, n, V))
+    return sampleBinary
+
+
+def _sampleLet(node, roller, n, V):
+    name, value, body = node[1:]
+    return _sample(body, roller, n, [(name, _sample(value, roller, n, V))] + V)
+
+
+def _sampleKeep(node, roller, n, V):
+    kept = roller.roll_keep_batch(n, *node[1:])
+    if isinstance(kept, list):
+        return [sum(row) for row in kept]
+    return kept.sum(axis=1)
+
+
+def _sampleFuzz(node, roller, n, V):
+    values = _sample(node[1], roller, n, V)
+    if not isinstance(values, list) and getattr(values, 'shape', ()) == ():
+        values = [values] * n
+    return roller.fuzz_batch(values, node[2])
+
+
+# Node tag -> function(node, roller, n, V) returning n samples of the
+# node, as a sequence, or as a single number where every sample is the
+# same.
+_samplers = {
+    'num': lambda node, roller, n, V: node[1],
+    'var': lambda node, roller, n, V: lookup(V, node[1]),
+    'dice': lambda node, roller, n, V: roller.rollsum_batch(n, *node[1:]),
+    'keep': _sampleKeep,
+    'randint': lambda node, roller, n, V: roller.randint_batch(n, node[1],
+                                                               node[2]),
+    'uniform': lambda node, roller, n, V: roller.uniform_batch(n, node[1],
+                                                               node[2]),
+    'bellint': lambda node, roller, n, V: roller.rollbellInt_batch(
+        n, node[1], node[2]),
+    'bellfloat': lambda node, roller, n, V: roller.rollbell_batch(
+        n, node[1], node[2]),
+    'fuzz': _sampleFuzz,
+    '+': _sampleBinary(operator.add),
+    '-': _sampleBinary(operator.sub),
+    '*': _sampleBinary(operator.mul),
+    '/': _sampleBinary(operator.div),
+    'let': _sampleLet,
+    }
+
+
+def _sample(node, roller, n, V=[]):
+    return _samplers[node[0]](node, roller, n, V)
+
+
+def sample(dice_str, n, roller=None):
+    """Return n independent results of the given dice expression.
+
+    The expression is evaluated once, over whole arrays: each dice
+    term is rolled n times in a batch, and arithmetic works element by
+    element. Let variables hold one value per sample; global variables
+    are the same for all.
+
+        >>> s = sample('3d6 + [1 4]', 1000)
+        >>> len(s), 4 <= min(s), max(s) <= 22
+        (1000, True, True)
+
+    @param n: The number of samples.
+    @type n: int
+
+    @param roller: The Dice to roll with; defaults to dice.roller.
+
+    @return: A NumPy array of n results, or without NumPy, an
+        array.array; None if the expression doesn't parse. A u()
+        expression returns (results, name).
+    """
+    expression = cache.compile(dice_str)
+    if expression is None:
+        return None
+    if expression.goal == 'set':
+        raise ValueError("can't sample an assignment: %r" % (dice_str,))
+    if roller is None:
+        roller = DiceCalculator.roller
+    values = _sample(expression.tree, roller, n)
+    if numpy is not None:
+        if isinstance(values, list) or getattr(values, 'shape', ()) != ():
+            values = numpy.asarray(values)
+        else:
+            values = numpy.repeat(values, n)
+    else:
+        if not isinstance(values, list):
+            values = [values] * n
+        if [v for v in values if isinstance(v, float)]:
+            values = array('d', values)
+        else:
+            values = array('l', values)
+    if expression.goal == 'u':
+        return (values, expression.name)
+    return values
+
+
+def _freeVariables(node):
+    """Return the set of variable names a tree uses but doesn't bind.
+    """
+    tag = node[0]
+    if tag == 'var':
+        return frozenset([node[1]])
+    elif tag == 'let':
+        return (_freeVariables(node[2])
+                | (_freeVariables(node[3]) - frozenset([node[1]])))
+    names = frozenset()
+    for child in node[1:]:
+        if isinstance(child, tuple):
+            names |= _freeVariables(child)
+    return names
+
+
+def _uses(node, name):
+    """Return how many times a tree uses the named variable.
+    """
+    tag = node[0]
+    if tag == 'var':
+        return int(node[1] == name)
+    elif tag == 'let' and node[1] == name:
+        # The body's uses are of the new binding.
+        return _uses(node[2], name)
+    return sum([_uses(child, name) for child in node[1:]
+                if isinstance(child, tuple)])
+
+
+def _continuous(node, env, memo):
+    syntax = {'uniform': '{a b}', 'bellfloat': 'bell{a b}', 'fuzz': 'fuzz()'}
+    raise ValueError("%s terms are continuous, so have no exact distribution;"
+                     " use sample() to estimate one" % (syntax[node[0]],))
+
+
+def _exactBinary(op):
+    def exactBinary(node, env, memo):
+        left = _exact(node[1], env, memo)
+        right = _exact(node[2], env, memo)
+        if op is operator.div and right.weight(0):
+            raise ZeroDivisionError('division by a term that may be zero')
+        if op is operator.add:
+            return left + right
+        elif op is operator.sub:
+            return left - right
+        elif len(right) == 1:
+            constant = right.min()
+            return left.map(lambda v: op(v, constant))
+        return left.combine(right, op)
+    return exactBinary
+
+
+def _exactLet(node, env, memo):
+    name, value, body = node[1:]
+    value = _exact(value, env, memo)
+    env = dict(env)
+    if len(value) == 1 or _uses(body, name) <= 1:
+        # Used once, the variable is as good as an independent roll.
+        env[name] = value
+        return _exact(body, env, memo)
+    # Used more than once, its uses must agree: condition on its value.
+    branches = []
+    for v, weight in value.items():
+        env[name] = exact.constant(v)
+        branches.append((weight, _exact(body, env, memo)))
+    return exact.mixture(branches)
+
+
+def _exactVariable(node, env, memo):
+    if node[1] in env:
+        return env[node[1]]
+    return exact.constant(lookup([], node[1]))
+
+
+# Node tag -> function(node, env, memo) returning the node's distribution.
+_exacts = {
+    'num': lambda node, env, memo: exact.constant(node[1]),
+    'var': _exactVariable,
+    'dice': lambda node, env, memo: exact.rollsum(*node[1:]),
+    'keep': lambda node, env, memo: exact.keep(*node[1:]),
+    'randint': lambda node, env, memo: exact.randint(node[1], node[2]),
+    'bellint': lambda node, env, memo: exact.bellInt(node[1], node[2]),
+    'uniform': _continuous,
+    'bellfloat': _continuous,
+    'fuzz': _continuous,
+    '+': _exactBinary(operator.add),
+    '-': _exactBinary(operator.sub),
+    '*': _exactBinary(operator.mul),
+    '/': _exactBinary(operator.div),
+    'let': _exactLet,
+    }
+
+
+def _exact(node, env, memo):
+    """Return the distribution of a tree, memoized by the tree and the
+    distributions of the let variables it uses.
+    """
+    key = (node, tuple([(name, tuple(env[name].items()))
+                        for name in sorted(_freeVariables(node))
+                        if name in env]))
+    try:
+        return memo[key]
+    except KeyError:
+        result = memo[key] = _exacts[node[0]](node, env, memo)
+        return result
+
+
+_distributions = dice._LRUCache()
+
+
+def distribution(dice_str):
+    """Return the exact distribution of results of the dice expression.
+
+        >>> d = distribution('2d6+1d8-2')
+        >>> d.min(), d.max(), d.mean()
+        (1, 18, Fraction(19, 2))
+        >>> distribution('let x = 1d6 in x*x').pmf(36)
+        Fraction(1, 6)
+
+    Sums and differences of independent terms are convolved; a let
+    variable used more than once is conditioned on, so its uses agree.
+    Division is Python 2 division, flooring ints. Continuous terms
+    ({a b}, bell{a b} and fuzz()) have no exact distribution, and
+    raise ValueError; bell[a b] is counted from the bell curve's float
+    probabilities (see distribution.bellInt()), so is approximate.
+
+    Results (and the distributions of their parts) are memoized, along
+    with the values of the global variables they use.
+
+    @return: A distribution.Distribution, with pmf(), cdf() and so on;
+        None if the expression doesn't parse. A u() expression returns
+        (distribution, name).
     """
-    return parse('goal', dice_str)
+    expression = cache.compile(dice_str)
+    if expression is None:
+        return None
+    if expression.goal == 'set':
+        raise ValueError("can't count an assignment: %r" % (dice_str,))
+    tree = expression.tree
+    key = (tree, tuple([(name, globalvars.get(name))
+                        for name in sorted(_freeVariables(tree))]))
+    result = _distributions.get(key)
+    if result is None:
+        result = _exact(tree, {}, {})
+        _distributions.put(key, result, DISTRIBUTION_CACHE_SIZE)
+    if expression.goal == 'u':
+        return (result, expression.name)
+    return result
 
 
 class Dstr(object):
     """A class wrapper around a dice expression. 
 
-    Provides dice calculations on demand.
+    Provides dice calculations on demand. The expression is compiled
+    on first use, and the compiled form reused after that.
     """
-    __slots__ = ('_dstr', '__weakref__')
+    __slots__ = ('_dstr', '_compiled', '__weakref__')
 
     def __init__(self, dcalc_str=''):
         self._dstr = dcalc_str
+        self._compiled = None
 
     def __cmp__(self, other):
         return cmp(str(self), str(other))
@@ -161,17 +875,23 @@ class Dstr(object):
     def __repr__(self):
         return "<dstr %s>" % (str(self),)
 
-    def __call__(self):
-        return calculate(self._dstr)
+    def __call__(self, roller=None):
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self._compiled = compile(self._dstr)
+            if compiled is None:
+                return None
+        return compiled(roller)
 
     def __getstate__(self):
         return self._dstr
 
     def __setstate__(self, dstr):
         self._dstr = dstr
+        self._compiled = None
 
-    def calculate(self):
-        return self()
+    def calculate(self, roller=None):
+        return self(roller)
 
 
 if __name__=='__main__':
@@ -188,5 +908,7 @@ if __name__=='__main__':
         try: s = raw_input('>>> ')
         except EOFError: break
         if not strip(s): break
-        parse('goal', s)
+        result = calculate(s)
+        if result is not None:
+            print result
     print 'Bye.'
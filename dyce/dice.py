@@ -6,13 +6,33 @@ $Rev$\n
 $Date$
 """
 
+import copy
+import math
 import random
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import rng
+import sampling
 
 import logging
 logger = logging.getLogger('dice')
 
-__all__ = ['D10', 'Dice', 'DiceError', 'NotIntegerError', 
-           'OutOfRangeError', 'ParetoLowDice', 'parse', 'roller']
+__all__ = ['CounterDice', 'D10', 'Dice', 'DiceError', 'NotIntegerError', 
+           'OutOfRangeError', 'ParetoLowDice', 'Pool', 'Roller', 'SecureDice',
+           'parse', 'roller', 'setBackend', 'setThreadLocal']
 
 
 class DiceError(Exception): pass
@@ -24,6 +44,409 @@ class OutOfRangeError(DiceError): pass
 class NotIntegerError(DiceError): pass
 
 
+# The RNG backend (see the rng module) used by Dice by default.
+_default_backend = 'mt'
+
+# Sorted rolls of at least this many dice per side are made from face
+# counts (see Dice.roll_counts()), rather than rolled and sorted.
+_COUNTED_SORT_RATIO = 4
+
+# The number of 32-bit words drawn from a Dice to seed a NumPy batch.
+_NUMPY_SEED_WORDS = 8
+
+
+def _intArgs(*args):
+    """Coerce the given arguments to ints, or raise NotIntegerError.
+    """
+    try:
+        return tuple([int(a) for a in args])
+    except ValueError:
+        raise NotIntegerError('arguments must be coercable to ints.')
+
+
+class _LRUCache(object):
+    """A small, thread-safe cache, dropping the least recently used entries.
+
+    get() marks the entry it finds as used. peek() doesn't, and takes no
+    lock, so it is cheaper; a cache read only by peek() drops its
+    oldest-stored entries first.
+    """
+    __slots__ = ('_entries', '_lock')
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the value stored for key, or None."""
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self._entries[key] = value
+        return value
+
+    def peek(self, key):
+        """Return the value stored for key, or None, without marking it."""
+        return dict.get(self._entries, key)
+
+    def put(self, key, value, size):
+        """Store value for key, keeping at most size entries.
+
+        @return: value.
+        """
+        with self._lock:
+            entries = self._entries
+            entries.pop(key, None)
+            while entries and len(entries) >= size:
+                entries.pop(next(iter(entries)))
+            entries[key] = value
+        return value
+
+    def clear(self):
+        """Forget every entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+# The number of cached sum tables kept for Dice.rollsum(table=True).
+SUM_TABLE_CACHE_SIZE = 32
+
+# The longest sum table built with NumPy (one entry per possible sum).
+SUM_TABLE_MAX_TERMS = 1 << 20
+
+# Without NumPy, the most work (roughly dice times possible sums, over
+# two) spent building a sum table: about a fifth of a second.
+SUM_TABLE_MAX_WORK = 1000000
+
+# Above this many terms, convolve with NumPy's FFT instead of directly.
+_FFT_THRESHOLD = 4096
+
+_sum_tables = _LRUCache()
+
+
+def _convolve(a, b):
+    """Return the convolution of two probability arrays, with NumPy.
+    """
+    length = len(a) + len(b) - 1
+    if length <= _FFT_THRESHOLD:
+        return numpy.convolve(a, b)
+    size = 1 << (length - 1).bit_length()
+    fft = numpy.fft
+    result = fft.irfft(fft.rfft(a, size) * fft.rfft(b, size), size)[:length]
+    # Round-off can leave the far tails slightly negative.
+    return numpy.clip(result, 0.0, None)
+
+
+def _addDie(dist, sides):
+    """Return the distribution of a sum, with one more die added.
+
+    Each new probability is the mean of sides old ones, kept as a
+    running window sum, so adding a die costs one pass.
+    """
+    length = len(dist)
+    scale = 1.0 / sides
+    result = []
+    append = result.append
+    window = 0.0
+    for k in xrange(length + sides - 1):
+        if k < length:
+            window += dist[k]
+        if k >= sides:
+            window -= dist[k - sides]
+        append(max(window, 0.0) * scale)
+    return result
+
+
+def _sumTable(num, sides):
+    """Return the cumulative distribution of the sum of num dice of sides.
+
+    Entry i of the returned list is P(sum <= num + i). With NumPy, the
+    distribution is built by convolving a single die with itself
+    (squaring for each bit of num); without it, by adding one die at
+    a time. The most recently used tables are cached, so repeated
+    draws from the same dice cost one uniform variate and a binary
+    search, regardless of num.
+
+    Return None, and build nothing, when the table would be too big
+    or slow to build (see SUM_TABLE_MAX_TERMS and SUM_TABLE_MAX_WORK).
+    """
+    key = (num, sides)
+    table = _sum_tables.get(key)
+    if table is None:
+        terms = num * (sides - 1) + 1
+        if numpy is not None:
+            if terms > SUM_TABLE_MAX_TERMS:
+                return None
+            power = numpy.ones(sides) / sides
+            dist = None
+            n = num
+            while n:
+                if n & 1:
+                    dist = power if dist is None else _convolve(dist, power)
+                n >>= 1
+                if n:
+                    power = _convolve(power, power)
+            cumulative = numpy.cumsum(dist)
+            table = (cumulative / cumulative[-1]).tolist()
+        else:
+            if num * terms // 2 > SUM_TABLE_MAX_WORK:
+                return None
+            dist = [1.0]
+            for i in xrange(num):
+                dist = _addDie(dist, sides)
+            table = []
+            total = 0.0
+            for p in dist:
+                total += p
+                table.append(total)
+            # Normalize away accumulated round-off, so the last entry is 1.
+            table = [t / total for t in table]
+        _sum_tables.put(key, table, SUM_TABLE_CACHE_SIZE)
+    return table
+
+
+# The number of Pareto bucket tables kept by ParetoLowDice.
+PARETO_TABLE_CACHE_SIZE = 32
+
+_pareto_tables = _LRUCache()
+
+# The number of discrete bell-curve tables kept by rollbellInt().
+BELL_TABLE_CACHE_SIZE = 32
+
+# The widest range of ints rolled from a bell-curve table; wider ranges
+# round a float bell roll instead, without building a table.
+BELL_TABLE_MAX_TERMS = 1 << 16
+
+_bell_tables = _LRUCache()
+
+# Above this dist_ratio, truncated bell rolls draw gaussians and reject
+# those out of range; below it, they draw uniformly and thin the draws.
+_BELL_GAUSS_RATIO = 2.5
+
+# Buffers are filled this many items at a time, to bound scratch space.
+_FILL_CHUNK = 1 << 16
+
+
+def _numpyView(buffer, format=None):
+    """Return a writable, flat NumPy array sharing memory with buffer.
+    """
+    if isinstance(buffer, numpy.ndarray) and format is None:
+        if not buffer.flags.c_contiguous:
+            raise ValueError('buffer must be contiguous')
+        view = buffer.reshape(-1)
+    else:
+        if format is None:
+            format = _bufferFormat(buffer)
+        view = numpy.frombuffer(buffer, dtype=numpy.dtype(format))
+    if not view.flags.writeable:
+        raise TypeError('buffer is read-only')
+    return view
+
+
+def _bufferFormat(buffer):
+    """Return the struct format of buffer's items ('B' if untyped).
+    """
+    if isinstance(buffer, array):
+        return buffer.typecode
+    try:
+        return memoryview(buffer).format
+    except TypeError:
+        return 'B'
+
+
+def _checkFits(low, high, format):
+    """Raise OutOfRangeError unless ints low..high fit items of format.
+
+    format is a struct (or NumPy type) code; float items always fit.
+    """
+    code = format[-1:]
+    if code not in 'bBhHiIlLqQ':
+        return
+    bits = 8 * struct.calcsize(format)
+    if code.islower():
+        least, most = -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+    else:
+        least, most = 0, (1 << bits) - 1
+    if not (least <= low and high <= most):
+        raise OutOfRangeError('results from %s to %s out of range; %r items '
+                              'hold %s to %s' % (low, high, format,
+                                                 least, most))
+
+
+def _bufferWriter(buffer, format=None):
+    """Return (count, write) for filling buffer without NumPy.
+
+    write(start, values) stores a list of ints at item index start.
+    """
+    if isinstance(buffer, array) and format in (None, buffer.typecode):
+        typecode = buffer.typecode
+
+        def write(start, values):
+            buffer[start:start+len(values)] = array(typecode, values)
+        return len(buffer), write
+
+    if format is None:
+        format = _bufferFormat(buffer)
+    itemsize = struct.calcsize(format)
+    try:
+        view = memoryview(buffer)
+    except TypeError:
+        # An old-style buffer, such as an mmap: assign bytes by slice.
+        view = buffer
+        nbytes = len(buffer)
+    else:
+        if view.readonly:
+            raise TypeError('buffer is read-only')
+        if hasattr(view, 'cast'):
+            view = view.cast('B')
+        elif view.itemsize != 1:
+            raise TypeError('filling typed buffers on this Python needs NumPy')
+        # Either way the view now has one-byte items.
+        nbytes = len(view)
+
+    def write(start, values):
+        offset = start * itemsize
+        data = struct.pack('%d%s' % (len(values), format), *values)
+        view[offset:offset+len(data)] = data
+    return nbytes // itemsize, write
+
+
+def _paretoTable(length, alpha):
+    """Return the bucket table for Pareto rolls over length values.
+
+    ParetoLowDice spreads a range over the Pareto distribution between
+    1 and 2, cutting it into length equal sections and clamping draws
+    past the last cut to the last value. Rather than compare the draw
+    against each cut in turn, the cuts are mapped back through the
+    inverse of paretovariate() onto the uniform draw behind it: value i
+    is picked when u falls at or below entry i of the returned list
+    (and past every entry, the last value), which bisect finds in
+    O(log length) time.
+    """
+    key = (length, alpha)
+    table = _pareto_tables.get(key)
+    if table is None:
+        portion = 1.0/length
+        table = []
+        section = 1.0 + portion
+        for i in xrange(length - 1):
+            table.append(1.0 - section ** -alpha)
+            section += portion
+        _pareto_tables.put(key, table, PARETO_TABLE_CACHE_SIZE)
+    return table
+
+
+def _bellWeights(min_num, max_num, dist_ratio, truncate):
+    """Return the probabilities of integer bell rolls from min_num to max_num.
+
+    Each integer gets the probability that the gaussian rollbell()
+    draws rounds to it. Without truncate, the tails beyond the ends
+    are clamped, so go to the ends. With it, the gaussian is cut off
+    at the ends themselves, just as rollbell() cuts it, and the
+    weights sum to less than 1.
+    """
+    mean = (min_num + max_num) / 2.0
+    sdev = (max_num - min_num) / float(dist_ratio)
+    scale = sdev * math.sqrt(2.0)
+    cuts = [0.5 * math.erfc((mean - k - 0.5) / scale)
+            for k in xrange(min_num, max_num)]
+    if truncate:
+        low = 0.5 * math.erfc((mean - min_num) / scale)
+        high = 0.5 * math.erfc((mean - max_num) / scale)
+    else:
+        low, high = 0.0, 1.0
+    cuts = [low] + cuts + [high]
+    return [b - a for a, b in zip(cuts, cuts[1:])]
+
+
+def _useBellTable(min_num, max_num):
+    """Should integer bell rolls from min_num to max_num use a table?
+    """
+    return (isinstance(min_num, (int, long))
+            and isinstance(max_num, (int, long))
+            and 0 < max_num - min_num < BELL_TABLE_MAX_TERMS)
+
+
+def _bellTable(min_num, max_num, dist_ratio, truncate):
+    """Return the alias table for integer bell rolls from min_num to max_num.
+
+    See _bellWeights(); truncated weights are scaled up to sum to 1.
+    """
+    key = (min_num, max_num, dist_ratio, truncate)
+    # Hits are checked with a plain lookup, which is much cheaper than
+    # moving the entry to the end; the cache evicts oldest-built first.
+    table = _bell_tables.peek(key)
+    if table is None:
+        weights = _bellWeights(min_num, max_num, dist_ratio, truncate)
+        table = _bell_tables.put(key, sampling.aliasTable(weights),
+                                 BELL_TABLE_CACHE_SIZE)
+    return table
+
+
+def _truncatedGauss(rand, mean, sdev, low, high):
+    """Return a gaussian variate conditioned to fall in [low, high].
+    """
+    if not (sdev > 0) or low >= high:
+        return min(max(mean, low), high)
+    if (high - low) / sdev > _BELL_GAUSS_RATIO:
+        gauss = rand.gauss
+        while True:
+            x = gauss(mean, sdev)
+            if low <= x <= high:
+                return x
+    random = rand.random
+    width = high - low
+    scale = -0.5 / (sdev * sdev)
+    while True:
+        x = low + width * random()
+        if random() <= math.exp(scale * (x - mean) ** 2):
+            return x
+
+
+def setBackend(backend):
+    """Set the default RNG backend, for new Dice and for the module roller.
+
+    The roller keeps its place in the world: its new generator is
+    seeded from its initial state, so it stays reproducible.
+
+    @param backend: A backend name registered in the rng module
+        (e.g. 'mt', 'pcg32', 'xorshift'), or a random.Random
+        subclass.
+    """
+    global _default_backend
+    rng.getBackend(backend)
+    _default_backend = backend
+    roller.setBackend(backend)
+
+
+def setThreadLocal(enabled=True, seed=None):
+    """Give each thread its own generator for the module roller, or stop.
+
+    See Roller.threadLocal(). Everything that rolls with the module
+    roller, including dcalc, follows along.
+
+    @param enabled: Switch thread-local rolling on, or back off.
+    @type enabled: bool
+
+    @param seed: The root seed the threads' seeds are derived from.
+    """
+    if enabled:
+        roller.threadLocal(seed)
+    else:
+        roller.share()
+
+
+def _stateSeed(state, cls=random.Random):
+    """Derive a 128-bit seed from a generator state of the given class.
+    """
+    source = cls()
+    source.setstate(state)
+    return source.getrandbits(128)
+
+
 def parse(d):
     """Parse a dice specifier string.  Return a dice specifier tuple.
 
@@ -95,20 +518,144 @@ class Dice(object):
         >>> d2 = Dice(state=d.init_state)
         >>> r2 = d.roll(2, 6)
         >>> r == r2
+
+    Dice made from a seed (including default Dice, which get a fresh
+    seed from the operating system) are compact: they keep just the
+    seed, make their generator on first use, and reset() by reseeding
+    it. Only Dice made from a state keep a copy of that state.
     """
-    def __init__(self, state=random.getstate()):
-        """Initialize the Dice, with optional state.
+    __slots__ = ('_cheat_next', '_spawned', '_seed', 'backend', '_rand',
+                 '_init_state', '__weakref__')
 
-        @param state: A state object, as returned by random.getstate()
+    def __init__(self, state=None, backend=None, seed=None):
+        """Initialize the Dice, with optional state or seed, and RNG backend.
 
-        @type state: A 3-tuple. state[0] is the version number;
-            state[1] is a 625-tuple containing ints; state[2] is None.
-        """
-        self.init_state = state
-        self.rand = random.Random()
-        self.rand.setstate(state)
+        With neither state nor seed, the Dice is seeded from the
+        operating system's entropy source, so no two default Dice share
+        a stream.
+
+        @param state: A state object, as returned by random.getstate(),
+            or by the backend's getstate(). A Mersenne Twister state
+            given to another backend seeds that backend instead.
+
+        @type state: For the default backend, a 3-tuple. state[0] is
+            the version number; state[1] is a 625-tuple containing
+            ints; state[2] is None.
+
+        @param backend: The RNG backend: a name registered in the rng
+            module, or a random.Random subclass. Defaults to the
+            module default (see setBackend()), normally 'mt'.
 
+        @param seed: A seed for the generator, used when no state is
+            given. Any seed the backend accepts; ints are best.
+        """
         self._cheat_next = []
+        self._spawned = 0
+        if state is not None:
+            seed = None
+        elif seed is None:
+            seed = rng.entropySeed()
+        self._seed = seed
+        self._setup(state, backend)
+
+    def __getstate__(self):
+        state = {}
+        for cls in self.__class__.__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if name != '__weakref__' and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
+    def _setup(self, state, backend, source=random.Random):
+        """Install a generator for backend, set from (or seeded by) state.
+
+        Without a state, the generator is left to be made from the
+        seed on first use.
+        """
+        if backend is None:
+            backend = _default_backend
+        cls = rng.getBackend(backend)
+        self.backend = backend
+        self._rand = None
+        self._init_state = None
+        if state is not None:
+            rand = cls()
+            try:
+                rand.setstate(state)
+            except (TypeError, ValueError):
+                rand.seed(_stateSeed(state, source))
+            self._rand = rand
+            self._init_state = rand.getstate()
+
+    def _getRand(self):
+        rand = self._rand
+        if rand is None:
+            rand = self._rand = rng.getBackend(self.backend)(self._seed)
+        return rand
+
+    def _setRand(self, rand):
+        self._rand = rand
+
+    rand = property(_getRand, _setRand, doc="""The random generator.""")
+
+    def _getInitState(self):
+        if self._init_state is not None:
+            return self._init_state
+        return rng.getBackend(self.backend)(self._seed).getstate()
+
+    init_state = property(_getInitState, doc="""The initial generator state.
+
+        For a compact (seeded) Dice, this is worked out on demand.
+        """)
+
+    def setBackend(self, backend):
+        """Switch this Dice to another RNG backend.
+
+        The new generator is seeded from this Dice's seed or initial
+        state, and starts from there.
+        """
+        if self._seed is not None:
+            self._setup(None, backend)
+        else:
+            self._setup(self.init_state, backend, self.rand.__class__)
+
+    def spawn(self, n):
+        """Return n new Dice with independent streams, derived from this one.
+
+        Children are seeded by hashing this Dice's seed (or initial
+        state) with a running child count, so they depend only on how
+        this Dice was made and how many children it has spawned, not
+        on what it has rolled. The same parent spawns the same
+        children, which makes it easy to fan reproducible work out to
+        threads or processes; reset() starts the count over.
+
+            >>> a = [k.roll(3) for k in Dice(seed=42).spawn(2)]
+            >>> b = [k.roll(3) for k in Dice(seed=42).spawn(2)]
+            >>> a == b
+            True
+
+        @param n: The number of children.
+        @type n: int
+
+        @return: A list of n Dice of the same class and backend.
+        """
+        parent = self._seed
+        if parent is None:
+            parent = _stateSeed(self.init_state, self.rand.__class__)
+        children = []
+        for i in xrange(int(n)):
+            child = copy.copy(self)
+            child._cheat_next = []
+            child._spawned = 0
+            child._seed = rng.deriveSeed(parent, self._spawned)
+            child._setup(None, self.backend)
+            self._spawned += 1
+            children.append(child)
+        return children
 
     def roll(self, num=1, sides=6, mod=0, sort=False):
         """Return a list of num random ints between 1 and sides, each += mod.
@@ -143,16 +690,142 @@ class Dice(object):
             raise OutOfRangeError('number of dice out of range; must be >= 0')
         if not (sides > 0):
             raise OutOfRangeError('number of sides out of range; must be >= 0')
-        results = []
-        for i in range(num):
-            results.append(self.rand.randrange(1, sides+1)+mod)
+        if sort and num >= _COUNTED_SORT_RATIO * sides:
+            # Cheaper to count each face and lay them out in order.
+            results = []
+            face = mod
+            for count in sampling.multinomialCounts(self.rand, num, sides):
+                face += 1
+                if count:
+                    results.extend([face] * count)
+            return results
+        results = sampling.boundedInts(self.rand, num, sides, mod+1)
         if sort:
             results.sort()
         return results
 
-    def rollsum(self, num=1, sides=6, each_mod=0, total_mod=0):
+    def roll_counts(self, num=1, sides=6):
+        """Return how many of num dice of the given sides came up on each face.
+
+        The counts are sampled directly (a multinomial draw), without
+        rolling each die, in O(sides) time no matter how large num is.
+
+            >>> counts = Dice().roll_counts(10**9, 6)
+            >>> len(counts), sum(counts)
+            (6, 1000000000)
+
+        @param num: The number of dice.
+        @type num: int
+
+        @param sides: The number of sides per dice.
+        @type sides: int
+
+        @return: A list of sides counts: the number of 1s, of 2s, etc.
+        """
+        num, sides = _intArgs(num, sides)
+        if not (num >= 0):
+            raise OutOfRangeError('number of dice out of range; must be >= 0')
+        if not (sides >= 0):
+            raise OutOfRangeError('number of sides out of range; must be >= 0')
+        if sides == 0:
+            return []
+        return sampling.multinomialCounts(self.rand, num, sides)
+
+    def roll_pool(self, num, sides=10, target=6, explode=None, double=None,
+                  botch=0):
+        """Roll a pool of dice, counting successes.
+
+        Each die showing target or better is a success; each showing
+        double or better counts twice; each showing botch or worse
+        takes a success away. Each die showing explode or better is
+        rolled again, and the new die counts too (and may explode in
+        turn).
+
+        Only face counts are drawn, never single dice. Each explosion
+        chain ends in exactly one non-exploding face, so the num
+        original dice give num non-exploding faces between them. The
+        chains add up to a number of exploding faces found by a few
+        binomial draws, one per round of re-rolls, and each group is
+        spread over its faces by a multinomial draw. So a pool of a
+        million dice costs no more than a pool of ten.
+
+            >>> pool = Dice().roll_pool(10**6, 10, 6, explode=10)
+            >>> sum(pool.counts) == 10**6 + pool.rerolled
+            True
+
+        @param num: The number of dice in the pool.
+        @type num: int
+
+        @param sides: The number of sides per dice.
+        @type sides: int
+
+        @param target: The lowest face that counts as a success.
+        @type target: int
+
+        @param explode: The lowest face that is rolled again, or None.
+        @type explode: int
+
+        @param double: The lowest face that counts as two successes,
+            or None.
+        @type double: int
+
+        @param botch: The highest face that cancels a success, or 0.
+        @type botch: int
+
+        @return: a Pool.
+        """
+        num, sides, target, botch = _intArgs(num, sides, target, botch)
+        if not (num >= 0):
+            raise OutOfRangeError('number of dice out of range; must be >= 0')
+        if not (sides >= 1):
+            raise OutOfRangeError('number of sides out of range; must be > 0')
+        rand = self.rand
+        rerolled = 0
+        _cn = self._cheat_next
+        if _cn:
+            # A cheated pool lists every die, re-rolls included.
+            rolls = _cn.pop()
+            counts = [0] * sides
+            for face in rolls:
+                if not (1 <= face <= sides):
+                    raise OutOfRangeError('cheated face out of range; '
+                                          'must be in 1..sides')
+                counts[face-1] += 1
+            rerolled = max(len(rolls) - num, 0)
+        elif explode is None:
+            counts = sampling.multinomialCounts(rand, num, sides)
+        else:
+            explode, = _intArgs(explode)
+            if not (1 < explode <= sides):
+                raise OutOfRangeError('explode out of range; must be in 2..sides')
+            p = (sides - explode + 1.0) / sides
+            chained = num
+            while chained:
+                chained = sampling.binomial(rand, chained, p)
+                rerolled += chained
+            counts = (sampling.multinomialCounts(rand, num, explode - 1)
+                      + sampling.multinomialCounts(rand, rerolled,
+                                                   sides - explode + 1))
+
+        successes = sum(counts[max(target, 1)-1:]) - sum(counts[:max(botch, 0)])
+        if double is not None:
+            successes += sum(counts[max(double, 1)-1:])
+        return Pool(counts, successes, target, rerolled)
+
+    def rollsum(self, num=1, sides=6, each_mod=0, total_mod=0, table=False):
         """Return the sum of num rolls of sides-sided dice, with modifiers.
 
+        With table=True, the sum is drawn directly from the cached
+        distribution of num dice, rather than by rolling each die. The
+        first draw for a given num and sides builds the table; every
+        later draw costs a single uniform variate and a binary search,
+        no matter how many dice are summed. Each sum is drawn with its
+        true probability, to the precision of a float. Use this for
+        large piles of dice (e.g. 10000d100) rolled many times. Dice
+        whose table would be too big to build on the spot (see
+        SUM_TABLE_MAX_TERMS and SUM_TABLE_MAX_WORK) are rolled one by
+        one instead.
+
         @param num: The number of dice.
         @type num: int
         
@@ -165,21 +838,421 @@ class Dice(object):
         @param total_mod: The modifier to add to the total.
         @type total_mod: int
 
+        @param table: Draw the sum from a cached distribution table?
+        @type table: bool
+
         @return: The sum total of all results, plus modifiers.
         """
         try:
             total_mod = int(total_mod)
         except ValueError:
             raise NotIntegerError('arguments must be coercable to ints.')
+        if table and not self._cheat_next:
+            num, sides, each_mod = _intArgs(num, sides, each_mod)
+            if num > 0 and sides > 0:
+                cdf = _sumTable(num, sides)
+                if cdf is not None:
+                    i = min(bisect_right(cdf, self.rand.random()),
+                            len(cdf) - 1)
+                    return num + i + num*each_mod + total_mod
         results = self.roll(num, sides, each_mod)
         return sum(results) + total_mod
 
-    def rollbell(self, min_num, max_num, dist_ratio=2.0):
+    def roll_batch(self, trials, num=1, sides=6, mod=0, sort=False):
+        """Roll num dice of the given sides, trials times over.
+
+        With NumPy installed, return a (trials, num) integer array;
+        otherwise return a list of trials lists. Either way, the
+        results are drawn from this Dice's generator, so a Dice
+        restored to the same state yields the same batch.
+
+            >>> d = Dice(state=random.getstate())
+            >>> len(d.roll_batch(1000, 3, 6))
+            1000
+
+        @param trials: The number of trials (rows) to roll.
+        @type trials: int
+
+        @param num: The number of dice per trial.
+        @type num: int
+
+        @param sides: The number of sides per dice.
+        @type sides: int
+
+        @param mod: The modifier to add to *each* roll.
+        @type mod: int
+
+        @param sort: Should each trial be sorted by value?
+        @type sort: bool
+
+        @return: A 2-D array (or list of lists) of results.
+        """
+        trials, num, sides, mod = _intArgs(trials, num, sides, mod)
+        if not (trials >= 0):
+            raise OutOfRangeError('number of trials out of range; must be >= 0')
+        if num == 0 or sides == 0:
+            # Like roll(), a null roll is a single 0 per trial.
+            num, sides, mod = 1, 1, -1
+        if not (num > 0):
+            raise OutOfRangeError('number of dice out of range; must be >= 0')
+        if not (sides > 0):
+            raise OutOfRangeError('number of sides out of range; must be >= 0')
+
+        state = self._numpyState()
+        if state is not None:
+            results = state.randint(1, sides+1, size=(trials, num))
+            if mod:
+                results += mod
+            if sort:
+                results.sort(axis=1)
+            return results
+
+        faces = sampling.boundedInts(self.rand, trials*num, sides, mod+1)
+        results = []
+        for i in xrange(0, trials*num, num):
+            row = faces[i:i+num]
+            if sort:
+                row.sort()
+            results.append(row)
+        return results
+
+    def roll_keep(self, num=1, sides=6, keep=1, highest=True, mod=0):
+        """Roll num dice and keep the keep highest (or lowest) of them.
+
+        E.g. roll_keep(4, 6, 3) is "4d6, drop the lowest", and
+        roll_keep(2, 20, 1) is a roll with advantage. Big rolls of
+        small dice pick the kept dice from sampled face counts (see
+        roll_counts()), without rolling each die.
+
+            >>> kept = Dice().roll_keep(4, 6, 3)
+            >>> len(kept), kept == sorted(kept)
+            (3, True)
+
+        @param num: The number of dice.
+        @type num: int
+
+        @param sides: The number of sides per dice.
+        @type sides: int
+
+        @param keep: The number of dice to keep, at most num.
+        @type keep: int
+
+        @param highest: Keep the highest dice? Otherwise, the lowest.
+        @type highest: bool
+
+        @param mod: The modifier to add to *each* roll.
+        @type mod: int
+
+        @return: A sorted list of the keep dice kept.
+        """
+        num, sides, keep, mod = _intArgs(num, sides, keep, mod)
+        if not (num > 0):
+            raise OutOfRangeError('number of dice out of range; must be > 0')
+        if not (sides > 0):
+            raise OutOfRangeError('number of sides out of range; must be > 0')
+        if not (0 <= keep <= num):
+            raise OutOfRangeError('number of dice kept out of range; '
+                                  'must be in 0..num')
+
+        _cn = self._cheat_next
+        if _cn:
+            results = sorted(_cn.pop())
+            if highest:
+                return results[len(results)-keep:]
+            return results[:keep]
+
+        if num >= _COUNTED_SORT_RATIO * sides:
+            counts = sampling.multinomialCounts(self.rand, num, sides)
+            faces = xrange(sides, 0, -1) if highest else xrange(1, sides+1)
+            kept = []
+            needed = keep
+            for face in faces:
+                if not needed:
+                    break
+                count = min(counts[face-1], needed)
+                kept.extend([face + mod] * count)
+                needed -= count
+            kept.sort()
+            return kept
+
+        results = sampling.boundedInts(self.rand, num, sides, mod+1)
+        results.sort()
+        if highest:
+            return results[num-keep:]
+        return results[:keep]
+
+    def roll_keep_batch(self, trials, num=1, sides=6, keep=1, highest=True,
+                        mod=0):
+        """Roll num dice and keep the keep highest (or lowest), trials times.
+
+        With NumPy installed, the kept dice are picked from each row by
+        partial selection (numpy.partition), in linear time, and only
+        they are sorted; the result is a (trials, keep) integer array.
+        Otherwise, return a list of trials sorted lists.
+
+        @param trials: The number of trials (rows) to roll.
+        @type trials: int
+
+        @return: A 2-D array (or list of lists) of the kept dice.
+        """
+        trials, num, sides, keep, mod = _intArgs(trials, num, sides, keep, mod)
+        if not (trials >= 0):
+            raise OutOfRangeError('number of trials out of range; must be >= 0')
+        if not (num > 0):
+            raise OutOfRangeError('number of dice out of range; must be > 0')
+        if not (sides > 0):
+            raise OutOfRangeError('number of sides out of range; must be > 0')
+        if not (0 <= keep <= num):
+            raise OutOfRangeError('number of dice kept out of range; '
+                                  'must be in 0..num')
+
+        state = self._numpyState()
+        if state is not None:
+            faces = state.randint(1, sides+1, size=(trials, num))
+            if highest:
+                if 0 < keep < num:
+                    faces.partition(num - keep, axis=1)
+                kept = faces[:, num-keep:]
+            else:
+                if 0 < keep < num:
+                    faces.partition(keep - 1, axis=1)
+                kept = faces[:, :keep]
+            kept = numpy.sort(kept, axis=1)
+            if mod:
+                kept += mod
+            return kept
+
+        faces = sampling.boundedInts(self.rand, trials*num, sides, mod+1)
+        results = []
+        for i in xrange(0, trials*num, num):
+            row = faces[i:i+num]
+            row.sort()
+            results.append(row[num-keep:] if highest else row[:keep])
+        return results
+
+    def rollsum_batch(self, trials, num=1, sides=6, each_mod=0, total_mod=0):
+        """Return trials sums of num rolls of sides-sided dice, with modifiers.
+
+        With NumPy installed, return a 1-D integer array of length
+        trials; otherwise return a list.
+
+        @param trials: The number of sums to roll.
+        @type trials: int
+
+        @param num: The number of dice.
+        @type num: int
+
+        @param sides: The number of sides per dice.
+        @type sides: int
+
+        @param each_mod: The modifier to add to *each* roll.
+        @type each_mod: int
+
+        @param total_mod: The modifier to add to the total.
+        @type total_mod: int
+
+        @return: The sum totals of each trial, plus modifiers.
+        """
+        (total_mod,) = _intArgs(total_mod)
+        results = self.roll_batch(trials, num, sides, each_mod)
+        if not isinstance(results, list):
+            sums = results.sum(axis=1)
+            if total_mod:
+                sums += total_mod
+            return sums
+        return [sum(row) + total_mod for row in results]
+
+    def roll_into(self, buffer, sides=6, mod=0, format=None):
+        """Fill a writable buffer with rolls of sides-sided dice, in place.
+
+        buffer may be anything with a writable buffer: a NumPy array,
+        an array.array, a bytearray, an mmap, etc. One die is rolled
+        per item. With NumPy installed, the buffer is filled through a
+        view of its memory, so no Python object is made per die;
+        otherwise, rolls are packed into it a chunk at a time. Either
+        way, no copy of the whole result is ever made.
+
+            >>> from array import array
+            >>> a = array('i', [0] * 1000)
+            >>> Dice().roll_into(a, 20)
+            1000
+            >>> 1 <= min(a) and max(a) <= 20
+            True
+
+        @param buffer: The writable buffer to fill.
+
+        @param sides: The number of sides per dice.
+        @type sides: int
+
+        @param mod: The modifier to add to *each* roll.
+        @type mod: int
+
+        @param format: The struct format of the buffer's items, for
+            untyped buffers such as mmaps and bytearrays (which
+            otherwise hold one unsigned byte per die).
+        @type format: str
+
+        @return: The number of items filled.
+
+        @raise OutOfRangeError: if some possible roll doesn't fit the
+            buffer's items; nothing is written then.
+        """
+        sides, mod = _intArgs(sides, mod)
+        if not (sides > 0):
+            raise OutOfRangeError('number of sides out of range; must be > 0')
+
+        if numpy is not None:
+            view = _numpyView(buffer, format)
+            _checkFits(1 + mod, sides + mod, view.dtype.char)
+            count = len(view)
+            state = self._numpyState()
+            for start in xrange(0, count, _FILL_CHUNK):
+                chunk = view[start:start+_FILL_CHUNK]
+                if state is None:
+                    chunk[:] = sampling.boundedInts(self.rand, len(chunk),
+                                                    sides, mod+1)
+                else:
+                    chunk[:] = state.randint(1, sides+1, size=len(chunk)) + mod
+            return count
+
+        _checkFits(1 + mod, sides + mod, format or _bufferFormat(buffer))
+        count, write = _bufferWriter(buffer, format)
+        for start in xrange(0, count, _FILL_CHUNK):
+            n = min(_FILL_CHUNK, count - start)
+            write(start, sampling.boundedInts(self.rand, n, sides, mod+1))
+        return count
+
+    def rollsum_into(self, buffer, num=1, sides=6, each_mod=0, total_mod=0,
+                     format=None):
+        """Fill a writable buffer with sums of num dice, in place.
+
+        Like roll_into(), but each item holds a whole rollsum().
+
+        @param buffer: The writable buffer to fill.
+
+        @param num: The number of dice per sum.
+        @type num: int
+
+        @param sides: The number of sides per dice.
+        @type sides: int
+
+        @param each_mod: The modifier to add to *each* roll.
+        @type each_mod: int
+
+        @param total_mod: The modifier to add to each total.
+        @type total_mod: int
+
+        @param format: The struct format of the buffer's items, for
+            untyped buffers.
+        @type format: str
+
+        @return: The number of items filled.
+        """
+        num, sides, each_mod, total_mod = _intArgs(num, sides, each_mod,
+                                                   total_mod)
+        if not (num > 0):
+            raise OutOfRangeError('number of dice out of range; must be > 0')
+        if not (sides > 0):
+            raise OutOfRangeError('number of sides out of range; must be > 0')
+        mod = num*each_mod + total_mod
+
+        if numpy is not None:
+            view = _numpyView(buffer, format)
+            _checkFits(num + mod, num*sides + mod, view.dtype.char)
+            count = len(view)
+            state = self._numpyState()
+            rows = max(1, _FILL_CHUNK // num)
+            for start in xrange(0, count, rows):
+                chunk = view[start:start+rows]
+                if state is None:
+                    faces = numpy.array(sampling.boundedInts(
+                        self.rand, len(chunk)*num, sides, 1))
+                    faces.shape = (len(chunk), num)
+                else:
+                    faces = state.randint(1, sides+1, size=(len(chunk), num))
+                chunk[:] = faces.sum(axis=1) + mod
+            return count
+
+        _checkFits(num + mod, num*sides + mod,
+                   format or _bufferFormat(buffer))
+        count, write = _bufferWriter(buffer, format)
+        rand = self.rand
+        rows = max(1, _FILL_CHUNK // num)
+        for start in xrange(0, count, rows):
+            n = min(rows, count - start)
+            faces = sampling.boundedInts(rand, n*num, sides, 1)
+            write(start, [sum(faces[i:i+num]) + mod
+                          for i in xrange(0, n*num, num)])
+        return count
+
+    def _numpyState(self):
+        """Return a NumPy RandomState seeded from this Dice's generator.
+
+        Seeding consumes bits from self.rand, so batches stay
+        reproducible from the Dice's state and successive batches
+        differ. Return None (and draw batches from self.rand itself)
+        without NumPy.
+        """
+        if numpy is None:
+            return None
+        seed = [self.rand.getrandbits(32) for i in xrange(_NUMPY_SEED_WORDS)]
+        return numpy.random.RandomState(seed)
+
+    def randint(self, a, b):
+        """Return a random int N such that a <= N <= b.
+
+        Draws with the same unbiased sampler as randint_batch().
+        """
+        a, b = _intArgs(a, b)
+        if not (a <= b):
+            raise OutOfRangeError('empty range; must have a <= b')
+        return sampling.boundedInts(self.rand, 1, b - a + 1, a)[0]
+
+    def randint_batch(self, trials, a, b):
+        """Return a sequence of trials randint(a, b) results.
+
+        With NumPy, the result is an int array drawn in bulk.
+        """
+        trials, a, b = _intArgs(trials, a, b)
+        if not (trials >= 0):
+            raise OutOfRangeError('number of trials out of range; must be >= 0')
+        if not (a <= b):
+            raise OutOfRangeError('empty range; must have a <= b')
+        state = self._numpyState()
+        if state is not None:
+            return state.randint(a, b+1, size=trials)
+        return sampling.boundedInts(self.rand, trials, b - a + 1, a)
+
+    def uniform(self, a, b):
+        """Return a random float N such that a <= N <= b.
+        """
+        return self.rand.uniform(a, b)
+
+    def uniform_batch(self, trials, a, b):
+        """Return a sequence of trials uniform(a, b) results.
+
+        With NumPy, the result is a float array drawn in bulk.
+        """
+        trials, = _intArgs(trials)
+        if not (trials >= 0):
+            raise OutOfRangeError('number of trials out of range; must be >= 0')
+        state = self._numpyState()
+        if state is not None:
+            return state.uniform(a, b, trials)
+        uniform = self.rand.uniform
+        return [uniform(a, b) for i in xrange(trials)]
+
+    def rollbell(self, min_num, max_num, dist_ratio=2.0, truncate=False):
         """Roll bell-shaped dice.
 
         Return a result between min_num and max_num, on the gaussian
         (or bell-shaped) distribution.
 
+        By default, results beyond either end are clamped to it, so
+        the ends are more likely than their neighbors. With
+        truncate=True, results follow the bell curve cut off at the
+        ends (a truncated normal distribution) instead.
+
         @param min_num: The minimum value.
         @type min_num: number
 
@@ -190,18 +1263,66 @@ class Dice(object):
             which yields a nice bell shape.
         @type dist_ratio: number
 
+        @param truncate: Whether to truncate, rather than clamp.
+        @type truncate: bool
+
         @return: a value between min_num and max_num.
         """
         mean_distance = (max_num - min_num) / 2.0
         mean = max_num - mean_distance
         sdev = abs(max_num - min_num) / dist_ratio
+        if truncate:
+            return _truncatedGauss(self.rand, mean, sdev, min_num, max_num)
         result = self.rand.gauss(mean, sdev)
         # normalize
         result = min(result, max_num)
         result = max(result, min_num)
         return result
 
-    def rollbellFloat(self, min_num, max_num):
+    def rollbell_batch(self, trials, min_num, max_num, dist_ratio=2.0,
+                       truncate=False):
+        """Return a sequence of trials rollbell() results.
+
+        With NumPy, the result is a float array drawn in bulk.
+
+        @param trials: The number of results.
+        @type trials: int
+
+        @return: A sequence of trials floats between min_num and max_num.
+        """
+        trials, = _intArgs(trials)
+        if not (trials >= 0):
+            raise OutOfRangeError('number of trials out of range; must be >= 0')
+        mean = (min_num + max_num) / 2.0
+        sdev = abs(max_num - min_num) / float(dist_ratio)
+
+        state = None
+        if sdev > 0:
+            state = self._numpyState()
+        if state is None:
+            rollbell = self.rollbell
+            return [rollbell(min_num, max_num, dist_ratio, truncate)
+                    for i in xrange(trials)]
+
+        if not truncate:
+            results = state.normal(mean, sdev, trials)
+            return numpy.clip(results, min_num, max_num, out=results)
+        results = numpy.empty(trials)
+        filled = 0
+        while filled < trials:
+            needed = trials - filled
+            if (max_num - min_num) / sdev > _BELL_GAUSS_RATIO:
+                draws = state.normal(mean, sdev, needed)
+                draws = draws[(draws >= min_num) & (draws <= max_num)]
+            else:
+                draws = state.uniform(min_num, max_num, needed)
+                thin = numpy.exp(-0.5 * ((draws - mean) / sdev) ** 2)
+                draws = draws[state.random_sample(needed) <= thin]
+            results[filled:filled+len(draws)] = draws
+            filled += len(draws)
+        return results
+
+    def rollbellFloat(self, min_num, max_num, dist_ratio=2.0, truncate=False):
         """Roll bell-shaped floating dice.
 
         Return a float on a bell curve distribution between min_num
@@ -215,28 +1336,79 @@ class Dice(object):
 
         @return: a float between min_num and max_num.
         """
-        return float(self.rollbell(min_num, max_num))
+        return float(self.rollbell(min_num, max_num, dist_ratio, truncate))
 
-    def rollbellInt(self, min_num, max_num):
+    def rollbellInt(self, min_num, max_num, dist_ratio=2.0, truncate=False):
         """Roll bell-shaped discrete dice.
 
         Return an integer value on a bell curve distribution between
         min_num and max_num.
 
+        For integer ends, the result is drawn from a cached alias
+        table of each integer's exact probability, at the cost of one
+        uniform variate. Ranges wider than BELL_TABLE_MAX_TERMS round
+        a rollbell() result instead, which draws from the same curve.
+
         @param min_num: The minimum value.
         @type min_num: number
 
         @param max_num: The maximum value.
         @type max_num: number
 
-        @return: a float between min_num and max_num.
+        @return: an int between min_num and max_num.
+        """
+        if not _useBellTable(min_num, max_num):
+            return int(round(self.rollbell(min_num, max_num, dist_ratio,
+                                           truncate)))
+        cutoffs, aliases = _bellTable(min_num, max_num, dist_ratio, truncate)
+        x = self.rand.random() * len(cutoffs)
+        column = int(x)
+        if x - column < cutoffs[column]:
+            return column + min_num
+        return aliases[column] + min_num
+
+    def rollbellInt_batch(self, trials, min_num, max_num, dist_ratio=2.0,
+                          truncate=False):
+        """Return a sequence of trials rollbellInt() results.
+
+        With NumPy, the result is an int array drawn in bulk.
+
+        @param trials: The number of results.
+        @type trials: int
+
+        @return: A sequence of trials ints between min_num and max_num.
         """
-        return int(round(self.rollbell(min_num, max_num)))
+        trials, = _intArgs(trials)
+        if not (trials >= 0):
+            raise OutOfRangeError('number of trials out of range; must be >= 0')
+        if not _useBellTable(min_num, max_num):
+            rollbell = self.rollbell
+            return [int(round(rollbell(min_num, max_num, dist_ratio, truncate)))
+                    for i in xrange(trials)]
+
+        table = _bellTable(min_num, max_num, dist_ratio, truncate)
+        state = None
+        if trials >= 2:
+            state = self._numpyState()
+        if state is None:
+            return sampling.aliasInts(self.rand, trials, table, min_num)
+        cutoffs, aliases = table
+        x = state.random_sample(trials) * len(cutoffs)
+        columns = x.astype(numpy.intp)
+        keep = (x - columns) < numpy.take(cutoffs, columns)
+        return numpy.where(keep, columns,
+                           numpy.take(aliases, columns)) + min_num
 
     def reset(self):
         """Reset the random generator to initial state.
+
+        This also restarts the count of spawned children.
         """
-        self.rand.setstate(self.init_state)
+        if self._init_state is not None:
+            self._rand.setstate(self._init_state)
+        elif self._rand is not None:
+            self._rand.seed(self._seed)
+        self._spawned = 0
 
     def fuzz(self, num, ratio):
         """Fuzz the given number uniformly by the given ratio or tolerance.
@@ -260,6 +1432,125 @@ class Dice(object):
         result = num + (self.rand.uniform(0, distance) * sign)
         return result
 
+    def fuzz_batch(self, nums, ratio):
+        """Return a sequence of each of nums fuzzed, as by fuzz().
+
+        With NumPy, the result is a float array fuzzed in bulk.
+
+        @param nums: A sequence of numbers.
+        """
+        ratio = float(ratio)
+        state = self._numpyState()
+        if state is None:
+            fuzz = self.fuzz
+            return [fuzz(num, ratio) for num in nums]
+        nums = numpy.asarray(nums, dtype=float)
+        if ratio < 1:
+            distance = ratio * nums
+        else:
+            distance = ratio
+        signs = state.randint(0, 2, size=len(nums)) * 2 - 1
+        return nums + state.random_sample(len(nums)) * distance * signs
+
+
+class CounterDice(Dice):
+    """Random-access dice, for replays and sharded simulations.
+
+    CounterDice run on rng.CounterRandom, whose output is numbered:
+    roll_at(k, ...) makes the k-th roll of the stream directly, without
+    making rolls 0 through k-1 first, and always makes the same roll
+    for the same key and k.
+
+        >>> d = CounterDice(key=2010)
+        >>> d.roll_at(10**12, 3, 6) == CounterDice(key=2010).roll_at(10**12, 3, 6)
+        True
+
+    at(k) returns Dice set to the start of the k-th stream, for
+    anything else that takes a roller. E.g., shard k of a run can
+    regenerate its dcalc results or table rolls alone:
+
+        >>> import dcalc
+        >>> r = dcalc.calculate('3d6 + [1 4]', d.at(12345))
+    """
+    __slots__ = ()
+
+    def __init__(self, key=None):
+        """Initialize the CounterDice with a key.
+
+        @param key: The stream key; equal keys give equal streams.
+            Defaults to a key from the operating system's entropy
+            source.
+        @type key: int
+        """
+        super(CounterDice, self).__init__(backend=rng.CounterRandom, seed=key)
+
+    def at(self, index):
+        """Return a Dice positioned at the start of the given roll index.
+        """
+        dice = copy.copy(self)
+        dice._cheat_next = []
+        dice.rand = self.rand.stream(index)
+        return dice
+
+    def roll_at(self, index, num=1, sides=6, mod=0, sort=False):
+        """Return the roll at the given index; see Dice.roll().
+        """
+        return self.at(index).roll(num, sides, mod, sort)
+
+    def rollsum_at(self, index, num=1, sides=6, each_mod=0, total_mod=0):
+        """Return the sum at the given index; see Dice.rollsum().
+        """
+        return self.at(index).rollsum(num, sides, each_mod, total_mod)
+
+    def roll_range(self, start, stop, num=1, sides=6, mod=0, sort=False):
+        """Return the rolls at indices start up to (not including) stop.
+        """
+        dice = self.at(start)
+        results = []
+        for index in xrange(start, stop):
+            dice.rand.seek(index)
+            results.append(dice.roll(num, sides, mod, sort))
+        return results
+
+
+class SecureDice(Dice):
+    """Dice rolled from the operating system's entropy source.
+
+    For games where rolls must be unpredictable, even to someone who
+    has seen earlier ones. Entropy is read from os.urandom() in
+    chunks (see rng.UrandomRandom), and dice are carved from it
+    without bias, just as Dice carve them from other generators.
+    Everything built on the generator works as usual, including
+    dcalc: pass a SecureDice to dcalc.calculate(), or make it the
+    module roller with dice.roller.share(SecureDice()).
+
+    SecureDice never use NumPy's generator for batches, and have no
+    seed or state: reset() and init_state don't apply, setBackend()
+    refuses to switch away from the entropy source, and spawn() makes
+    more SecureDice, each independent of the rest.
+
+        >>> d = SecureDice()
+        >>> 3 <= d.rollsum(3, 6) <= 18
+        True
+    """
+    __slots__ = ()
+
+    def __init__(self):
+        super(SecureDice, self).__init__(backend=rng.UrandomRandom)
+
+    def setBackend(self, backend):
+        """Refuse: SecureDice always roll from OS entropy.
+        """
+        raise DiceError("SecureDice can't switch backends; use a Dice")
+
+    def spawn(self, n):
+        """Return n new SecureDice; each is already independent.
+        """
+        return [SecureDice() for i in xrange(int(n))]
+
+    def _numpyState(self):
+        return None
+
 
 class ParetoLowDice(Dice):
     """Weighted dice, defaulting to low-rollers.
@@ -270,8 +1561,10 @@ class ParetoLowDice(Dice):
 
     WARNING: This isn't tested very well yet.
     """
-    def __init__(self, state=random.getstate(), alpha=10):
-        super(ParetoLowDice, self).__init__(state)
+    __slots__ = ('alpha',)
+
+    def __init__(self, state=None, alpha=10, backend=None, seed=None):
+        super(ParetoLowDice, self).__init__(state, backend, seed)
         self.alpha = alpha
         
     def randParetoRange(self, low, high, alpha):
@@ -280,26 +1573,9 @@ class ParetoLowDice(Dice):
         We'll distribute the given range across the pareto
         distribution between 1 and 2.
         """
-        the_range = xrange(low, high)
-        range_length = len(the_range)
-        last_index = range_length-1
-        portion = 1.0/range_length
+        table = _paretoTable(high - low, alpha)
+        return low + bisect_left(table, self.rand.random())
 
-        presult = self.rand.paretovariate(alpha)
-        
-        the_index = 0
-        section = 1.0 + portion
-        # Determine which portion the presult falls in.
-        while section < presult:
-            the_index += 1
-            if the_index == last_index:
-                # The pareto distribution will sometimes exceed 2.0.
-                # We'll default to the last number in the range, in this case.
-                break
-            section += portion
-        
-        return the_range[the_index]
-        
     def roll(self, num=1, sides=6, mod=0, sort=False, alpha=None):
         """Return a list of num random ints between 1 and sides, each += mod.
         """
@@ -320,44 +1596,237 @@ class ParetoLowDice(Dice):
             # Use our default alpha.
             alpha = self.alpha
 
-        results = []
-        for i in range(num):
-            results.append(self.randParetoRange(1, sides+1, alpha)+mod)
+        table = _paretoTable(sides, alpha)
+        random = self.rand.random
+        offset = 1 + mod
+        results = [bisect_left(table, random()) + offset for i in xrange(num)]
         if sort:
             results.sort()
         return results
 
 
+class Pool(object):
+    """The outcome of a dice pool, as returned by Dice.roll_pool().
+
+    A Pool holds how many dice came up on each face, rather than the
+    dice themselves; the sorted list of rolls and the text description
+    are only made when asked for. For old code, a Pool also acts as
+    the pair (rolls, description): it unpacks, indexes and has a len()
+    of 2 like one.
+    """
+    __slots__ = ('counts', 'successes', 'target', 'rerolled', '_rolls')
+
+    def __init__(self, counts, successes, target, rerolled=0):
+        """Initialize the Pool.
+
+        @param counts: The number of dice showing each face, from 1 up.
+        @type counts: list
+
+        @param successes: The net number of successes.
+        @type successes: int
+
+        @param target: The target number successes were counted at.
+        @type target: int
+
+        @param rerolled: The number of extra dice rolled by explosions.
+        @type rerolled: int
+        """
+        self.counts = counts
+        self.successes = successes
+        self.target = target
+        self.rerolled = rerolled
+        self._rolls = None
+
+    @property
+    def rolls(self):
+        """A sorted list of every die rolled, re-rolls included."""
+        if self._rolls is None:
+            rolls = []
+            for face, count in enumerate(self.counts):
+                if count:
+                    rolls.extend([face + 1] * count)
+            self._rolls = rolls
+        return self._rolls
+
+    def __iter__(self):
+        return iter((self.rolls, str(self)))
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, index):
+        return (self.rolls, str(self))[index]
+
+    def __str__(self):
+        return "%s successes (target of %s, re-rolled %s)" \
+               % (self.successes, self.target, self.rerolled)
+
+    def __repr__(self):
+        return "<Pool %s>" % (self,)
+
+
 class D10(Dice):
     """Example subclass of dice, implementing a bag of D10s.
 
     Useful for White Wolf's Storyteller system.
     """
+    __slots__ = ()
+
     def roll(self, num, target=6, reroll=False):
-        allrolls = []
-        thisroll = super(D10, self).roll(num, 10, sort=True)
-        successes = self._countSuccesses(thisroll, target)
+        """Roll a pool of num D10s; tens count double, ones cancel.
+
+        With reroll=True, tens are rolled again.
+
+        @return: a Pool, which unpacks as (rolls, description).
+        """
+        return self.roll_pool(num, 10, target, explode=10 if reroll else None,
+                              double=10, botch=1)
+
+
+class Roller(Dice):
+    """A stand-in for a Dice, rolling with a shared or per-thread Dice.
+
+    The module roller is a Roller. By default, every thread rolls with
+    the same Dice. In thread-local mode, each thread instead rolls with
+    its own Dice, made the first time the thread rolls, and seeded
+    from a root seed and the thread's number. So threads never share
+    (or contend for) a generator. With a fixed root seed, thread k
+    rolls just like Dice(seed=root).spawn(k+1)[k], whichever thread
+    happens to be k-th; threads that need a particular stream can
+    claim it with bind().
+
+    A Roller is a Dice, but holds no stream of its own: every Dice
+    method and attribute is looked up on the current thread's Dice on
+    each use, so bound methods (e.g. dcalc's dsum = roller.rollsum)
+    follow the current thread and mode too.
+    """
+    __slots__ = ('_mode', '_threads', '_lock')
+
+    def __init__(self, dice=None):
+        """Initialize the Roller, sharing the given Dice (or a new one).
+        """
+        self._lock = threading.Lock()
+        self.share(dice)
+
+    @property
+    def dice(self):
+        """The Dice the current thread rolls with."""
+        # The mode is one tuple, so a switch is seen whole or not at all.
+        mode = self._mode
+        if mode[0] is not None:
+            return mode[0]
+        try:
+            return mode[1].dice
+        except AttributeError:
+            pass
+        with self._lock:
+            # Look again, in case the mode switched meanwhile.
+            mode = self._mode
+            if mode[0] is not None:
+                return mode[0]
+            try:
+                return mode[1].dice
+            except AttributeError:
+                index = self._threads
+                self._threads += 1
+                return self._bind(mode, index)
+
+    @property
+    def local(self):
+        """Whether each thread rolls with its own Dice."""
+        return self._mode[0] is None
+
+    def share(self, dice=None):
+        """Roll with one Dice in every thread.
+
+        @param dice: The Dice to share; defaults to a new one.
+        """
+        if dice is None:
+            dice = Dice()
+        with self._lock:
+            self._mode = (dice, None, None, None)
+
+    def threadLocal(self, seed=None, backend=None):
+        """Roll with a separate Dice in each thread.
+
+        Threads' Dice are made afresh, so this starts every thread's
+        stream over.
+
+        @param seed: The root seed; defaults to a fresh one from the
+            operating system.
+
+        @param backend: The RNG backend for the threads' Dice;
+            defaults to the module default.
+        """
+        if seed is None:
+            seed = rng.entropySeed()
+        with self._lock:
+            self._threads = 0
+            self._mode = (None, threading.local(), seed, backend)
+
+    def bind(self, index):
+        """Give the current thread the Dice for the given thread number.
+
+        Only for thread-local mode; the thread's stream starts over.
+
+        @return: The thread's new Dice.
+        """
+        with self._lock:
+            mode = self._mode
+            if mode[0] is not None:
+                raise DiceError('bind() needs thread-local mode')
+            return self._bind(mode, index)
+
+    def _bind(self, mode, index):
+        shared, local, root, backend = mode
+        dice = Dice(backend=backend, seed=rng.deriveSeed(root, index))
+        local.dice = dice
+        return dice
+
+    def setBackend(self, backend):
+        """Switch to another RNG backend.
+
+        A shared Dice switches in place (see Dice.setBackend()); in
+        thread-local mode, every thread's stream starts over.
+        """
+        shared, local, root, old = self._mode
+        if shared is not None:
+            shared.setBackend(backend)
+        else:
+            self.threadLocal(root, backend)
+
+    def _getRand(self):
+        return self.dice.rand
+
+    def _setRand(self, rand):
+        self.dice.rand = rand
+
+    rand = property(_getRand, _setRand,
+                    doc="The current thread's Dice's generator.")
+
+    def __getattr__(self, name):
+        # Dice's own slots are never filled on a Roller, so reading
+        # one lands here, and reads the current Dice's instead.
+        if name in Roller.__slots__:
+            raise AttributeError(name)
+        return getattr(self.dice, name)
 
-        allrolls.extend(thisroll)
+    def __repr__(self):
+        return "<Roller %s>" % ('thread-local' if self.local else 'shared',)
 
-        if reroll:
-            while thisroll.count(10) > 0:
-                tens = thisroll.count(10)
-                thisroll = super(D10, self).roll(tens, 10, sort=True)
-                allrolls.extend(thisroll)
-                successes += self._countSuccesses(thisroll, target)
 
-        extra = len(allrolls) - num
-        return allrolls, "%s successes (target of %s, re-rolled %s" \
-               % (successes, target, extra)
+def _forward(name):
+    def forward(self, *args, **kwargs):
+        return getattr(self.dice, name)(*args, **kwargs)
+    forward.__name__ = name
+    forward.__doc__ = getattr(Dice, name).__doc__
+    return forward
 
-    def _countSuccesses(self, thisroll, target, double_tens=True, subtract_ones=True):
-        successes = sum([int(result >= target) for result in thisroll])
-        if double_tens:
-            successes += thisroll.count(10)
-        if subtract_ones:
-            successes -= thisroll.count(1)
-        return successes
+for _name, _value in vars(Dice).items():
+    if (not _name.startswith('__') and callable(_value)
+        and _name not in vars(Roller)):
+        setattr(Roller, _name, _forward(_name))
+del _name, _value
 
 
 def _checkVariation(func, args, low, high, num):
@@ -384,4 +1853,4 @@ def _checkVariation(func, args, low, high, num):
     print "Out of %s, %s were low, %s were high" % (num, lowball, highball)
     return (num, lowball, highball)
 
-roller = Dice()
+roller = Roller()
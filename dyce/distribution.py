@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""distribution -- exact probability distributions of dice rolls.
+
+Where Dice samples, a Distribution counts: every outcome is held with
+its exact integer weight out of a common total, so probabilities,
+means and variances come out as exact fractions.
+
+    >>> d = rollsum(2, 6)
+    >>> d.pmf(7)
+    Fraction(1, 6)
+    >>> d.cdf(4)
+    Fraction(1, 6)
+    >>> d.mean()
+    Fraction(7, 1)
+    >>> fromSpec('3d6').quantile(0.5)
+    10
+
+Sums of many dice are built by convolution from memoized 2^k-dice
+powers, so 100d6 after 90d6 costs only a few convolutions.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__version__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import math
+import fractions
+from fractions import Fraction
+
+import dice
+
+__all__ = ['Distribution', 'bellInt', 'constant', 'fromSpec', 'keep',
+           'mixture', 'randint', 'rollsum']
+
+# The number of whole dice-sum distributions kept by rollsum().
+SUM_CACHE_SIZE = 128
+
+# The number of 2**k-dice powers kept for building sums.
+POWER_CACHE_SIZE = 256
+
+# Below this many weights, convolve term by term instead of by packing.
+_PACK_THRESHOLD = 16
+
+# (sides, k) -> weights of the sum of 2**k dice, lowest sum first.
+_powers = dice._LRUCache()
+
+_sums = dice._LRUCache()
+
+
+class Distribution(object):
+    """An exact discrete probability distribution.
+
+    Outcomes map to integer weights; the probability of an outcome is
+    its weight divided by the total weight. Distributions are
+    immutable, and adding one to another (or to a number) yields the
+    distribution of the sum of independent draws.
+    """
+    __slots__ = ('_weights', '_total', '_values')
+
+    def __init__(self, weights):
+        """Initialize the Distribution.
+
+        @param weights: A mapping of outcome to positive integer weight.
+        @type weights: dict
+        """
+        self._weights = dict((v, w) for v, w in weights.iteritems() if w)
+        if not self._weights:
+            raise ValueError('a distribution needs at least one outcome')
+        self._total = sum(self._weights.itervalues())
+        self._values = sorted(self._weights)
+
+    @classmethod
+    def fromRange(cls, low, weights):
+        """Build a distribution over consecutive integers from low up.
+        """
+        return cls(dict((low + i, w) for i, w in enumerate(weights)))
+
+    def __repr__(self):
+        return "<Distribution %s..%s>" % (self.min(), self.max())
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __eq__(self, other):
+        if not isinstance(other, Distribution):
+            return NotImplemented
+        return self.probabilities() == other.probabilities()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash(tuple(self.probabilities()))
+
+    def __add__(self, other):
+        if not isinstance(other, Distribution):
+            return self.map(lambda v: v + other)
+        if self._isRange() and other._isRange():
+            weights = _convolve(self._rangeWeights(), other._rangeWeights())
+            return Distribution.fromRange(self.min() + other.min(), weights)
+        return self.combine(other, lambda a, b: a + b)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return self.map(lambda v: -v)
+
+    def __sub__(self, other):
+        return self + (-other)
+
+    def __rsub__(self, other):
+        return (-self) + other
+
+    @property
+    def total(self):
+        """The total weight of all outcomes."""
+        return self._total
+
+    def weight(self, value):
+        """Return the integer weight of the given outcome."""
+        return self._weights.get(value, 0)
+
+    def items(self):
+        """Return a sorted list of (outcome, weight) pairs."""
+        return [(v, self._weights[v]) for v in self._values]
+
+    def probabilities(self):
+        """Return a sorted list of (outcome, exact probability) pairs."""
+        total = self._total
+        return [(v, Fraction(self._weights[v], total)) for v in self._values]
+
+    def min(self):
+        """Return the lowest possible outcome."""
+        return self._values[0]
+
+    def max(self):
+        """Return the highest possible outcome."""
+        return self._values[-1]
+
+    def pmf(self, value):
+        """Return the exact probability of the given outcome."""
+        return Fraction(self._weights.get(value, 0), self._total)
+
+    def cdf(self, value):
+        """Return the exact probability of an outcome <= value."""
+        weights = self._weights
+        return Fraction(sum(weights[v] for v in self._values if v <= value),
+                        self._total)
+
+    def mean(self):
+        """Return the exact expected value."""
+        weights = self._weights
+        return Fraction(sum(Fraction(v) * weights[v] for v in self._values),
+                        self._total)
+
+    def variance(self):
+        """Return the exact variance."""
+        weights = self._weights
+        square = sum(Fraction(v) ** 2 * weights[v] for v in self._values)
+        return square / self._total - self.mean() ** 2
+
+    def stddev(self):
+        """Return the standard deviation, as a float."""
+        return float(self.variance()) ** 0.5
+
+    def quantile(self, q):
+        """Return the smallest outcome whose cdf is at least q.
+
+        @param q: A probability between 0 and 1.
+        @type q: float, Fraction or int
+        """
+        q = Fraction(q)
+        if not (0 <= q <= 1):
+            raise ValueError('quantile out of range; must be in [0, 1]')
+        needed = q * self._total
+        running = 0
+        weights = self._weights
+        for v in self._values:
+            running += weights[v]
+            if running >= needed:
+                return v
+        return self._values[-1]
+
+    def map(self, func):
+        """Return the distribution of func(outcome).
+        """
+        weights = {}
+        for v, w in self._weights.iteritems():
+            r = func(v)
+            weights[r] = weights.get(r, 0) + w
+        return Distribution(weights)
+
+    def combine(self, other, func):
+        """Return the distribution of func(a, b) for independent a and b.
+        """
+        weights = {}
+        other_items = other._weights.items()
+        for a, wa in self._weights.iteritems():
+            for b, wb in other_items:
+                r = func(a, b)
+                weights[r] = weights.get(r, 0) + wa * wb
+        return Distribution(weights)
+
+    def _isRange(self):
+        values = self._values
+        return (all(isinstance(v, (int, long)) for v in values)
+                and values[-1] - values[0] + 1 == len(values))
+
+    def _rangeWeights(self):
+        weights = self._weights
+        return [weights[v] for v in self._values]
+
+
+def _convolve(a, b):
+    """Return the convolution of two lists of non-negative integer weights.
+
+    Long lists are convolved by Kronecker substitution: each list is
+    packed into one big integer, with a slot per weight wide enough
+    that no sum of products can carry into its neighbor, so a single
+    long-integer multiply does all the work.
+    """
+    length = len(a) + len(b) - 1
+    if min(len(a), len(b)) <= _PACK_THRESHOLD:
+        result = [0] * length
+        for i, wa in enumerate(a):
+            for j, wb in enumerate(b):
+                result[i+j] += wa * wb
+        return result
+
+    bound = max(a) * max(b) * min(len(a), len(b))
+    digits = (bound.bit_length() + 3) // 4
+    fmt = '%%0%dx' % digits
+    packed_a = int(''.join([fmt % w for w in reversed(a)]), 16)
+    packed_b = int(''.join([fmt % w for w in reversed(b)]), 16)
+    product = ('%x' % (packed_a * packed_b)).zfill(length * digits)
+    return [int(product[i:i+digits], 16)
+            for i in xrange(len(product) - digits, -1, -digits)]
+
+
+def _power(sides, k):
+    """Return the weights of the sum of 2**k dice of the given sides.
+    """
+    key = (sides, k)
+    weights = _powers.get(key)
+    if weights is None:
+        if k == 0:
+            weights = [1] * sides
+        else:
+            half = _power(sides, k - 1)
+            weights = _convolve(half, half)
+        _powers.put(key, weights, POWER_CACHE_SIZE)
+    return weights
+
+
+def constant(value):
+    """Return the distribution that is always the given value.
+    """
+    return Distribution({value: 1})
+
+
+def rollsum(num=1, sides=6, each_mod=0, total_mod=0):
+    """Return the exact distribution of Dice.rollsum() with these arguments.
+
+    @param num: The number of dice.
+    @type num: int
+
+    @param sides: The number of sides per dice.
+    @type sides: int
+
+    @param each_mod: The modifier to add to *each* roll.
+    @type each_mod: int
+
+    @param total_mod: The modifier to add to the total.
+    @type total_mod: int
+
+    @return: a Distribution.
+    """
+    num, sides, each_mod, total_mod = dice._intArgs(num, sides, each_mod,
+                                                    total_mod)
+    if num == 0 or sides == 0:
+        return constant(total_mod)
+    if not (num > 0):
+        raise dice.OutOfRangeError('number of dice out of range; must be >= 0')
+    if not (sides > 0):
+        raise dice.OutOfRangeError('number of sides out of range; must be >= 0')
+
+    key = (num, sides)
+    dist = _sums.get(key)
+    if dist is None:
+        weights = None
+        k = 0
+        n = num
+        while n:
+            if n & 1:
+                power = _power(sides, k)
+                weights = power if weights is None else _convolve(weights, power)
+            n >>= 1
+            k += 1
+        dist = Distribution.fromRange(num, weights)
+        _sums.put(key, dist, SUM_CACHE_SIZE)
+
+    mod = num*each_mod + total_mod
+    if mod:
+        return dist + mod
+    return dist
+
+
+def fromSpec(d):
+    """Return the exact distribution of a dice specifier.
+
+    The modifier applies to each die, just as with
+    Dice.rollsum(*dice.parse(d)).
+
+        >>> fromSpec('2d6+1').min()
+        4
+
+    @param d: A dice specifier string ("NdS+M"), or a (num, sides,
+        mod) tuple, as returned by dice.parse().
+    """
+    if isinstance(d, basestring):
+        d = dice.parse(d)
+    return rollsum(*d)
+
+
+def randint(a, b):
+    """Return the exact distribution of Dice.randint(a, b).
+    """
+    a, b = dice._intArgs(a, b)
+    if not (a <= b):
+        raise dice.OutOfRangeError('empty range; must have a <= b')
+    return Distribution.fromRange(a, [1] * (b - a + 1))
+
+
+def _choose(n, k):
+    return math.factorial(n) // (math.factorial(k) * math.factorial(n - k))
+
+
+def keep(num=1, sides=6, keep=1, highest=True):
+    """Return the exact distribution of sum(Dice.roll_keep(...)).
+
+        >>> keep(4, 6, 3).mean()
+        Fraction(15869, 1296)
+
+    Faces are counted from the highest down: for each face, every
+    number of the dice not yet counted may show it, in so many ways,
+    and the kept dice are the first keep counted. So the work grows
+    like sides**2 * num**2 * keep, not like the sides**num possible
+    rolls.
+    """
+    num, sides, keep = dice._intArgs(num, sides, keep)
+    if not (num > 0):
+        raise dice.OutOfRangeError('number of dice out of range; must be > 0')
+    if not (sides > 0):
+        raise dice.OutOfRangeError('number of sides out of range; must be > 0')
+    if not (0 <= keep <= num):
+        raise dice.OutOfRangeError('number of dice kept out of range; '
+                                   'must be in 0..num')
+    if keep == num:
+        return rollsum(num, sides)
+    if keep == 0:
+        return constant(0)
+    if not highest:
+        # The lowest dice of a roll are the highest of its mirror image.
+        return _keepHighest(num, sides, keep).map(
+            lambda v: keep * (sides + 1) - v)
+    return _keepHighest(num, sides, keep)
+
+
+def _keepHighest(num, sides, keep):
+    """Return the distribution of the sum of the keep highest of num dice.
+    """
+    # (dice counted, sum of the kept ones) -> number of ways.
+    states = {(0, 0): 1}
+    for face in xrange(sides, 0, -1):
+        counted = {}
+        for (done, total), ways in states.iteritems():
+            left = num - done
+            room = max(keep - done, 0)
+            # The last face takes every die left.
+            for count in xrange(left if face == 1 else 0, left + 1):
+                key = (done + count, total + face * min(count, room))
+                counted[key] = (counted.get(key, 0)
+                                + ways * _choose(left, count))
+        states = counted
+    return Distribution(dict((total, ways)
+                             for (done, total), ways in states.iteritems()))
+
+
+def bellInt(min_num, max_num, dist_ratio=2.0, truncate=False):
+    """Return the distribution of Dice.rollbellInt() with these arguments.
+
+    Not exact: the bell curve's probabilities are only known as
+    floats, so the weights are those floats, scaled to integers.
+    """
+    if min_num == max_num:
+        return constant(min_num)
+    if not (min_num < max_num):
+        raise dice.OutOfRangeError('empty range; must have min <= max')
+    weights = [Fraction(w) for w in
+               dice._bellWeights(min_num, max_num, dist_ratio, truncate)]
+    scale = max(w.denominator for w in weights)
+    return Distribution.fromRange(min_num,
+                                  [int(w * scale) for w in weights])
+
+
+def mixture(weighted):
+    """Return the mixture of distributions, each with the given weight.
+
+    The result draws from each distribution with its weight's share
+    of the probability, e.g. to combine the outcomes of a roll
+    conditioned on each value of another.
+
+    @param weighted: A sequence of (weight, Distribution) pairs, with
+        non-negative integer weights.
+    """
+    weighted = [(w, d) for w, d in weighted if w]
+    common = 1
+    for w, d in weighted:
+        common = common * d.total // fractions.gcd(common, d.total)
+    weights = {}
+    for w, d in weighted:
+        scale = w * (common // d.total)
+        for v, dw in d.items():
+            weights[v] = weights.get(v, 0) + dw * scale
+    return Distribution(weights)
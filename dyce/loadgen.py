@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""loadgen -- measure a dice server's throughput and latency.
+
+    python -m dyce.loadgen --unix /tmp/dyce.sock --concurrency 4 --pipeline 8
+    python -m dyce.loadgen --http localhost:8765 --batch 100
+
+Each of the concurrency threads opens one connection and sends
+messages of batch requests each. Over a Unix socket, up to pipeline
+messages are in flight on a connection at once. Latency is measured
+per message, from sending it to reading its answer.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__version__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import sys
+import json
+import time
+import socket
+import httplib
+import threading
+from optparse import OptionParser
+
+__all__ = ['percentile', 'run']
+
+
+def percentile(sorted_values, p):
+    """Return the p-th percentile (0-100) of a sorted list, or None.
+    """
+    if not sorted_values:
+        return None
+    index = int(round(p / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def _unixWorker(path, message, messages, pipeline, latencies):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    rfile = sock.makefile('rb')
+    line = json.dumps(message) + '\n'
+    sent = 0
+    while sent < messages:
+        flight = min(pipeline, messages - sent)
+        starts = []
+        for i in xrange(flight):
+            starts.append(time.time())
+            sock.sendall(line)
+        for start in starts:
+            json.loads(rfile.readline())
+            latencies.append(time.time() - start)
+        sent += flight
+    sock.close()
+
+
+def _httpWorker(address, message, messages, pipeline, latencies):
+    host, _, port = address.rpartition(':')
+    conn = httplib.HTTPConnection(host or 'localhost', int(port))
+    body = json.dumps(message)
+    headers = {'Content-Type': 'application/json'}
+    for i in xrange(messages):
+        start = time.time()
+        conn.request('POST', '/', body, headers)
+        json.loads(conn.getresponse().read())
+        latencies.append(time.time() - start)
+    conn.close()
+
+
+def run(unix=None, http=None, expr='1d20+5', requests=10000, concurrency=1,
+        pipeline=1, batch=1):
+    """Load a server; return a dict of throughput and latency figures.
+
+    @param unix: The server's Unix socket path, or
+    @param http: its HTTP address, as [HOST:]PORT.
+
+    @param requests: The total number of requests to send.
+    @type requests: int
+    """
+    if batch > 1:
+        message = [{'expr': expr}] * batch
+    else:
+        message = {'expr': expr}
+    if unix:
+        worker, target = _unixWorker, unix
+    else:
+        worker, target = _httpWorker, http
+    messages = max(1, requests // (batch * concurrency))
+
+    latencies = []
+    threads = [threading.Thread(target=worker,
+                                args=(target, message, messages, pipeline,
+                                      latencies))
+               for i in xrange(concurrency)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    latencies.sort()
+    return {'requests': len(latencies) * batch,
+            'seconds': elapsed,
+            'requests_per_sec': len(latencies) * batch / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            }
+
+
+def main(argv=None):
+    """Run the load generator from the command line.
+    """
+    parser = OptionParser(usage='python -m dyce.loadgen [options]')
+    parser.add_option('--unix', metavar='PATH',
+                      help="the server's Unix domain socket")
+    parser.add_option('--http', metavar='[HOST:]PORT',
+                      help="the server's HTTP address")
+    parser.add_option('--expr', default='1d20+5',
+                      help='the expression to request (default %default)')
+    parser.add_option('--requests', type='int', default=10000,
+                      help='the number of requests (default %default)')
+    parser.add_option('--concurrency', type='int', default=1,
+                      help='the number of connections (default %default)')
+    parser.add_option('--pipeline', type='int', default=1,
+                      help='messages in flight per Unix connection '
+                           '(default %default)')
+    parser.add_option('--batch', type='int', default=1,
+                      help='requests per message (default %default)')
+    options, args = parser.parse_args(argv)
+    if not (options.unix or options.http):
+        parser.error('give --unix or --http')
+
+    stats = run(options.unix, options.http, options.expr, options.requests,
+                options.concurrency, options.pipeline, options.batch)
+    print '%(requests)d requests in %(seconds).2f s: ' \
+          '%(requests_per_sec).0f requests/sec, ' \
+          'p50 %(p50_ms).3f ms, p99 %(p99_ms).3f ms' % stats
+
+
+if __name__ == '__main__':
+    main()
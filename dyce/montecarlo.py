@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""montecarlo -- run many trials of a dice expression or table, in parallel.
+
+    >>> result = run('3d6', 20000, seed=7, workers=1)
+    >>> result.trials, sum(result.histogram.values())
+    (20000, 20000)
+    >>> 10.3 < result.mean < 10.7
+    True
+
+The trials are cut into chunks of chunk_size, and chunk i rolls with
+its own Dice, seeded from the root seed and i alone (as with
+rng.deriveSeed()). Chunks are farmed out to a pool of worker
+processes, and their histograms and moments are merged in chunk
+order. So the result depends only on the source, the trial count, the
+root seed and the chunk size; any number of workers gives the very
+same result, down to the last bit of the mean.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__version__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import itertools
+import multiprocessing
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+
+import dice
+import dcalc
+import rng
+import tables
+
+import logging
+logger = logging.getLogger('montecarlo')
+
+__all__ = ['CHUNK_SIZE', 'Result', 'run']
+
+# The default number of trials per chunk.
+CHUNK_SIZE = 10000
+
+
+class Result(object):
+    """The merged outcome of a Monte Carlo run.
+
+    histogram maps each outcome to the number of trials that gave it.
+    When every outcome is a number, mean, variance, min and max
+    describe them; otherwise (e.g. for tables with text results) they
+    are None.
+    """
+    __slots__ = ('trials', 'seed', 'histogram', 'mean', 'variance',
+                 'min', 'max')
+
+    def __init__(self, trials, seed, histogram, mean=None, variance=None,
+                 min=None, max=None):
+        self.trials = trials
+        self.seed = seed
+        self.histogram = histogram
+        self.mean = mean
+        self.variance = variance
+        self.min = min
+        self.max = max
+
+    @property
+    def stddev(self):
+        """The standard deviation of the outcomes, or None."""
+        if self.variance is None:
+            return None
+        return self.variance ** 0.5
+
+    def pmf(self, value):
+        """Return the fraction of trials that gave the given outcome."""
+        return self.histogram.get(value, 0) / float(self.trials)
+
+    def items(self):
+        """Return a sorted list of (outcome, count) pairs."""
+        return sorted(self.histogram.iteritems())
+
+    def __eq__(self, other):
+        if not isinstance(other, Result):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name)
+                   for name in self.__slots__)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return "<Result of %s trials, mean %s>" % (self.trials, self.mean)
+
+
+def _plainTable(tbl):
+    """Return a table as plain, picklable dicts.
+    """
+    if hasattr(tbl, 'dict'):
+        return tbl.dict()
+    return tbl
+
+
+def _runChunk(task):
+    """Run one chunk of trials; return (histogram, count, mean, m2).
+
+    mean and m2 (the sum of squared deviations) are None if any
+    outcome isn't a number.
+    """
+    source, chunk, trials, seed, backend = task
+    roller = dice.Dice(backend=backend, seed=rng.deriveSeed(seed, chunk))
+    histogram = {}
+    if isinstance(source, basestring):
+        trial = lambda: dcalc.calculate(source, roller)
+    else:
+        trial = lambda: tables.rollTable(source, roller=roller)
+
+    numeric = True
+    mean = m2 = 0.0
+    for n in xrange(1, trials + 1):
+        value = trial()
+        histogram[value] = histogram.get(value, 0) + 1
+        if numeric:
+            if isinstance(value, (int, long, float)):
+                delta = value - mean
+                mean += delta / n
+                m2 += delta * (value - mean)
+            else:
+                numeric = False
+    if not numeric:
+        return histogram, trials, None, None
+    return histogram, trials, mean, m2
+
+
+def _mapChunks(tasks, workers):
+    """Yield _runChunk() of each task, in order, using workers processes.
+    """
+    if workers == 1:
+        for result in itertools.imap(_runChunk, tasks):
+            yield result
+    elif ProcessPoolExecutor is not None:
+        with ProcessPoolExecutor(workers) as executor:
+            for result in executor.map(_runChunk, tasks):
+                yield result
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for result in pool.imap(_runChunk, tasks):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+
+
+def run(source, trials, seed=None, workers=None, chunk_size=CHUNK_SIZE,
+        backend=None):
+    """Roll a dice expression or table trials times, across processes.
+
+    @param source: A dcalc expression string, or a table (as loaded
+        by tables.loadTable()).
+
+    @param trials: The number of trials.
+    @type trials: int
+
+    @param seed: The root seed; defaults to a fresh one from the
+        operating system, which is kept in the result.
+
+    @param workers: The number of worker processes; defaults to the
+        number of CPUs. With 1, everything runs in this process.
+    @type workers: int
+
+    @param chunk_size: The number of trials per chunk (and per Dice
+        stream). Changing it changes the result.
+    @type chunk_size: int
+
+    @param backend: The RNG backend for the chunks' Dice.
+
+    @return: a Result.
+    """
+    trials, chunk_size = dice._intArgs(trials, chunk_size)
+    if not (trials >= 0):
+        raise dice.OutOfRangeError('number of trials out of range; must be >= 0')
+    if not (chunk_size > 0):
+        raise dice.OutOfRangeError('chunk size out of range; must be > 0')
+    if seed is None:
+        seed = rng.entropySeed()
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if not isinstance(source, basestring):
+        source = _plainTable(source)
+
+    chunks = -(-trials // chunk_size)
+    workers = max(1, min(int(workers), chunks))
+    tasks = [(source, i, min(chunk_size, trials - i*chunk_size), seed, backend)
+             for i in xrange(chunks)]
+    logger.info("Running %s trials in %s chunks on %s workers",
+                trials, chunks, workers)
+
+    histogram = {}
+    count = 0
+    mean = m2 = 0.0
+    numeric = True
+    for chunk_hist, n, chunk_mean, chunk_m2 in _mapChunks(tasks, workers):
+        for value, hits in chunk_hist.iteritems():
+            histogram[value] = histogram.get(value, 0) + hits
+        if chunk_mean is None:
+            numeric = False
+        if numeric:
+            # Chan et al.'s pairwise update, applied in chunk order.
+            total = count + n
+            delta = chunk_mean - mean
+            mean += delta * n / total
+            m2 += chunk_m2 + delta * delta * count * n / total
+            count = total
+
+    if not (numeric and count):
+        return Result(trials, seed, histogram)
+    return Result(trials, seed, histogram, mean, m2 / count,
+                  min(histogram), max(histogram))
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""ring -- pre-rolled dice in shared memory, for forked worker processes.
+
+A RollRing is a ring buffer of die faces for one size of die, kept in
+shared memory. A producer process keeps the rings topped up with
+fresh rolls; RingDice in any process made by forking then take their
+d6s, d20s etc. from the rings, and only roll their own when a ring
+runs dry.
+
+    >>> rings = makeRings((6, 20), size=4096)
+    >>> producer = RingProducer(rings, seed=1)
+    >>> producer.fill()      # or producer.start(), in its own process
+    >>> d = RingDice(rings)
+    >>> len(d.roll(3, 6))
+    3
+
+In a prefork server, make the rings and start the producer in the
+master, before forking the workers; each worker makes its own
+RingDice on the inherited rings.
+
+Each ring has a write cursor and a read cursor, counting all faces
+ever written and read, and a lock. Readers copy faces out and move
+the read cursor under the lock, so no face is handed out twice; the
+single producer writes only into slots already read, then moves the
+write cursor under the lock.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__version__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import ctypes
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray, RawValue
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import dice
+import rng
+
+import logging
+logger = logging.getLogger('ring')
+
+__all__ = ['RingDice', 'RingProducer', 'RollRing', 'makeRings']
+
+# The default number of faces per ring.
+RING_SIZE = 1 << 16
+
+# The producer tops a ring up once it is less than this fraction full.
+LOW_WATER = 0.5
+
+# RingDice take at least this many faces from a ring at a time.
+TAKE_CHUNK = 256
+
+
+class RollRing(object):
+    """A shared-memory ring buffer of rolls of one size of die.
+    """
+    def __init__(self, sides, size=RING_SIZE):
+        """Initialize the RollRing, empty.
+
+        @param sides: The number of sides per dice.
+        @type sides: int
+
+        @param size: The number of faces the ring holds.
+        @type size: int
+        """
+        sides, size = dice._intArgs(sides, size)
+        if not (sides > 0):
+            raise dice.OutOfRangeError('number of sides out of range; '
+                                       'must be > 0')
+        if not (size > 0):
+            raise dice.OutOfRangeError('ring size out of range; must be > 0')
+        if sides <= 0xFF:
+            ctype, self._dtype = ctypes.c_uint8, 'uint8'
+        elif sides <= 0xFFFF:
+            ctype, self._dtype = ctypes.c_uint16, 'uint16'
+        else:
+            ctype, self._dtype = ctypes.c_uint32, 'uint32'
+        self.sides = sides
+        self.size = size
+        self._faces = RawArray(ctype, size)
+        self._written = RawValue(ctypes.c_ulonglong, 0)
+        self._read = RawValue(ctypes.c_ulonglong, 0)
+        self._lock = multiprocessing.Lock()
+
+    def __repr__(self):
+        return "<RollRing d%s, %s of %s>" % (self.sides, self.available(),
+                                             self.size)
+
+    def available(self):
+        """Return the number of faces waiting to be taken."""
+        with self._lock:
+            return self._written.value - self._read.value
+
+    def take(self, n):
+        """Take up to n faces from the ring; fewer if it runs dry.
+
+        @return: A list of at most n faces.
+        """
+        faces = self._faces
+        size = self.size
+        with self._lock:
+            read = self._read.value
+            n = min(n, self._written.value - read)
+            if n <= 0:
+                return []
+            start = read % size
+            end = start + n
+            if end <= size:
+                results = faces[start:end]
+            else:
+                results = faces[start:size] + faces[0:end - size]
+            self._read.value = read + n
+        return results
+
+    def fill(self, roller):
+        """Top the ring up with rolls from the given Dice.
+
+        Only one process may fill a given ring.
+
+        @return: The number of faces added.
+        """
+        with self._lock:
+            written = self._written.value
+            free = self.size - (written - self._read.value)
+        if free <= 0:
+            return 0
+        start = written % self.size
+        first = min(free, self.size - start)
+        self._write(roller, start, first)
+        if free > first:
+            self._write(roller, 0, free - first)
+        with self._lock:
+            self._written.value = written + free
+        return free
+
+    def needsFill(self, low_water=LOW_WATER):
+        """Is the ring less than low_water full?"""
+        return self.available() < low_water * self.size
+
+    def _write(self, roller, start, count):
+        if numpy is not None:
+            view = numpy.frombuffer(self._faces, dtype=self._dtype)
+            roller.roll_into(view[start:start+count], self.sides)
+        else:
+            self._faces[start:start+count] = roller.roll(count, self.sides)
+
+
+def makeRings(sides=(6, 20, 100), size=RING_SIZE):
+    """Return a dict of new RollRings, by number of sides.
+    """
+    return dict((s, RollRing(s, size)) for s in sides)
+
+
+class RingProducer(object):
+    """Keeps a set of RollRings topped up, from its own process.
+    """
+    def __init__(self, rings, seed=None, backend=None, interval=0.01,
+                 low_water=LOW_WATER):
+        """Initialize the RingProducer.
+
+        @param rings: A dict of RollRings, by number of sides.
+
+        @param seed: The seed the producer's Dice is made from.
+
+        @param interval: How often (in seconds) to look at the rings,
+            when no consumer has asked for more.
+        @type interval: float
+
+        @param low_water: Top a ring up once it is less than this
+            fraction full.
+        @type low_water: float
+        """
+        if seed is None:
+            seed = rng.entropySeed()
+        self.rings = rings
+        self.seed = seed
+        self.backend = backend
+        self.interval = interval
+        self.low_water = low_water
+        self.wanted = multiprocessing.Event()
+        self._stop = multiprocessing.Event()
+        self._process = None
+        self._roller = None
+        self._generations = 0
+
+    def _newRoller(self):
+        """Return a Dice for a new generation of faces.
+
+        Each generation (the fill() roller, and each start()) gets a
+        stream of its own, derived from the seed, so no two put the
+        same faces into the rings.
+        """
+        seed = rng.deriveSeed(self.seed, self._generations)
+        self._generations += 1
+        return dice.Dice(backend=self.backend, seed=seed)
+
+    def fill(self):
+        """Top every ring up now, from this process.
+        """
+        if self._roller is None:
+            self._roller = self._newRoller()
+        for ring in self.rings.itervalues():
+            ring.fill(self._roller)
+
+    def start(self):
+        """Start topping the rings up from a new daemon process.
+        """
+        self._stop.clear()
+        self._process = multiprocessing.Process(target=self._run,
+                                                args=(self._newRoller(),))
+        self._process.daemon = True
+        self._process.start()
+
+    def stop(self):
+        """Stop the producer process, and wait for it.
+        """
+        self._stop.set()
+        self.wanted.set()
+        if self._process is not None:
+            self._process.join()
+            self._process = None
+
+    def _run(self, roller):
+        rings = self.rings.values()
+        while not self._stop.is_set():
+            for ring in rings:
+                if ring.needsFill(self.low_water):
+                    ring.fill(roller)
+            self.wanted.wait(self.interval)
+            self.wanted.clear()
+
+
+class RingDice(dice.Dice):
+    """Dice that take their rolls from shared RollRings when they can.
+
+    Rolls of a size of die with a ring (and everything built on
+    roll(), like rollsum() and dcalc's dice terms) come from the ring;
+    whatever a ring can't supply is rolled locally, and counted in
+    misses. Faces are taken from a ring take_chunk at a time and kept
+    in a small local buffer, so most rolls don't touch the ring's
+    lock at all.
+    """
+    __slots__ = ('rings', 'producer', 'take_chunk', 'misses', '_buffers')
+
+    def __init__(self, rings, producer=None, take_chunk=TAKE_CHUNK,
+                 state=None, backend=None, seed=None):
+        """Initialize the RingDice.
+
+        @param rings: A dict of RollRings, by number of sides.
+
+        @param producer: The RingProducer to nudge when a ring runs
+            dry, if any.
+
+        @param take_chunk: The least number of faces to take from a
+            ring at a time.
+        @type take_chunk: int
+        """
+        super(RingDice, self).__init__(state, backend, seed)
+        self.rings = rings
+        self.producer = producer
+        self.take_chunk = take_chunk
+        self.misses = 0
+        self._buffers = dict((sides, []) for sides in rings)
+
+    def roll(self, num=1, sides=6, mod=0, sort=False):
+        """Return a list of num random ints between 1 and sides, each += mod.
+
+        See Dice.roll().
+        """
+        buf = self._buffers.get(sides)
+        if buf is None or self._cheat_next or not isinstance(num, int) \
+           or num <= 0 or not isinstance(mod, int):
+            return super(RingDice, self).roll(num, sides, mod, sort)
+        if len(buf) < num:
+            buf.extend(self.rings[sides].take(max(num, self.take_chunk)))
+        if len(buf) >= num:
+            results = buf[-num:]
+            del buf[-num:]
+        else:
+            results = buf[:]
+            del buf[:]
+            missing = num - len(results)
+            self.misses += missing
+            if self.producer is not None:
+                self.producer.wanted.set()
+            results.extend(super(RingDice, self).roll(missing, sides))
+        if mod:
+            results = [r + mod for r in results]
+        if sort:
+            results.sort()
+        return results
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""rng -- pluggable random number generators for Dice.
+
+A backend is a subclass of random.Random that supplies its own
+random(), getrandbits(), seed(), getstate() and setstate(); everything
+else Dice needs (randrange, gauss, uniform, choice, ...) comes from
+random.Random on top of those.
+
+Backends are registered by name:
+
+    >>> r = getBackend('pcg32')(42)
+    >>> 0 <= r.random() < 1
+    True
+    >>> 'xorshift' in available()
+    True
+
+The pure-Python generators keep a couple of machine words of state
+instead of the Mersenne Twister's 625.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__version__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import os
+import random
+import binascii
+import hashlib
+import threading
+
+__all__ = ['CounterRandom', 'PCG32', 'XorShift128Plus', 'UrandomRandom', 'available', 'deriveSeed', 'entropySeed',
+           'getBackend', 'registerBackend', 'splitmix64']
+
+_M32 = 0xFFFFFFFF
+_M64 = 0xFFFFFFFFFFFFFFFF
+_GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+_RECIP_BPF = 2.0 ** -53
+
+_backends = {}
+
+
+def registerBackend(name, cls):
+    """Register a random.Random subclass as a named backend.
+    """
+    _backends[name] = cls
+
+
+def getBackend(backend):
+    """Return the generator class for a backend name or class.
+
+    @param backend: A registered backend name, or a random.Random
+        subclass, which is returned as is.
+    """
+    if isinstance(backend, type):
+        return backend
+    try:
+        return _backends[backend]
+    except KeyError:
+        raise ValueError("No RNG backend named '%s' (available: %s)"
+                         % (backend, ', '.join(sorted(_backends))))
+
+
+def available():
+    """Return the names of the registered backends.
+    """
+    return _backends.keys()
+
+
+def splitmix64(x):
+    """Return the SplitMix64 output for the 64-bit counter value x.
+
+    SplitMix64 is a strong 64-bit mixing function, used here to
+    spread small or correlated seeds over a generator's whole state.
+    """
+    z = (x + _GOLDEN_GAMMA) & _M64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _M64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _M64
+    return z ^ (z >> 31)
+
+
+def deriveSeed(seed, *path):
+    """Derive a 128-bit seed from a parent seed and a path of indices.
+
+    Distinct paths give unrelated seeds (they are hashed with
+    SHA-256), so deriveSeed(s, 0), deriveSeed(s, 1), ... seed
+    independent streams, and deriveSeed(s, 2, 5) is the sixth child
+    of the third child of s.
+
+    @param seed: The parent seed, as accepted by a backend's seed().
+    @param path: Non-negative integer indices.
+    """
+    key = ':'.join(['%x' % _seedInt(seed)] + ['%x' % p for p in path])
+    return int(hashlib.sha256(key).hexdigest()[:32], 16)
+
+
+def entropySeed():
+    """Return a fresh 128-bit seed from the operating system.
+    """
+    return int(binascii.hexlify(os.urandom(16)), 16)
+
+
+def _seedInt(a):
+    """Turn a seed argument into a non-negative integer.
+
+    None seeds from the operating system's entropy source; other
+    hashable, non-integer seeds use their hash.
+    """
+    if a is None:
+        return entropySeed()
+    if isinstance(a, (int, long)):
+        return abs(a)
+    return abs(hash(a))
+
+
+def _seedWords(a, count):
+    """Derive count 64-bit words from a seed, via SplitMix64.
+
+    Every word mixes in every 64-bit chunk of the seed, so long seeds
+    (e.g. 128 bits from os.urandom) are not truncated.
+    """
+    a = _seedInt(a)
+    chunks = []
+    while a or not chunks:
+        chunks.append(a & _M64)
+        a >>= 64
+    words = []
+    for i in range(count):
+        x = splitmix64(i)
+        for chunk in chunks:
+            x = splitmix64(x ^ chunk)
+        words.append(x)
+    return words
+
+
+class _WordRandom(random.Random):
+    """Base class for generators that produce fixed-size words.
+
+    Subclasses define _next() returning one word of WORD_BITS random
+    bits, plus seed(), getstate() and setstate().
+    """
+    WORD_BITS = 64
+
+    def random(self):
+        return self.getrandbits(53) * _RECIP_BPF
+
+    def getrandbits(self, k):
+        if k <= 0:
+            raise ValueError('number of bits must be greater than zero')
+        bits = self.WORD_BITS
+        next = self._next
+        if k <= bits:
+            return next() >> (bits - k)
+        result = 0
+        have = 0
+        while have < k:
+            result = (result << bits) | next()
+            have += bits
+        return result >> (have - k)
+
+
+class XorShift128Plus(_WordRandom):
+    """Vigna's xorshift128+ generator: 128 bits of state, 64-bit output.
+    """
+    def seed(self, a=None):
+        s0, s1 = _seedWords(a, 2)
+        if not (s0 or s1):
+            s1 = 1
+        self._s0 = s0
+        self._s1 = s1
+        self.gauss_next = None
+
+    def _next(self):
+        s1 = self._s0
+        s0 = self._s1
+        self._s0 = s0
+        s1 ^= (s1 << 23) & _M64
+        self._s1 = s1 ^ s0 ^ (s1 >> 17) ^ (s0 >> 26)
+        return (self._s1 + s0) & _M64
+
+    def getstate(self):
+        return ('xorshift128+', self._s0, self._s1, self.gauss_next)
+
+    def setstate(self, state):
+        if not (isinstance(state, tuple) and len(state) == 4
+                and state[0] == 'xorshift128+'):
+            raise ValueError('state is not a xorshift128+ state')
+        tag, self._s0, self._s1, self.gauss_next = state
+
+
+class PCG32(_WordRandom):
+    """O'Neill's PCG32 (XSH-RR) generator: 64-bit state, 32-bit output.
+    """
+    WORD_BITS = 32
+    MULTIPLIER = 6364136223846793005
+
+    def seed(self, a=None, stream=None):
+        state, inc = _seedWords(a, 2)
+        if stream is not None:
+            inc = stream
+        self._inc = ((inc << 1) | 1) & _M64
+        self._state = 0
+        self._next()
+        self._state = (self._state + state) & _M64
+        self._next()
+        self.gauss_next = None
+
+    def _next(self):
+        old = self._state
+        self._state = (old * self.MULTIPLIER + self._inc) & _M64
+        xorshifted = (((old >> 18) ^ old) >> 27) & _M32
+        rot = old >> 59
+        return (xorshifted >> rot) | ((xorshifted << ((-rot) & 31)) & _M32)
+
+    def getstate(self):
+        return ('pcg32', self._state, self._inc, self.gauss_next)
+
+    def setstate(self, state):
+        if not (isinstance(state, tuple) and len(state) == 4
+                and state[0] == 'pcg32'):
+            raise ValueError('state is not a pcg32 state')
+        tag, self._state, self._inc, self.gauss_next = state
+
+
+class CounterRandom(_WordRandom):
+    """A counter-based generator, with random access to its output.
+
+    Output is split into streams, numbered from 0. Word j of stream i
+    is a pure function of (key, i, j): stream i is the SplitMix64
+    sequence started from a hash of the key and i. So seek() can jump
+    to any stream (and position in it) in constant time, without
+    generating anything that comes before.
+
+        >>> r = CounterRandom(7)
+        >>> r.seek(1000000)
+        >>> first = r.getrandbits(64)
+        >>> r.seek(3)
+        >>> r.seek(1000000)
+        >>> r.getrandbits(64) == first
+        True
+    """
+    def seed(self, a=None):
+        self._key = _seedWords(a, 1)[0]
+        self.seek(0)
+
+    def seek(self, index, position=0):
+        """Move to the given word position of the given stream.
+        """
+        if index < 0 or position < 0:
+            raise ValueError('stream index and position must be >= 0')
+        self._index = index
+        self._base = splitmix64(self._key ^ splitmix64(index & _M64)
+                                ^ (index >> 64))
+        self._position = position
+        self.gauss_next = None
+
+    def stream(self, index):
+        """Return a new generator with this key, at the start of a stream.
+        """
+        other = self.__class__.__new__(self.__class__)
+        other._key = self._key
+        other.seek(index)
+        return other
+
+    def tell(self):
+        """Return the current (stream index, word position).
+        """
+        return (self._index, self._position)
+
+    def _next(self):
+        word = splitmix64((self._base + self._position * _GOLDEN_GAMMA) & _M64)
+        self._position += 1
+        return word
+
+    def getstate(self):
+        return ('counter', self._key, self._index, self._position,
+                self.gauss_next)
+
+    def setstate(self, state):
+        if not (isinstance(state, tuple) and len(state) == 5
+                and state[0] == 'counter'):
+            raise ValueError('state is not a counter state')
+        tag, self._key, index, position, gauss_next = state
+        self.seek(index, position)
+        self.gauss_next = gauss_next
+
+
+class UrandomRandom(random.Random):
+    """A cryptographically secure generator: the OS entropy source, buffered.
+
+    Like random.SystemRandom, but where that makes a system call for
+    every value, this reads os.urandom() CHUNK bytes at a time and
+    hands them out in turn. Each byte is handed out once: taking
+    bytes is locked against other threads, and a forked child throws
+    away the buffer it inherited. Like SystemRandom, it can't be
+    seeded, and has no state to save or restore.
+    """
+    CHUNK = 4096
+
+    def __init__(self, x=None):
+        self._lock = threading.Lock()
+        self._buffer = ''
+        self._position = 0
+        self._pid = None
+        random.Random.__init__(self, x)
+
+    def seed(self, a=None):
+        """Throw away any buffered entropy; the seed a is ignored.
+
+        OS entropy can't be seeded, so this never makes values
+        repeatable; later values are read from the OS afresh.
+        """
+        with self._lock:
+            self._buffer = ''
+            self._position = 0
+        self.gauss_next = None
+
+    def _bytes(self, n):
+        with self._lock:
+            position = self._position
+            end = position + n
+            if end > len(self._buffer) or self._pid != os.getpid():
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    position = len(self._buffer)
+                self._buffer = (self._buffer[position:]
+                                + os.urandom(max(self.CHUNK, n)))
+                position = 0
+                end = n
+            self._position = end
+            return self._buffer[position:end]
+
+    def random(self):
+        return (int(binascii.hexlify(self._bytes(7)), 16) >> 3) * _RECIP_BPF
+
+    def getrandbits(self, k):
+        if k <= 0:
+            raise ValueError('number of bits must be greater than zero')
+        n = (k + 7) // 8
+        return int(binascii.hexlify(self._bytes(n)), 16) >> (n * 8 - k)
+
+    def getstate(self):
+        raise NotImplementedError("OS entropy has no state to save; "
+                                  "UrandomRandom can't getstate()")
+
+    def setstate(self, state):
+        raise NotImplementedError("OS entropy has no state to restore; "
+                                  "UrandomRandom can't setstate()")
+
+    def jumpahead(self, n):
+        raise NotImplementedError("OS entropy has no sequence to jump "
+                                  "along; UrandomRandom can't jumpahead()")
+
+
+registerBackend('mt', random.Random)
+registerBackend('xorshift', XorShift128Plus)
+registerBackend('pcg32', PCG32)
+registerBackend('counter', CounterRandom)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""sampling -- fast, unbiased sampling primitives for Dice.
+
+The random module's randrange() does its argument checks and draws
+fresh bits for every value. The functions here instead draw all the
+bits a roll needs from the generator in one block, then carve the
+block into die faces:
+
+ - power-of-two dice take their faces straight from bit fields,
+   packing several dice into each 32-bit word;
+
+ - other dice use Lemire's nearly-divisionless method: multiply a
+   32-bit word by the bound and keep the high half, rejecting (and
+   redrawing) only in the rare case the low half lands in the biased
+   sliver. No division is done unless the fast check fails.
+
+Every draw comes from the generator, so results are unbiased and
+reproducible from its state, with no hidden buffer between calls.
+
+    >>> import random
+    >>> r = random.Random(1)
+    >>> faces = boundedInts(r, 1000, 6)
+    >>> min(faces), max(faces)
+    (0, 5)
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__version__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import struct
+import binascii
+from math import floor, log, lgamma, sqrt
+
+__all__ = ['aliasInts', 'aliasTable', 'binomial', 'boundedInts',
+           'multinomialCounts', 'randomWords']
+
+_M32 = 0xFFFFFFFF
+
+
+def randomWords(rand, n):
+    """Return a list of n random 32-bit ints, drawn from rand in one block.
+
+    @param rand: A random.Random (or backend) instance.
+    @param n: The number of words.
+    """
+    if n <= 1:
+        if n < 1:
+            return []
+        return [int(rand.getrandbits(32))]
+    data = binascii.unhexlify('%0*x' % (8 * n, rand.getrandbits(32 * n)))
+    return list(struct.unpack('>%dI' % n, data))
+
+
+def boundedInts(rand, n, bound, offset=0):
+    """Return a list of n independent, uniform random ints in [0, bound).
+
+    @param rand: A random.Random (or backend) instance.
+    @param n: The number of values.
+    @param bound: The exclusive upper bound, at least 1.
+    @param offset: A number added to every value, so the values fall
+        in [offset, offset + bound).
+    """
+    if bound > _M32 + 1:
+        randrange = rand.randrange
+        return [randrange(bound) + offset for i in xrange(n)]
+    if bound & (bound - 1) == 0:
+        return _powerOfTwoInts(rand, n, bound.bit_length() - 1, offset)
+
+    if n == 1:
+        m = int(rand.getrandbits(32)) * bound
+        if (m & _M32) < bound:
+            threshold = (_M32 + 1 - bound) % bound
+            while (m & _M32) < threshold:
+                m = int(rand.getrandbits(32)) * bound
+        return [(m >> 32) + offset]
+
+    results = randomWords(rand, n)
+    threshold = None
+    for i, x in enumerate(results):
+        m = x * bound
+        if (m & _M32) < bound:
+            if threshold is None:
+                threshold = (_M32 + 1 - bound) % bound
+            while (m & _M32) < threshold:
+                m = int(rand.getrandbits(32)) * bound
+        results[i] = (m >> 32) + offset
+    return results
+
+
+def _powerOfTwoInts(rand, n, k, offset):
+    """Return n random k-bit ints (+ offset), packing 32 // k per word.
+    """
+    if k == 0:
+        return [offset] * n
+    if n == 1:
+        return [int(rand.getrandbits(k)) + offset]
+    per_word = 32 // k
+    words = randomWords(rand, -(-n // per_word))
+    if per_word == 1:
+        shift = 32 - k
+        return [(w >> shift) + offset for w in words]
+    mask = (1 << k) - 1
+    shifts = range(0, per_word * k, k)
+    results = [((w >> s) & mask) + offset for w in words for s in shifts]
+    del results[n:]
+    return results
+
+
+def binomial(rand, n, p):
+    """Return the number of successes in n trials of probability p.
+
+    Small means use Devroye's geometric method, in O(np) time; large
+    ones use Hormann's BTRS transformed rejection, in constant
+    expected time, so even n = 10**12 costs a handful of variates.
+
+    @param rand: A random.Random (or backend) instance.
+    @param n: The number of trials, >= 0.
+    @param p: The probability of success, 0 <= p <= 1.
+    """
+    if n < 0:
+        raise ValueError('n must be non-negative')
+    if p <= 0.0 or p >= 1.0:
+        if p == 0.0:
+            return 0
+        if p == 1.0:
+            return n
+        raise ValueError('p must be in the range 0.0 <= p <= 1.0')
+    random = rand.random
+    if n == 1:
+        return int(random() < p)
+    # By symmetry, we need only handle p <= 0.5.
+    if p > 0.5:
+        return n - binomial(rand, n, 1.0 - p)
+
+    if n * p < 10.0:
+        # Count the successes by skipping geometric gaps between them.
+        x = y = 0
+        c = log(1.0 - p)
+        if not c:
+            return x
+        while True:
+            y += int(floor(log(1.0 - random()) / c)) + 1
+            if y > n:
+                return x
+            x += 1
+
+    spq = sqrt(n * p * (1.0 - p))
+    b = 1.15 + 2.53 * spq
+    a = -0.0873 + 0.0248 * b + 0.01 * p
+    c = n * p + 0.5
+    vr = 0.92 - 4.2 / b
+    alpha = None
+    while True:
+        u = random() - 0.5
+        us = 0.5 - abs(u)
+        if us <= 0.0:
+            continue
+        k = int(floor((2.0 * a / us + b) * u + c))
+        if k < 0 or k > n:
+            continue
+        v = random()
+        # The squeeze accepts most draws without the full test.
+        if us >= 0.07 and v <= vr:
+            return k
+        if alpha is None:
+            alpha = (2.83 + 5.1 / b) * spq
+            lpq = log(p / (1.0 - p))
+            m = int(floor((n + 1) * p))
+            h = lgamma(m + 1) + lgamma(n - m + 1)
+        v *= alpha / (a / (us * us) + b)
+        if v > 0.0 and log(v) <= (h - lgamma(k + 1) - lgamma(n - k + 1)
+                                  + (k - m) * lpq):
+            return k
+
+
+def multinomialCounts(rand, n, sides):
+    """Return how many of n fair sides-sided dice land on each face.
+
+    The counts are drawn face by face, each as a binomial share of the
+    dice not yet placed, in O(sides) time however large n is.
+
+    @param rand: A random.Random (or backend) instance.
+    @param n: The number of dice, >= 0.
+    @param sides: The number of faces, >= 1.
+    @return: A list of sides counts, summing to n.
+    """
+    counts = []
+    remaining = n
+    for face in xrange(sides - 1):
+        if remaining:
+            c = binomial(rand, remaining, 1.0 / (sides - face))
+        else:
+            c = 0
+        counts.append(c)
+        remaining -= c
+    counts.append(remaining)
+    return counts
+
+
+def aliasTable(weights):
+    """Build Walker's alias table for drawing indices with the given weights.
+
+    Vose's construction: every index gets an equal-width column, filled
+    up to its own share and topped off by one other ("alias") index, so
+    a draw needs only one uniform variate and no search.
+
+    @param weights: A list of non-negative weights, not all zero.
+    @return: (cutoffs, aliases), two lists as long as weights.
+    """
+    n = len(weights)
+    total = float(sum(weights))
+    scaled = [w * n / total for w in weights]
+    cutoffs = [1.0] * n
+    aliases = range(n)
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s = small.pop()
+        l = large[-1]
+        cutoffs[s] = scaled[s]
+        aliases[s] = l
+        scaled[l] -= 1.0 - scaled[s]
+        if scaled[l] < 1.0:
+            small.append(large.pop())
+    # Whatever is left is 1.0, give or take rounding.
+    return cutoffs, aliases
+
+
+def aliasInts(rand, n, table, offset=0):
+    """Return a list of n indices drawn from an alias table (+ offset).
+
+    @param rand: A random.Random (or backend) instance.
+    @param n: The number of values.
+    @param table: (cutoffs, aliases), as returned by aliasTable().
+    @param offset: A number added to every value.
+    """
+    cutoffs, aliases = table
+    size = len(cutoffs)
+    random = rand.random
+    results = []
+    append = results.append
+    for i in xrange(n):
+        x = random() * size
+        column = int(x)
+        if x - column < cutoffs[column]:
+            append(column + offset)
+        else:
+            append(aliases[column] + offset)
+    return results
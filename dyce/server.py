@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""server -- serve dice rolls and table rolls as JSON, locally.
+
+    python -m dyce.server --unix /tmp/dyce.sock --table stars=stars.ini
+    python -m dyce.server --http localhost:8765
+
+A request is a JSON object:
+
+    {"expr": "3d6+2"}                   -> {"result": 13}
+    {"expr": "1d20", "count": 3}        -> {"result": [4, 17, 9]}
+    {"table": "stars", "section": "arity"}
+                                        -> {"result": "1"}
+
+and the response is a JSON object with either a "result" or an
+"error". A JSON list of requests is a batch, answered by a list of
+responses, in order; plain requests in a batch (with only an "expr")
+are rolled together, an expression at a time.
+
+Over a Unix socket, requests and responses are one per line, so a
+client may pipeline: send many lines and read the answers as they
+come. Over HTTP, POST a request (or batch) as the body, or GET with
+the request's fields as query parameters; connections are kept alive.
+
+Without a client, requests roll with the module roller. A request
+naming a "client" rolls with that client's own stream instead, and
+adding a "seed" (re)starts the stream from that seed, so a client can
+replay its rolls. Each Unix socket connection is a client of its own,
+unless its requests name another.
+
+Expressions may read dcalc variables, but not "set" them, since they
+are shared by the whole process. A request may ask for at most
+MAX_COUNT results, each rolling at most MAX_DICE dice (counted over
+all of the expression's dice terms); bigger requests get an error.
+
+$Author$\n
+$Rev$\n
+$Date$
+"""
+
+__author__ = "$Author$"[9:-2]
+__version__ = "$Rev$"[6:-2]
+__date__ = "$Date$"[7:-2]
+
+import os
+import sys
+import json
+import stat
+import errno
+import socket
+import threading
+import urlparse
+import itertools
+import SocketServer
+import BaseHTTPServer
+from optparse import OptionParser
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict
+
+import dice
+import aio
+import dcalc
+import tables
+
+import logging
+logger = logging.getLogger('server')
+
+__all__ = ['Dispatcher', 'HTTPRollServer', 'UnixRollServer', 'main']
+
+# The number of client streams kept; the least recently used go first.
+MAX_CLIENTS = 1024
+
+# The largest count a single request may ask for.
+MAX_COUNT = 1000000
+
+# The most dice one evaluation of a requested expression may roll.
+MAX_DICE = 10000
+
+
+def _diceIn(tree):
+    """Return how many dice one evaluation of an expression tree rolls.
+    """
+    if tree[0] in ('dice', 'keep'):
+        return max(tree[1], 0)
+    return sum([_diceIn(child) for child in tree[1:]
+                if isinstance(child, tuple)])
+
+
+class Dispatcher(object):
+    """Answers requests, keeping a Dice stream per named client.
+    """
+    def __init__(self, roller=None):
+        """Initialize the Dispatcher.
+
+        @param roller: The Dice for requests without a client;
+            defaults to dice.roller.
+        """
+        if roller is None:
+            roller = dice.roller
+        self.roller = roller
+        self._streams = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stream(self, client, seed=None):
+        """Return the Dice for the named client, seeding it if asked.
+        """
+        with self._lock:
+            if seed is None:
+                try:
+                    roller = self._streams.pop(client)
+                except KeyError:
+                    roller = dice.Dice()
+            else:
+                self._streams.pop(client, None)
+                roller = dice.Dice(seed=seed)
+            while len(self._streams) >= MAX_CLIENTS:
+                self._streams.pop(next(iter(self._streams)))
+            self._streams[client] = roller
+        return roller
+
+    def handle(self, request, client=None):
+        """Answer one request, or a batch (list) of them.
+
+        @param client: The client to roll for, unless the request
+            names one.
+        """
+        if isinstance(request, list):
+            return self._handleBatch(request, client)
+        try:
+            return {'result': self._answer(request, client)}
+        except Exception, e:
+            logger.info('Bad request %r: %s', request, e)
+            return {'error': '%s: %s' % (e.__class__.__name__, e)}
+
+    def _handleBatch(self, requests, client):
+        """Answer a batch, rolling plain requests for each expression
+        (those with only an "expr") together.
+        """
+        responses = [None] * len(requests)
+        groups = {}
+        for i, request in enumerate(requests):
+            if isinstance(request, dict) and request.keys() == ['expr']:
+                groups.setdefault(request['expr'], []).append(i)
+            else:
+                responses[i] = self.handle(request, client)
+        for expr, indices in groups.iteritems():
+            grouped = self.handle({'expr': expr, 'count': len(indices)},
+                                  client)
+            if 'error' in grouped:
+                for i in indices:
+                    responses[i] = grouped
+            else:
+                for i, result in zip(indices, grouped['result']):
+                    responses[i] = {'result': result}
+        return responses
+
+    def _answer(self, request, client):
+        if not isinstance(request, dict):
+            raise ValueError('a request must be a JSON object')
+        client = request.get('client', client)
+        seed = request.get('seed')
+        if seed is not None:
+            # Query parameters arrive as strings.
+            seed = int(seed)
+        if client is None:
+            if seed is not None:
+                raise ValueError('a seed needs a client')
+            roller = self.roller
+        else:
+            roller = self.stream(client, seed)
+
+        if 'expr' in request:
+            expr = str(request['expr'])
+            expression = dcalc.cache.compile(expr)
+            if expression is not None:
+                if expression.goal == 'set':
+                    raise ValueError("can't assign in a request: %r"
+                                     % (expr,))
+                if _diceIn(expression.tree) > MAX_DICE:
+                    raise ValueError('too many dice in %r; at most %s'
+                                     % (expr, MAX_DICE))
+            count = request.get('count')
+            if count is None:
+                results = aio.evaluate(expr, 1, roller)
+            else:
+                count = int(count)
+                if not (0 <= count <= MAX_COUNT):
+                    raise ValueError('count out of range; must be in 0..%s'
+                                     % MAX_COUNT)
+                results = aio.evaluate(expr, count, roller)
+            # The parser reports syntax errors, and returns None.
+            if None in results:
+                raise SyntaxError('could not parse %r' % (expr,))
+            if count is None:
+                return results[0]
+            return results
+        elif 'table' in request:
+            tbl = tables.getTable(request['table'])
+            section = request.get('section')
+            if section:
+                for name in section.split('/'):
+                    tbl = tbl[name]
+            return tables.rollTable(tbl, int(request.get('mod', 0)), roller)
+        elif seed is not None:
+            return None
+        raise ValueError('a request needs an "expr" or a "table"')
+
+
+class _LineHandler(SocketServer.StreamRequestHandler):
+    """Answers newline-delimited JSON requests on a stream socket.
+    """
+    _connections = itertools.count()
+
+    def handle(self):
+        client = 'connection-%s' % next(self._connections)
+        dispatcher = self.server.dispatcher
+        for line in iter(self.rfile.readline, ''):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError, e:
+                response = {'error': 'ValueError: %s' % (e,)}
+            else:
+                response = dispatcher.handle(request, client)
+            self.wfile.write(json.dumps(response) + '\n')
+
+
+def _removeStaleSocket(path):
+    """Remove the socket at path if nothing listens on it.
+
+    Raise socket.error if path is not a socket, or is in use.
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except OSError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise socket.error(errno.EEXIST, 'not a socket: %s' % (path,))
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error:
+        logger.info('Removing stale socket %s', path)
+        os.unlink(path)
+    else:
+        raise socket.error(errno.EADDRINUSE, 'socket in use: %s' % (path,))
+    finally:
+        probe.close()
+
+
+class UnixRollServer(SocketServer.ThreadingMixIn,
+                     SocketServer.UnixStreamServer):
+    """Serves requests over a Unix domain socket, a line at a time.
+    """
+    daemon_threads = True
+
+    def __init__(self, path, dispatcher=None):
+        """Initialize the UnixRollServer, bound to path.
+
+        A socket left at path by a server that is gone is replaced;
+        anything else there raises socket.error.
+        """
+        _removeStaleSocket(path)
+        SocketServer.UnixStreamServer.__init__(self, path, _LineHandler)
+        self.dispatcher = dispatcher or Dispatcher()
+
+
+class _HTTPHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers JSON requests over HTTP.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Buffer each response, and send it without waiting on Nagle.
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        query = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+        request = dict((k, v[-1]) for k, v in query.iteritems())
+        self._respond(self.server.dispatcher.handle(request))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            request = json.loads(body)
+        except ValueError, e:
+            self._respond({'error': 'ValueError: %s' % (e,)}, 400)
+        else:
+            self._respond(self.server.dispatcher.handle(request))
+
+    def _respond(self, response, status=200):
+        body = json.dumps(response)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class HTTPRollServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Serves requests over HTTP.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, dispatcher=None):
+        BaseHTTPServer.HTTPServer.__init__(self, address, _HTTPHandler)
+        self.dispatcher = dispatcher or Dispatcher()
+
+
+def main(argv=None):
+    """Run a roll server from the command line.
+    """
+    parser = OptionParser(usage='python -m dyce.server [options]')
+    parser.add_option('--unix', metavar='PATH',
+                      help='serve on the Unix domain socket at PATH')
+    parser.add_option('--http', metavar='[HOST:]PORT',
+                      help='serve HTTP at HOST:PORT (default localhost)')
+    parser.add_option('--table', metavar='NAME=PATH', action='append',
+                      default=[], help='load the table at PATH as NAME')
+    parser.add_option('--seed', type='int',
+                      help='seed the roll stream for requests without a client')
+    options, args = parser.parse_args(argv)
+    if not (options.unix or options.http):
+        parser.error('give --unix or --http (or both)')
+
+    for spec in options.table:
+        name, path = spec.split('=', 1)
+        tables.loadTable(path, name)
+    roller = None
+    if options.seed is not None:
+        roller = dice.Dice(seed=options.seed)
+    dispatcher = Dispatcher(roller)
+
+    servers = []
+    if options.unix:
+        servers.append(UnixRollServer(options.unix, dispatcher))
+    if options.http:
+        host, _, port = options.http.rpartition(':')
+        servers.append(HTTPRollServer((host or 'localhost', int(port)),
+                                      dispatcher))
+    for server in servers[1:]:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+    print >>sys.stderr, 'Serving dice on %s' % ', '.join(
+        [str(s.server_address) for s in servers])
+    try:
+        servers[0].serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if options.unix and os.path.exists(options.unix):
+            os.unlink(options.unix)
+
+
+if __name__ == '__main__':
+    main()
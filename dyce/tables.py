@@ -41,8 +41,11 @@ def loadTable(fo, name):
     return co
 
 
-def rollTable(tbl, mod=0):
+def rollTable(tbl, mod=0, roller=None):
     """Roll against a dice/result table.
+
+    roller is the Dice to roll with (see dcalc.calculate()); rerolls
+    use the same one.
     """
     logger.info("Dice spec: %s", tbl['dice'],)
     try:
@@ -53,7 +56,7 @@ def rollTable(tbl, mod=0):
     except KeyError:
         rolls = []
     
-    r = dcalc.calculate(tbl['dice'])
+    r = dcalc.calculate(tbl['dice'], roller)
     logger.info("Roll: %s", r,)
     result = r
     if r in rolls:
@@ -73,9 +76,9 @@ no corresponding index for roll in
     if str(result).startswith('reroll'):
         if ':' in result:
             new_tbl = tbl[result.split(':', 1)[1]]
-            result = rollTable(new_tbl)
+            result = rollTable(new_tbl, roller=roller)
         else:
-            result = rollTable(tbl)
+            result = rollTable(tbl, roller=roller)
     elif result == 'None':
         result = None
 
@@ -35,6 +35,13 @@ __path__ = path(__file__).abspath().dirname()
 
 INSTALL_REQUIRES=['ConfigObj>=4.5.3', 
                   ]
+# Optional: NumPy speeds up batches; trollius (asyncio for Python 2)
+# is needed by dyce.aio, and futures by montecarlo's process pool and
+# aio's executor.
+EXTRAS_REQUIRE={'numpy': ['numpy'],
+                'aio': ['trollius', 'futures'],
+                'montecarlo': ['futures'],
+                }
 ZIP_SAFE = True
 
 setup(
@@ -61,6 +68,7 @@ setup(
     exclude_package_data = {'': ['*.c', '*.h', '*.pyx', '*.pxd', '*.g']},
 
     install_requires=INSTALL_REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
     zip_safe = ZIP_SAFE,
 
     test_suite = "nose.collector",
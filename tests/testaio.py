@@ -0,0 +1,89 @@
+"""testaio - unit tests for coalesced async dice calculations
+
+$Author$
+$Rev$
+$Date$
+"""
+
+__author__ = "$Author$"
+__version__ = "$Rev$"
+__date__ = "$Date$"
+
+import unittest
+
+import dyce
+from dyce import aio
+
+
+class EvaluateTest(unittest.TestCase):
+    def testEvaluate(self):
+        """groups should roll in range, batched or not"""
+        for expr, low, high in [('1d20+5', 6, 25), (' 3d6 - 2', 1, 16),
+                                ('2d6 * 2', 4, 24)]:
+            results = aio.evaluate(expr, 500, dyce.Dice())
+            self.assertEqual(len(results), 500)
+            assert low <= min(results) and max(results) <= high, expr
+            self.assert_(all(isinstance(r, int) for r in results))
+
+
+class RollServiceTest(unittest.TestCase):
+    def setUp(self):
+        if aio.asyncio is None:
+            self.skipTest('needs asyncio or trollius')
+        self.loop = aio.asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def gather(self, futures):
+        return self.loop.run_until_complete(
+            aio.asyncio.gather(*futures, loop=self.loop))
+
+    def testCoalesce(self):
+        """waiting requests should roll together, each getting a result"""
+        service = aio.RollService(window=10, max_batch=100, loop=self.loop)
+        futures = [service.calculate('1d20+5') for i in range(99)]
+        self.assertFalse(futures[0].done())
+        futures.append(service.calculate('2d6'))
+        # The 100th request fills the batch, which rolls at once.
+        self.assert_(all(f.done() for f in futures))
+        results = self.gather(futures)
+        assert 6 <= min(results[:99]) and max(results[:99]) <= 25
+        assert 2 <= results[99] <= 12
+
+    def testWindow(self):
+        """requests should roll when the window closes"""
+        service = aio.RollService(window=0.001, loop=self.loop)
+        results = self.gather([service.calculate('3d6') for i in range(10)])
+        self.assertEqual(len(results), 10)
+
+    def testExecutor(self):
+        """groups should roll in the executor, when given one"""
+        try:
+            from concurrent.futures import ThreadPoolExecutor
+        except ImportError:
+            self.skipTest('needs concurrent.futures')
+        executor = ThreadPoolExecutor(2)
+        service = aio.RollService(executor=executor, loop=self.loop)
+        results = self.gather([service.calculate('1d6') for i in range(20)]
+                              + [service.calculate('[1 4]')])
+        executor.shutdown()
+        assert 1 <= min(results) and max(results) <= 6
+
+    def testModuleLoops(self):
+        """the module calculate() should work on one loop after another"""
+        aio.asyncio.set_event_loop(self.loop)
+        try:
+            first = self.gather([aio.calculate('1d6') for i in range(5)])
+            self.loop.close()
+            self.loop = aio.asyncio.new_event_loop()
+            aio.asyncio.set_event_loop(self.loop)
+            second = self.gather([aio.calculate('1d6') for i in range(5)])
+        finally:
+            aio.asyncio.set_event_loop(None)
+        self.assertEqual(len(first + second), 10)
+        self.assertEqual(len(aio._services), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
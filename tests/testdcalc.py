@@ -0,0 +1,268 @@
+"""testdcalc - unit tests for the dice calculator
+
+$Author$
+$Rev$
+$Date$
+"""
+
+__author__ = "$Author$"
+__version__ = "$Rev$"
+__date__ = "$Date$"
+
+import unittest
+from fractions import Fraction
+
+import dyce
+from dyce import dcalc, distribution
+
+
+class CalculateTest(unittest.TestCase):
+    def testArithmetic(self):
+        """plain arithmetic should evaluate"""
+        self.assertEqual(dcalc.calculate('1 + 2 * 3'), 7)
+        self.assertEqual(dcalc.calculate('(1 + 2) * 3'), 9)
+        self.assertEqual(dcalc.calculate('let x = 4 in x * x'), 16)
+
+    def testRanges(self):
+        """dice terms should fall in range"""
+        for i in range(50):
+            assert 3 <= dcalc.calculate('3d6') <= 18
+            assert 1 <= dcalc.calculate('[1 4]') <= 4
+            assert 1.0 <= dcalc.calculate('{1.0 2.0}') <= 2.0
+            assert 1 <= dcalc.calculate('bell[1 10]') <= 10
+            assert 9.0 <= dcalc.calculate('fuzz(10, 0.1)') <= 11.0
+
+    def testKeep(self):
+        """keep and drop terms should sum the kept dice"""
+        self.assertEqual(dcalc.dkeep('4d6kh3'), (4, 6, 3, True))
+        self.assertEqual(dcalc.dkeep('2d20kl1'), (2, 20, 1, False))
+        self.assertEqual(dcalc.dkeep('4d6dl1'), (4, 6, 3, True))
+        self.assertEqual(dcalc.dkeep('2d20dh1'), (2, 20, 1, False))
+        for i in range(50):
+            assert 3 <= dcalc.calculate('4d6kh3') <= 18
+            assert 6 <= dcalc.calculate('2d20k1 + 5') <= 25
+            assert 3 <= dcalc.calculate('4d6d1') <= 18
+        self.assertEqual(dcalc.calculate('3d1kl2 * 2'), 4)
+        self.assertEqual(dcalc.calculate('4d6kh0'), 0)
+        self.assertEqual(dcalc.calculate('4d1dl4'), 0)
+
+    def testBadKeep(self):
+        """impossible keep and drop terms should be syntax errors"""
+        for expr in ['4d6dh5', '4d6kh5', '0d6kh1', '3d0k1', '1 + 2d6kl3']:
+            self.assertEqual(dcalc.calculate(expr), None)
+
+    def testRoller(self):
+        """calculations should use the given roller"""
+        expr = '3d6 + [1 4] * {1.0 2.0} + bell[1 10] + fuzz(2d6, 0.5)'
+        a = dcalc.calculate(expr, dyce.Dice(seed=11))
+        b = dcalc.calculate(expr, dyce.Dice(seed=11))
+        self.assertEqual(a, b)
+        d = dyce.CounterDice(key=3)
+        self.assertEqual(dcalc.Dstr(expr)(d.at(8)), dcalc.Dstr(expr)(d.at(8)))
+
+
+class CompileTest(unittest.TestCase):
+    def testSameRolls(self):
+        """a compiled expression should roll as calculate() does"""
+        expr = 'let x = 2d6 in x * [1 4] - fuzz(4d6kh3, 0.5) / 2'
+        compiled = dcalc.compile(expr)
+        for seed in range(10):
+            self.assertEqual(compiled(dyce.Dice(seed=seed)),
+                             dcalc.calculate(expr, dyce.Dice(seed=seed)))
+
+    def testTree(self):
+        """compiling should build a tree of tuples, once"""
+        compiled = dcalc.compile('1 + 2 * x')
+        self.assertEqual(compiled.tree,
+                         ('+', ('num', 1), ('*', ('num', 2), ('var', 'x'))))
+        d = dcalc.Dstr('3d6')
+        d()
+        tree = d._compiled
+        d()
+        self.assert_(d._compiled is tree)
+        self.assertEqual(dcalc.compile('3d6 +'), None)
+
+    def testCodegen(self):
+        """generated code should roll as walking the tree does"""
+        for expr in ['3d6+2*bell[1 10]', '1d6 + (let x = 1d4 in x * 2)',
+                     'let x = 2d6 in (let x = 1d4 in x) + x * zz',
+                     'fuzz(fuzz(4d6kh3, 0.5), 2) - {1.0 2.0} / -2']:
+            tree = dcalc.compile(expr).tree
+            function = dcalc.codegen(tree)
+            for seed in range(5):
+                self.assertEqual(function(dyce.Dice(seed=seed)),
+                                 dcalc.evaluate(tree, dyce.Dice(seed=seed)))
+
+    def testHotExpressions(self):
+        """expressions should switch to generated code once hot"""
+        compiled = dcalc.compile('3d6 + [1 4]')
+        for i in range(dcalc.CODEGEN_CALLS):
+            compiled()
+        self.assertEqual(compiled._function, None)
+        assert 4 <= compiled() <= 22
+        self.assertNotEqual(compiled._function, None)
+
+    def testGoals(self):
+        """set and u() goals should still assign and label"""
+        try:
+            self.assertEqual(dcalc.calculate('set level 3 * 2'), 6)
+            self.assertEqual(dcalc.calculate('level + 1'), 7)
+            self.assertEqual(dcalc.calculate('u(level, hp)'), (6, 'hp'))
+        finally:
+            dcalc.globalvars.pop('level', None)
+
+
+class ParseTest(unittest.TestCase):
+    def testParseRolls(self):
+        """parse('goal', ...) should return rolled values, as it always has"""
+        self.assertEqual(dcalc.parse('goal', '1 + 2 * 3'), 7)
+        for i in range(20):
+            assert 3 <= dcalc.parse('goal', '3d6') <= 18
+        self.assertEqual(dcalc.parse('goal', 'u(2 + 2, hp)'), (4, 'hp'))
+        try:
+            self.assertEqual(dcalc.parse('goal', 'set parsed 5'), 5)
+            self.assertEqual(dcalc.globalvars['parsed'], 5)
+        finally:
+            dcalc.globalvars.pop('parsed', None)
+        self.assertEqual(dcalc.parse('expr', '2 * 4'), 8)
+        self.assertEqual(dcalc.parse('goal', '3d6 +'), None)
+
+    def testParseTree(self):
+        """parseTree() should return the tree a rule builds"""
+        self.assertEqual(dcalc.parseTree('goal', '3d6'),
+                         ('value', None, ('dice', 3, 6, 0)))
+        self.assertEqual(dcalc.parseTree('expr', '1 + x'),
+                         ('+', ('num', 1), ('var', 'x')))
+
+
+class ExpressionCacheTest(unittest.TestCase):
+    def testLRU(self):
+        """the cache should keep the most recently used expressions"""
+        cache = dcalc.ExpressionCache(size=2)
+        first = cache.compile('1d6')
+        self.assert_(cache.compile('1d6') is first)
+        cache.compile('2d6')
+        cache.compile('1d6')
+        cache.compile('3d6')
+        self.assertEqual(len(cache), 2)
+        self.assert_(cache.compile('1d6') is first)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']),
+                         (3, 3, 1))
+        self.assertEqual(cache.compile('3d6 +'), None)
+        self.assertEqual(len(cache), 2)
+
+    def testConfigure(self):
+        """the cache should shrink, expire and switch off at run time"""
+        cache = dcalc.ExpressionCache(size=10)
+        for n in range(1, 6):
+            cache.compile('%dd6' % n)
+        cache.configure(size=3)
+        self.assertEqual(len(cache), 3)
+        cache.configure(ttl=-1)
+        cache.compile('6d6')
+        cache.compile('6d6')
+        self.assertEqual(cache.stats()['expirations'], 1)
+        cache.configure(size=0, ttl=None)
+        self.assertEqual(len(cache), 0)
+        self.assertNotEqual(cache.compile('1d6'), None)
+        self.assertEqual(len(cache), 0)
+        cache.clear()
+        self.assertEqual(cache.stats()['misses'], 0)
+
+    def testCalculate(self):
+        """calculate() should compile each string once"""
+        dcalc.cache.clear()
+        for i in range(5):
+            dcalc.calculate('2d4 + 1')
+        self.assertEqual(dcalc.cache.stats()['misses'], 1)
+        self.assertEqual(dcalc.cache.stats()['hits'], 4)
+
+
+class SampleTest(unittest.TestCase):
+    def setUp(self):
+        self.numpy = dyce.dice.numpy, dcalc.numpy
+
+    def tearDown(self):
+        dyce.dice.numpy, dcalc.numpy = self.numpy
+
+    def checkSample(self):
+        d = dyce.Dice(seed=4)
+        samples = dcalc.sample('fuzz(2d6*10, 0.1) + [1 5]', 2000, d)
+        self.assertEqual(len(samples), 2000)
+        assert 19.0 <= min(samples) and max(samples) <= 137.0
+        mean = sum(samples) / len(samples)
+        assert 70 < mean < 76, mean
+        # A let variable holds one value per sample.
+        self.assertEqual(set(dcalc.sample('let x = 3d6 in x - x', 50, d)),
+                         set([0]))
+        self.assertEqual(list(dcalc.sample('7 / 2', 3, d)), [3, 3, 3])
+        for r in dcalc.sample('4d6kh3 + bell[1 10] * bell{1.0 2.0}', 100, d):
+            assert 4.0 <= r <= 38.0, r
+        samples, name = dcalc.sample('u(2d6, hp)', 10, d)
+        self.assertEqual((len(samples), name), (10, 'hp'))
+
+    def testNumpySample(self):
+        """samples should be in range, per sample (NumPy, if present)"""
+        self.checkSample()
+
+    def testPurePythonSample(self):
+        """samples should be in range, per sample, without NumPy"""
+        dyce.dice.numpy = dcalc.numpy = None
+        self.checkSample()
+        self.assertEqual(dcalc.sample('3d6', 5).typecode, 'l')
+
+    def testBadSample(self):
+        """sample() should refuse assignments, and divide as Python does"""
+        self.assertRaises(ValueError, dcalc.sample, 'set x 1d6', 10)
+        self.assertRaises(ZeroDivisionError, dcalc.sample, '1d6 / 0', 10)
+
+
+class DistributionTest(unittest.TestCase):
+    def testIndependentTerms(self):
+        """independent terms should convolve"""
+        self.assertEqual(dcalc.distribution('2d6+1d8-2'),
+                         distribution.rollsum(2, 6) + distribution.rollsum(1, 8)
+                         - 2)
+        d = dcalc.distribution('[1 4] * 2')
+        self.assertEqual(d.items(), [(2, 1), (4, 1), (6, 1), (8, 1)])
+        self.assertEqual(dcalc.distribution('7 / 2 + 1d2').min(), 4)
+
+    def testLet(self):
+        """a let variable should take one value per result"""
+        d = dcalc.distribution('let x = 1d6 in x*x')
+        self.assertEqual(len(d), 6)
+        self.assertEqual(d.pmf(36), Fraction(1, 6))
+        d = dcalc.distribution('let x = 1d6 in (let x = 1d4 in x) + x')
+        self.assertEqual(d, distribution.rollsum(1, 4) + distribution.rollsum())
+        self.assertEqual(
+            dcalc.distribution('let x = 2d6 in x - x').probabilities(),
+            [(0, 1)])
+
+    def testAgreesWithSamples(self):
+        """means should agree with sampled means"""
+        expr = 'let x = 2d6 in let y = x + 1d4 in x * y - 4d6kh3 / [1 3]'
+        mean = float(dcalc.distribution(expr).mean())
+        samples = dcalc.sample(expr, 20000, dyce.Dice(seed=9))
+        assert abs(sum(samples) / float(len(samples)) - mean) < 1.0, mean
+
+    def testRefusals(self):
+        """continuous terms, assignments and zero divisors should raise"""
+        for expr in ['fuzz(3d6, 0.5)', '{1.0 2.0} + 1', 'bell{1.0 2.0}',
+                     'set x 3d6']:
+            self.assertRaises(ValueError, dcalc.distribution, expr)
+        self.assertRaises(ZeroDivisionError, dcalc.distribution, '6 / [0 1]')
+
+    def testGlobals(self):
+        """results should follow the global variables they use"""
+        try:
+            dcalc.calculate('set bonus 2')
+            self.assertEqual(dcalc.distribution('1d4 + bonus').min(), 3)
+            dcalc.calculate('set bonus 5')
+            self.assertEqual(dcalc.distribution('1d4 + bonus').min(), 6)
+        finally:
+            dcalc.globalvars.pop('bonus', None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,7 +13,7 @@ import unittest
 from StringIO import StringIO
 
 import dyce
-from dyce import tables
+from dyce import dcalc, tables
 
 
 class DiceStringParserTest(unittest.TestCase):
@@ -130,6 +130,725 @@ class DiceRanges(SimpleDiceTestCase):
                         assert r >= n+m, "%sd%s+%s rolled less than %s" % (n,k,m,n+m)
                         assert r <= n*k+m, "%sd%s+%s rolled greater than %s" % (n,k,m,n*k+m)
     
+class BatchRollTest(unittest.TestCase):
+    def setUp(self):
+        self.state = dyce.Dice().rand.getstate()
+        self.numpy = dyce.dice.numpy
+
+    def tearDown(self):
+        dyce.dice.numpy = self.numpy
+
+    def checkBatch(self):
+        d = dyce.Dice(state=self.state)
+        rolls = d.roll_batch(200, 3, 6, 1)
+        self.assertEqual(len(rolls), 200)
+        for row in rolls:
+            self.assertEqual(len(row), 3)
+            for r in row:
+                assert 2 <= r <= 7, "3d6+1 die rolled %s" % r
+        sums = d.rollsum_batch(200, 3, 6, 0, 2)
+        self.assertEqual(len(sums), 200)
+        for r in sums:
+            assert 5 <= r <= 20, "3d6+2 rolled %s" % r
+
+        d2 = dyce.Dice(state=self.state)
+        self.assertEqual([list(row) for row in d2.roll_batch(200, 3, 6, 1)],
+                         [list(row) for row in rolls])
+        self.assertEqual(list(d2.rollsum_batch(200, 3, 6, 0, 2)), list(sums))
+
+        ints = d.randint_batch(200, -2, 2)
+        self.assertEqual(sorted(set(ints)), [-2, -1, 0, 1, 2])
+        for r in d.uniform_batch(200, 1.0, 2.0):
+            assert 1.0 <= r <= 2.0, r
+        for r in d.fuzz_batch([10] * 200, 0.5):
+            assert 5.0 <= r <= 15.0, r
+
+    def testNumpyBatch(self):
+        """batches should be in range and reproducible (NumPy, if present)"""
+        self.checkBatch()
+
+    def testPurePythonBatch(self):
+        """batches should be in range and reproducible without NumPy"""
+        dyce.dice.numpy = None
+        self.checkBatch()
+
+    def testSortedBatch(self):
+        """batched trials should sort per trial"""
+        for row in dyce.Dice().roll_batch(50, 6, 6, sort=True):
+            self.assertEqual(list(row), sorted(row))
+
+    def testBadBatch(self):
+        """batches should reject bad trial counts"""
+        d = dyce.Dice()
+        self.assertRaises(dyce.OutOfRangeError, d.roll_batch, -1)
+        self.assertRaises(dyce.NotIntegerError, d.rollsum_batch, 'foo')
+
+    def testRandintMatchesBatch(self):
+        """single randint draws should match pure-Python randint_batch"""
+        dyce.dice.numpy = None
+        d1 = dyce.Dice(state=self.state)
+        d2 = dyce.Dice(state=self.state)
+        for a, b in [(1, 6), (-2, 2), (0, 1000000007), (5, 5)]:
+            self.assertEqual([d1.randint(a, b) for i in range(50)],
+                             [d2.randint_batch(1, a, b)[0] for i in range(50)])
+        self.assertRaises(dyce.OutOfRangeError, d1.randint, 2, 1)
+
+
+class SumTableTest(unittest.TestCase):
+    def testTableRange(self):
+        """table sums of XdD+M should return X+X*M <= R <= X*D+X*M"""
+        d = dyce.Dice()
+        for n, k, m in [(1, 6, 0), (3, 6, 1), (40, 10, -2), (500, 4, 0)]:
+            for i in range(200):
+                r = d.rollsum(n, k, m, 2, table=True)
+                assert n+n*m+2 <= r <= n*k+n*m+2, \
+                    "%sd%s+%s rolled %s" % (n, k, m, r)
+
+    def testTableValues(self):
+        """sum tables should hold the cumulative distribution"""
+        numpy = dyce.dice.numpy
+        try:
+            for dyce.dice.numpy in (numpy, None):
+                dyce.dice._sum_tables.clear()
+                table = dyce.dice._sumTable(2, 6)
+                expected = [1, 3, 6, 10, 15, 21, 26, 30, 33, 35, 36]
+                for t, e in zip(table, expected):
+                    self.assertAlmostEqual(t, e / 36.0)
+        finally:
+            dyce.dice.numpy = numpy
+            dyce.dice._sum_tables.clear()
+
+    def testHugeTables(self):
+        """tables too big to build should fall back to rolling each die"""
+        import time
+        numpy = dyce.dice.numpy
+        d = dyce.Dice()
+        try:
+            for dyce.dice.numpy in (numpy, None):
+                dyce.dice._sum_tables.clear()
+                start = time.time()
+                assert 1000 <= d.rollsum(1000, 100, table=True) <= 100000
+                assert 10**6 <= d.rollsum(10**6, 100, table=True) <= 10**8
+                assert time.time() - start < 5
+            self.assertEqual(dyce.dice._sumTable(10**6, 100), None)
+        finally:
+            dyce.dice.numpy = numpy
+            dyce.dice._sum_tables.clear()
+
+    def testLRUCache(self):
+        """table caches should drop the least recently used entry"""
+        cache = dyce.dice._LRUCache()
+        cache.put('a', 1, 2)
+        cache.put('b', 2, 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3, 2)
+        self.assertEqual((cache.peek('a'), cache.peek('b'), cache.get('c')),
+                         (1, None, 3))
+        self.assertEqual(len(cache), 2)
+
+    def testTableCacheBounded(self):
+        """the sum table cache should stay bounded"""
+        d = dyce.Dice()
+        for n in range(1, dyce.dice.SUM_TABLE_CACHE_SIZE + 10):
+            d.rollsum(n, 4, table=True)
+        assert len(dyce.dice._sum_tables) <= dyce.dice.SUM_TABLE_CACHE_SIZE
+
+
+class BackendTest(unittest.TestCase):
+    def testBackends(self):
+        """every backend should roll in range, and reset reproducibly"""
+        state = dyce.Dice().init_state
+        for name in dyce.dice.rng.available():
+            d = dyce.Dice(state=state, backend=name)
+            rolls = d.roll(50, 6)
+            for r in rolls:
+                assert 1 <= r <= 6, "%s rolled %s on a d6" % (name, r)
+            assert 1 <= d.rollbellInt(1, 10) <= 10
+            d.fuzz(10, 0.5)
+            d.reset()
+            self.assertEqual(d.roll(50, 6), rolls)
+            d2 = dyce.Dice(state=state, backend=name)
+            self.assertEqual(d2.roll(50, 6), rolls)
+
+    def testNativeState(self):
+        """a backend's own state should restore it exactly"""
+        d = dyce.Dice(backend='pcg32')
+        d.roll(10)
+        d2 = dyce.Dice(state=d.rand.getstate(), backend='pcg32')
+        self.assertEqual(d.roll(20), d2.roll(20))
+
+    def testUnknownBackend(self):
+        """unknown backends should be refused"""
+        self.assertRaises(ValueError, dyce.Dice, backend='no-such-rng')
+
+    def testSetBackend(self):
+        """switching the default backend should switch the roller"""
+        try:
+            dyce.setBackend('xorshift')
+            assert isinstance(dyce.roller.rand, dyce.dice.rng.XorShift128Plus)
+            assert isinstance(dyce.Dice().rand, dyce.dice.rng.XorShift128Plus)
+            assert 3 <= dyce.calculate('3d6') <= 18
+            assert 1 <= dyce.calculate('[1 4]') <= 4
+        finally:
+            dyce.setBackend('mt')
+
+
+class SpawnTest(unittest.TestCase):
+    def testDefaultDiceDiffer(self):
+        """default Dice should not share a stream"""
+        self.assertNotEqual(dyce.Dice().roll(20, 100), dyce.Dice().roll(20, 100))
+
+    def testSeed(self):
+        """equal seeds should roll equal streams"""
+        self.assertEqual(dyce.Dice(seed=7).roll(20), dyce.Dice(seed=7).roll(20))
+
+    def testSpawnReproducible(self):
+        """the same parent should spawn the same children"""
+        for name in dyce.dice.rng.available():
+            a = [k.roll(20, 100) for k in dyce.Dice(seed=1, backend=name).spawn(3)]
+            b = [k.roll(20, 100) for k in dyce.Dice(seed=1, backend=name).spawn(3)]
+            self.assertEqual(a, b)
+            self.assertNotEqual(a[0], a[1])
+            self.assertNotEqual(a[1], a[2])
+
+    def testSpawnIgnoresParentRolls(self):
+        """children should depend on spawn order, not parent rolls"""
+        state = dyce.Dice().init_state
+        p1 = dyce.Dice(state=state)
+        p2 = dyce.Dice(state=state)
+        p2.roll(50)
+        self.assertEqual(p1.spawn(2)[1].roll(10), p2.spawn(2)[1].roll(10))
+
+    def testSuccessiveSpawns(self):
+        """later spawns should give fresh children, until reset"""
+        d = dyce.Dice(seed=3)
+        first = d.spawn(1)[0].roll(20, 100)
+        self.assertNotEqual(first, d.spawn(1)[0].roll(20, 100))
+        d.reset()
+        self.assertEqual(first, d.spawn(1)[0].roll(20, 100))
+
+    def testSpawnKeepsClass(self):
+        """children should be the same kind of Dice"""
+        kids = dyce.ParetoLowDice(alpha=5, seed=2).spawn(2)
+        self.assertEqual(kids[0].__class__, dyce.ParetoLowDice)
+        self.assertEqual(kids[0].alpha, 5)
+
+
+class SamplingTest(unittest.TestCase):
+    def testBoundedRange(self):
+        """bounded ints should fall in [offset, offset+bound)"""
+        import random
+        from dyce import sampling
+        r = random.Random(3)
+        for bound in (1, 2, 3, 6, 8, 20, 64, 100, 2**31 + 1, 2**32, 2**40):
+            for n in (1, 7, 500):
+                values = sampling.boundedInts(r, n, bound, 1)
+                self.assertEqual(len(values), n)
+                for v in values:
+                    assert 1 <= v <= bound, "%s out of 1..%s" % (v, bound)
+
+    def testBoundedUniform(self):
+        """every face should come up about equally often"""
+        import random
+        from dyce import sampling
+        r = random.Random(4)
+        for bound in (6, 8, 10):
+            n = 60000
+            counts = [0] * bound
+            for v in sampling.boundedInts(r, n, bound):
+                counts[v] += 1
+            expected = float(n) / bound
+            chi2 = sum([(c - expected) ** 2 / expected for c in counts])
+            # Far beyond the 99.9th percentile for these degrees of freedom.
+            assert chi2 < 40, "d%s chi-square %s: %s" % (bound, chi2, counts)
+
+    def testRollReproducible(self):
+        """rolls should replay exactly from the generator state"""
+        d = dyce.Dice()
+        d.roll(5, 7)
+        state = d.rand.getstate()
+        rolls = [d.roll(n, k) for n in (1, 3, 40) for k in (4, 6, 10)]
+        d2 = dyce.Dice(state=state)
+        self.assertEqual([d2.roll(n, k) for n in (1, 3, 40) for k in (4, 6, 10)],
+                         rolls)
+
+    def testAliasTable(self):
+        """alias tables should give each index its share"""
+        from dyce import sampling
+        import random
+        table = sampling.aliasTable([1, 0, 3, 4])
+        draws = sampling.aliasInts(random.Random(3), 80000, table, 1)
+        self.assertEqual(draws.count(2), 0)
+        for face, share in [(1, 10000), (3, 30000), (4, 40000)]:
+            assert abs(draws.count(face) - share) < 1000, draws.count(face)
+
+
+class CounterDiceTest(unittest.TestCase):
+    def testRollAt(self):
+        """rolls at an index should depend only on the key and index"""
+        d = dyce.CounterDice(key=99)
+        far = d.roll_at(10**15, 5, 6)
+        d.roll(100)
+        self.assertEqual(dyce.CounterDice(key=99).roll_at(10**15, 5, 6), far)
+        self.assertNotEqual(dyce.CounterDice(key=98).roll_at(10**15, 5, 6), far)
+        for r in far:
+            assert 1 <= r <= 6
+
+    def testRollRange(self):
+        """index ranges should match rolling each index"""
+        d = dyce.CounterDice(key=1)
+        self.assertEqual(d.roll_range(50, 60, 3, 8),
+                         [d.roll_at(i, 3, 8) for i in range(50, 60)])
+        self.assertEqual(d.rollsum_at(3, 3, 8), sum(d.roll_at(3, 3, 8)))
+
+    def testTables(self):
+        """tables should reroll reproducibly at an index"""
+        d = dyce.CounterDice(key=5)
+        sio = StringIO(STARS_INI)
+        stars = tables.loadTable(sio, 'stars')
+        for i in range(20):
+            self.assertEqual(tables.rollTable(stars['class'], roller=d.at(i)),
+                             tables.rollTable(stars['class'], roller=d.at(i)))
+
+
+class CompactDiceTest(unittest.TestCase):
+    def testLazyGenerator(self):
+        """seeded Dice should make their generator on first use"""
+        d = dyce.Dice(seed=12)
+        self.assertEqual(d._rand, None)
+        self.assertEqual(d._init_state, None)
+        rolls = d.roll(10)
+        assert d._rand is not None
+        self.assertEqual(d._init_state, None)
+        d.reset()
+        self.assertEqual(d.roll(10), rolls)
+
+    def testInitState(self):
+        """a seeded Dice's initial state should replay its rolls"""
+        d = dyce.Dice(seed=13)
+        self.assertEqual(dyce.Dice(state=d.init_state).roll(10), d.roll(10))
+
+    def testPickle(self):
+        """Dice should pickle, compact or not"""
+        import pickle
+        for d in (dyce.Dice(seed=14), dyce.Dice(state=dyce.Dice().init_state),
+                  dyce.ParetoLowDice(alpha=4)):
+            for protocol in (0, 2):
+                d2 = pickle.loads(pickle.dumps(d, protocol))
+                self.assertEqual(d2.roll(10), d.roll(10))
+
+
+class RollCountsTest(unittest.TestCase):
+    def testCounts(self):
+        """face counts should cover every die"""
+        d = dyce.Dice()
+        for num, sides in [(0, 6), (1, 6), (10, 4), (10**6, 20), (10**12, 6)]:
+            counts = d.roll_counts(num, sides)
+            self.assertEqual(len(counts), sides)
+            self.assertEqual(sum(counts), num)
+            for c in counts:
+                assert c >= 0
+        self.assertEqual(d.roll_counts(5, 0), [])
+        self.assertRaises(dyce.OutOfRangeError, d.roll_counts, -1, 6)
+
+    def testCountsFair(self):
+        """face counts should be even across many dice"""
+        counts = dyce.Dice().roll_counts(600000, 6)
+        for c in counts:
+            assert abs(c - 100000) < 2000, counts
+
+    def testCountedSort(self):
+        """big sorted rolls should come out sorted and in range"""
+        d = dyce.Dice()
+        results = d.roll(500, 6, 2, sort=True)
+        self.assertEqual(len(results), 500)
+        self.assertEqual(results, sorted(results))
+        assert 3 <= results[0] and results[-1] <= 8
+
+
+class ParetoTest(unittest.TestCase):
+    def testMatchesWalk(self):
+        """table lookup should pick the bucket a linear walk would"""
+        import random
+        d = dyce.ParetoLowDice(seed=1)
+        for sides, alpha in [(6, 10), (100, 4), (1000, 1)]:
+            d.rand = random.Random(sides)
+            r = random.Random(sides)
+            portion = 1.0/sides
+            for i in xrange(2000):
+                presult = r.paretovariate(alpha)
+                index = 0
+                section = 1.0 + portion
+                while section < presult and index < sides - 1:
+                    index += 1
+                    section += portion
+                self.assertEqual(d.randParetoRange(1, sides+1, alpha),
+                                 index + 1)
+
+    def testRoll(self):
+        """pareto rolls should be in range, and mostly low"""
+        results = dyce.ParetoLowDice().roll(5000, 20, 1)
+        assert 2 <= min(results) and max(results) <= 21
+        assert results.count(2) > results.count(11), results.count(2)
+        self.assertRaises(dyce.OutOfRangeError, dyce.ParetoLowDice().roll,
+                          1, 1)
+
+
+class PoolTest(unittest.TestCase):
+    def testPool(self):
+        """pool counts should add up, and successes follow from them"""
+        d = dyce.Dice()
+        for num in (0, 1, 7, 10**6):
+            pool = d.roll_pool(num, 10, 6, explode=10, double=10, botch=1)
+            c = pool.counts
+            self.assertEqual(len(c), 10)
+            self.assertEqual(sum(c), num + pool.rerolled)
+            self.assertEqual(pool.successes,
+                             sum(c[5:]) + c[9] - c[0])
+            self.assertEqual(len(pool.rolls), sum(c))
+            self.assertEqual(pool.rolls, sorted(pool.rolls))
+
+    def testExplosions(self):
+        """explosions should chain as often as expected"""
+        pool = dyce.Dice().roll_pool(900000, 10, explode=10)
+        # Each die sets off 1/9 of a re-roll, on average.
+        assert abs(pool.rerolled - 100000) < 2000, pool.rerolled
+        self.assertRaises(dyce.OutOfRangeError, dyce.Dice().roll_pool,
+                          5, 10, 6, 1)
+
+    def testD10(self):
+        """D10 pools should unpack as rolls and a description"""
+        rolls, text = dyce.D10().roll(8, reroll=True)
+        assert len(rolls) >= 8
+        assert text.endswith(')'), text
+        pool = dyce.D10().roll(8)
+        self.assertEqual(pool.rerolled, 0)
+        self.assertEqual(str(pool).split()[0], str(pool.successes))
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(pool[0], pool.rolls)
+        self.assertEqual(pool[-1], str(pool))
+        self.assertEqual(pool[:], (pool.rolls, str(pool)))
+
+    def testCheat(self):
+        """pools and kept dice should use cheated rolls"""
+        d = dyce.D10()
+        d._cheat_next.append([1, 6, 10, 10, 3])
+        pool = d.roll(4, reroll=True)
+        self.assertEqual(pool.rolls, [1, 3, 6, 10, 10])
+        self.assertEqual(pool.rerolled, 1)
+        self.assertEqual(pool.successes, 4)
+        d._cheat_next.append([2, 5, 4, 1])
+        self.assertEqual(d.roll_keep(4, 6, 3), [2, 4, 5])
+        d._cheat_next.append([2, 5, 4, 1])
+        self.assertEqual(d.roll_keep(4, 6, 1, highest=False), [1])
+
+
+class BellTest(unittest.TestCase):
+    def setUp(self):
+        self.numpy = dyce.dice.numpy
+
+    def tearDown(self):
+        dyce.dice.numpy = self.numpy
+
+    def checkBell(self):
+        d = dyce.Dice()
+        ints = list(d.rollbellInt_batch(60000, 1, 10))
+        self.assertEqual(len(ints), 60000)
+        self.assertEqual(set(ints), set(range(1, 11)))
+        # Clamping piles the tails onto the ends...
+        assert ints.count(1) > 1.5 * ints.count(2), ints.count(1)
+        # ...and truncating doesn't.
+        ints = list(d.rollbellInt_batch(60000, 1, 10, truncate=True))
+        assert ints.count(1) < ints.count(2), ints.count(1)
+
+        for ratio in (1.0, 6.0):
+            floats = d.rollbell_batch(20000, 0, 10, ratio, truncate=True)
+            self.assertEqual(len(floats), 20000)
+            assert 0 <= min(floats) and max(floats) <= 10
+            assert 4.8 < sum(floats) / 20000 < 5.2
+
+    def testNumpyBell(self):
+        """bell batches should be shaped right (NumPy, if present)"""
+        self.checkBell()
+
+    def testPurePythonBell(self):
+        """bell batches should be shaped right without NumPy"""
+        dyce.dice.numpy = None
+        self.checkBell()
+
+    def testScalarBell(self):
+        """single bell rolls should stay in range"""
+        d = dyce.Dice()
+        for i in xrange(1000):
+            assert 1 <= d.rollbellInt(1, 6, truncate=True) <= 6
+            assert 1.0 <= d.rollbellFloat(1, 6, 2.0, True) <= 6.0
+        self.assertEqual(d.rollbellInt(3, 3), 3)
+
+    def testWideRanges(self):
+        """wide integer bell rolls should not build tables"""
+        import time
+        d = dyce.Dice()
+        dyce.dice._bell_tables.clear()
+        start = time.time()
+        for low, high in [(1, 10**8), (-10**6, 10**6)]:
+            for truncate in (False, True):
+                r = d.rollbellInt(low, high, truncate=truncate)
+                assert isinstance(r, (int, long)), r
+                if truncate:
+                    assert low <= r <= high, r
+                rolls = d.rollbellInt_batch(10, low, high, truncate=truncate)
+                self.assertEqual(len(rolls), 10)
+        assert time.time() - start < 1
+        self.assertEqual(len(dyce.dice._bell_tables), 0)
+
+    def testTruncatedIntsMatchFloats(self):
+        """truncated int bells should be truncated float bells, rounded"""
+        d = dyce.Dice(seed=6)
+        trials = 40000
+        for truncate in (False, True):
+            ints = list(d.rollbellInt_batch(trials, 1, 10, 2.0, truncate))
+            floats = [int(round(d.rollbell(1, 10, 2.0, truncate)))
+                      for i in xrange(trials)]
+            for face in range(1, 11):
+                a = ints.count(face) / float(trials)
+                b = floats.count(face) / float(trials)
+                assert abs(a - b) < 0.01, (truncate, face, a, b)
+
+
+class KeepTest(unittest.TestCase):
+    def setUp(self):
+        self.numpy = dyce.dice.numpy
+
+    def tearDown(self):
+        dyce.dice.numpy = self.numpy
+
+    def testKeep(self):
+        """kept dice should be the highest (or lowest) ones"""
+        d = dyce.Dice()
+        for num, sides, keep in [(4, 6, 3), (2, 20, 1), (100, 6, 10),
+                                 (5, 4, 0), (3, 8, 3)]:
+            high = d.roll_keep(num, sides, keep)
+            low = d.roll_keep(num, sides, keep, highest=False, mod=1)
+            self.assertEqual(len(high), keep)
+            self.assertEqual(high, sorted(high))
+            self.assertEqual(len(low), keep)
+            for r in high:
+                assert 1 <= r <= sides
+            for r in low:
+                assert 2 <= r <= sides + 1
+        self.assertEqual(d.roll_keep(100, 6, 5), [6] * 5)
+        self.assertRaises(dyce.OutOfRangeError, d.roll_keep, 2, 6, 3)
+
+    def testAdvantage(self):
+        """keeping the best of 2d20 should average about 13.8"""
+        rolls = [dyce.Dice().roll_keep(2, 20)[0] for i in xrange(20000)]
+        assert 13.6 < sum(rolls) / 20000.0 < 14.0
+
+    def checkBatch(self):
+        d = dyce.Dice()
+        for highest in (True, False):
+            kept = d.roll_keep_batch(2000, 4, 6, 3, highest)
+            self.assertEqual(len(kept), 2000)
+            for row in kept:
+                self.assertEqual(list(row), sorted(row))
+                self.assertEqual(len(row), 3)
+        mean = sum(sum(row) for row in d.roll_keep_batch(20000, 4, 6, 3))
+        # 4d6, drop the lowest, averages 12.24.
+        assert 12.0 < mean / 20000.0 < 12.5, mean / 20000.0
+
+    def testNumpyBatch(self):
+        """batched keeps should select per trial (NumPy, if present)"""
+        self.checkBatch()
+
+    def testPurePythonBatch(self):
+        """batched keeps should select per trial without NumPy"""
+        dyce.dice.numpy = None
+        self.checkBatch()
+
+
+class ThreadLocalTest(unittest.TestCase):
+    def tearDown(self):
+        dyce.setThreadLocal(False)
+
+    def rollInThreads(self, count, bind=False):
+        import threading
+        results = {}
+
+        def work(i):
+            if bind:
+                dyce.roller.bind(i)
+            results[i] = (dyce.roller.roll(5, 20), dcalc.dsum(3, 6),
+                          dcalc.calculate('2d6 + [1 4]'))
+        threads = [threading.Thread(target=work, args=(i,))
+                   for i in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def testThreadLocal(self):
+        """each thread should roll its own reproducible stream"""
+        dyce.setThreadLocal(seed=5)
+        a = self.rollInThreads(4, bind=True)
+        dyce.setThreadLocal(seed=5)
+        b = self.rollInThreads(4, bind=True)
+        self.assertEqual(a, b)
+        self.assertEqual(len(set(str(r) for r in a.values())), 4)
+        kid = dyce.Dice(seed=5).spawn(3)[2]
+        self.assertEqual(a[2][0], kid.roll(5, 20))
+
+    def testModes(self):
+        """the module roller should switch modes in place"""
+        roller = dyce.roller
+        self.assertFalse(roller.local)
+        self.assertRaises(dyce.DiceError, roller.bind, 0)
+        dyce.setThreadLocal(seed=1)
+        self.assert_(dyce.roller is roller and dcalc.DiceCalculator.roller
+                     is roller)
+        self.assert_(roller.local)
+        self.assertEqual(len(self.rollInThreads(3)), 3)
+        dyce.setThreadLocal(False)
+        self.assertFalse(roller.local)
+
+    def testDiceAPI(self):
+        """a roller should be a Dice, with all of the current Dice's API"""
+        roller = dyce.dice.Roller(dyce.Dice(seed=3))
+        self.assert_(isinstance(roller, dyce.Dice))
+        self.assertEqual(roller.backend, roller.dice.backend)
+        self.assertEqual(roller.init_state, roller.dice.init_state)
+        self.assertEqual(roller.roll(5, 20), dyce.Dice(seed=3).roll(5, 20))
+        roller._cheat_next.append([1, 2, 3])
+        self.assertEqual(roller.roll(3, 6), [1, 2, 3])
+        roller.reset()
+        self.assertEqual(roller.roll(5, 20), dyce.Dice(seed=3).roll(5, 20))
+
+    def testSwitching(self):
+        """rolling should survive mode switches in other threads"""
+        import threading
+        roller = dyce.dice.Roller()
+        errors = []
+        done = threading.Event()
+
+        def work():
+            try:
+                while not done.is_set():
+                    roller.roll(2, 6)
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for t in threads:
+            t.start()
+        try:
+            for i in range(300):
+                roller.threadLocal(seed=i)
+                roller.share()
+        finally:
+            done.set()
+            for t in threads:
+                t.join()
+        self.assertEqual(errors, [])
+
+
+class SecureDiceTest(unittest.TestCase):
+    def testRanges(self):
+        """SecureDice should roll in range, everywhere Dice do"""
+        d = dyce.SecureDice()
+        for r in d.roll(200, 6):
+            assert 1 <= r <= 6, r
+        assert 3 <= d.rollsum(3, 6) <= 18
+        assert 5.0 <= d.fuzz(10, 0.5) <= 15.0
+        assert 4 <= dcalc.calculate('2d6+2', d) <= 14
+
+    def testBatches(self):
+        """SecureDice batches shouldn't come from NumPy's generator"""
+        d = dyce.SecureDice()
+        results = d.roll_batch(100, 2, 20)
+        self.assertEqual(type(results), list)
+        for row in results:
+            assert 1 <= min(row) and max(row) <= 20, row
+        self.assertEqual(type(d.rollsum_batch(10, 3, 6)), list)
+
+    def testNoState(self):
+        """SecureDice have no state to save or restore"""
+        d = dyce.SecureDice()
+        self.assertRaises(NotImplementedError, getattr, d, 'init_state')
+        self.assertRaises(NotImplementedError, d.rand.getstate)
+        self.assertRaises(NotImplementedError, d.rand.jumpahead, 1)
+
+    def testStaysSecure(self):
+        """SecureDice should never fall back to a seeded generator"""
+        d = dyce.SecureDice()
+        self.assertRaises(dyce.DiceError, d.setBackend, 'mt')
+        self.assert_(isinstance(d.rand, dyce.rng.UrandomRandom))
+        kids = d.spawn(2)
+        self.assertEqual(len(kids), 2)
+        for kid in kids:
+            self.assert_(isinstance(kid, dyce.SecureDice))
+            self.assert_(isinstance(kid.rand, dyce.rng.UrandomRandom))
+
+
+class FillBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.numpy = dyce.dice.numpy
+
+    def tearDown(self):
+        dyce.dice.numpy = self.numpy
+
+    def checkFill(self):
+        from array import array
+        import mmap
+        import struct
+        d = dyce.Dice()
+        a = array('h', [0] * 5000)
+        self.assertEqual(d.roll_into(a, 6, 1), 5000)
+        assert 2 <= min(a) and max(a) <= 7, (min(a), max(a))
+        self.assertEqual(d.rollsum_into(a, 3, 6, 0, 2), 5000)
+        assert 5 <= min(a) and max(a) <= 20, (min(a), max(a))
+
+        b = bytearray(1000)
+        d.roll_into(b, 20)
+        assert 1 <= min(b) and max(b) <= 20
+
+        m = mmap.mmap(-1, 4000)
+        self.assertEqual(d.rollsum_into(m, 100, 100, format='i'), 1000)
+        sums = struct.unpack('1000i', m[:])
+        assert 100 <= min(sums) and max(sums) <= 10000
+
+        # Results that might not fit the items are refused up front.
+        b = bytearray(10)
+        self.assertRaises(dyce.OutOfRangeError, d.rollsum_into, b, 100, 6)
+        self.assertRaises(dyce.OutOfRangeError, d.roll_into, b, 6, -2)
+        self.assertRaises(dyce.OutOfRangeError, d.roll_into,
+                          array('B', [0] * 10), 1000)
+        self.assertRaises(dyce.OutOfRangeError, d.roll_into,
+                          array('h', [0] * 10), 40000)
+        self.assertEqual(b, bytearray(10))
+        self.assertEqual(d.roll_into(b, 256, -1), 10)
+        self.assertEqual(d.roll_into(array('b', [0] * 10), 6, -7), 10)
+
+    def testNumpyFill(self):
+        """buffers should fill in place, in range (NumPy, if present)"""
+        self.checkFill()
+        if self.numpy is not None:
+            n = self.numpy.zeros((20, 50), dtype='int32')
+            dyce.Dice().roll_into(n, 8)
+            assert 1 <= n.min() and n.max() <= 8
+            self.assertRaises(dyce.OutOfRangeError, dyce.Dice().roll_into,
+                              self.numpy.zeros(10, dtype='uint8'), 1000)
+
+    def testPurePythonFill(self):
+        """buffers should fill in place, in range, without NumPy"""
+        dyce.dice.numpy = None
+        self.checkFill()
+
+    def testBadFill(self):
+        """filling should reject bad dice and read-only buffers"""
+        d = dyce.Dice()
+        self.assertRaises(dyce.OutOfRangeError, d.roll_into, bytearray(4), 0)
+        self.assertRaises(TypeError, d.roll_into, 'read-only', 6)
+
+
 class DiceBadInput(SimpleDiceTestCase):
     def testNonIntegerD(self):
         """dice should fail on non-integer D"""
@@ -0,0 +1,130 @@
+"""testdistribution - unit tests for exact dice distributions
+
+$Author$
+$Rev$
+$Date$
+"""
+
+__author__ = "$Author$"
+__version__ = "$Rev$"
+__date__ = "$Date$"
+
+import unittest
+from fractions import Fraction
+
+from dyce import distribution
+
+
+class RollsumDistributionTest(unittest.TestCase):
+    def testTwoD6(self):
+        """2d6 should have the familiar triangle distribution"""
+        d = distribution.rollsum(2, 6)
+        self.assertEqual(d.min(), 2)
+        self.assertEqual(d.max(), 12)
+        self.assertEqual(d.pmf(7), Fraction(1, 6))
+        self.assertEqual(d.pmf(2), Fraction(1, 36))
+        self.assertEqual(d.pmf(13), 0)
+        self.assertEqual(d.cdf(12), 1)
+        self.assertEqual(d.mean(), 7)
+        self.assertEqual(d.variance(), Fraction(35, 6))
+
+    def testModifiers(self):
+        """modifiers should shift the distribution like Dice.rollsum"""
+        d = distribution.rollsum(3, 6, 1, -2)
+        self.assertEqual(d.min(), 4)
+        self.assertEqual(d.max(), 19)
+        self.assertEqual(distribution.fromSpec('3d6+1'),
+                         distribution.rollsum(3, 6, 1))
+
+    def testPowersMatchDirectSums(self):
+        """memoized powers should agree with adding one die at a time"""
+        one = distribution.rollsum(1, 4)
+        running = one
+        for n in range(2, 12):
+            running = running + one
+            self.assertEqual(distribution.rollsum(n, 4), running)
+
+    def testCachesBounded(self):
+        """the power and sum caches should stay within their sizes"""
+        sizes = distribution.POWER_CACHE_SIZE, distribution.SUM_CACHE_SIZE
+        distribution.POWER_CACHE_SIZE = distribution.SUM_CACHE_SIZE = 4
+        try:
+            for sides in range(2, 12):
+                for num in (1, 3, 20):
+                    distribution.rollsum(num, sides)
+            self.assertEqual(len(distribution._powers), 4)
+            self.assertEqual(len(distribution._sums), 4)
+        finally:
+            distribution.POWER_CACHE_SIZE, distribution.SUM_CACHE_SIZE = sizes
+        self.assertEqual(distribution.rollsum(5, 6), distribution.rollsum(5, 6))
+
+    def testHash(self):
+        """equal distributions should hash alike"""
+        a = distribution.rollsum(2, 6)
+        b = distribution.Distribution(dict((v, 2 * a.weight(v)) for v in a))
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertEqual(len(set([a, b, distribution.rollsum(3, 6)])), 2)
+
+    def testLargeMean(self):
+        """big piles of dice should have exact moments"""
+        d = distribution.rollsum(200, 10)
+        self.assertEqual(d.mean(), Fraction(1100))
+        self.assertEqual(d.variance(), Fraction(200 * 99, 12))
+
+    def testQuantile(self):
+        """quantiles should pick the smallest outcome reaching q"""
+        d = distribution.rollsum(3, 6)
+        self.assertEqual(d.quantile(0.5), 10)
+        self.assertEqual(d.quantile(0), 3)
+        self.assertEqual(d.quantile(1), 18)
+        self.assertRaises(ValueError, d.quantile, 1.5)
+
+    def testCombine(self):
+        """combinations should treat draws as independent"""
+        d = distribution.rollsum(1, 6)
+        product = d.combine(d, lambda a, b: a * b)
+        self.assertEqual(product.pmf(36), Fraction(1, 36))
+        self.assertEqual(product.pmf(6), Fraction(4, 36))
+        self.assertEqual((d - d).mean(), 0)
+
+
+class TermDistributionTest(unittest.TestCase):
+    def testKeep(self):
+        """keeping dice should match counting every roll"""
+        import itertools
+        for num, sides, keep, highest in [(4, 6, 3, True), (3, 5, 1, False),
+                                          (5, 3, 2, True), (2, 20, 1, False)]:
+            counts = {}
+            for roll in itertools.product(range(1, sides + 1), repeat=num):
+                roll = sorted(roll)
+                total = sum(roll[num-keep:] if highest else roll[:keep])
+                counts[total] = counts.get(total, 0) + 1
+            self.assertEqual(distribution.keep(num, sides, keep, highest),
+                             distribution.Distribution(counts))
+        self.assertEqual(distribution.keep(3, 6, 3), distribution.rollsum(3, 6))
+        self.assertEqual(distribution.keep(20, 20, 10).total, 20 ** 20)
+
+    def testRandint(self):
+        """randint should be flat over its range"""
+        d = distribution.randint(-1, 2)
+        self.assertEqual(d.items(), [(-1, 1), (0, 1), (1, 1), (2, 1)])
+
+    def testBellInt(self):
+        """bell rolls should peak in the middle, and be symmetric"""
+        d = distribution.bellInt(1, 9)
+        self.assertEqual(d.quantile(0.5), 5)
+        self.assertAlmostEqual(float(d.pmf(3)), float(d.pmf(7)))
+        assert d.pmf(5) > d.pmf(4) > d.pmf(3), d.probabilities()
+
+    def testMixture(self):
+        """mixtures should weight each distribution by its share"""
+        d = distribution.mixture([(1, distribution.constant(0)),
+                                  (3, distribution.rollsum(1, 2))])
+        self.assertEqual(d.probabilities(),
+                         [(0, Fraction(1, 4)), (1, Fraction(3, 8)),
+                          (2, Fraction(3, 8))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+"""testmontecarlo - unit tests for parallel Monte Carlo runs
+
+$Author$
+$Rev$
+$Date$
+"""
+
+__author__ = "$Author$"
+__version__ = "$Rev$"
+__date__ = "$Date$"
+
+import unittest
+from StringIO import StringIO
+
+from dyce import montecarlo, tables
+
+from testdice import STARS_INI
+
+
+class RunTest(unittest.TestCase):
+    def testHistogram(self):
+        """a run should count every trial"""
+        result = montecarlo.run('2d6', 5000, seed=3, workers=1,
+                                chunk_size=1000)
+        self.assertEqual(sum(result.histogram.values()), 5000)
+        self.assertEqual((result.min, result.max), (2, 12))
+        assert 6.8 < result.mean < 7.2, result.mean
+        assert 5.4 < result.variance < 6.3, result.variance
+        self.assertEqual(result.seed, 3)
+
+    def testWorkersDontMatter(self):
+        """any number of workers should give the same result"""
+        expr = '3d6 + {1.0 2.0}'
+        one = montecarlo.run(expr, 3000, seed=11, workers=1, chunk_size=500)
+        three = montecarlo.run(expr, 3000, seed=11, workers=3,
+                               chunk_size=500)
+        self.assertEqual(one, three)
+        self.assertEqual(repr(one.mean), repr(three.mean))
+        other = montecarlo.run(expr, 3000, seed=12, workers=1,
+                               chunk_size=500)
+        self.assertNotEqual(one, other)
+
+    def testTable(self):
+        """tables should run too, without moments for text results"""
+        stars = tables.loadTable(StringIO(STARS_INI), 'stars')
+        result = montecarlo.run(stars['arity'], 600, seed=1, workers=2,
+                                chunk_size=200)
+        self.assertEqual(sum(result.histogram.values()), 600)
+        self.assertEqual(result.mean, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""testring - unit tests for shared-memory pre-rolled dice
+
+$Author$
+$Rev$
+$Date$
+"""
+
+__author__ = "$Author$"
+__version__ = "$Rev$"
+__date__ = "$Date$"
+
+import os
+import time
+import unittest
+
+import dyce
+from dyce import ring
+
+
+class RollRingTest(unittest.TestCase):
+    def testWrapAround(self):
+        """a ring should hand out each face once, across the wrap"""
+        r = ring.RollRing(1000, size=10)
+        roller = dyce.Dice(seed=1)
+        self.assertEqual(r.fill(roller), 10)
+        self.assertEqual(r.fill(roller), 0)
+        self.assertEqual(len(r.take(7)), 7)
+        self.assertEqual(r.fill(roller), 7)
+        faces = r.take(100)
+        self.assertEqual(len(faces), 10)
+        for f in faces:
+            assert 1 <= f <= 1000
+        self.assertEqual(r.take(1), [])
+
+    def testRingDice(self):
+        """RingDice should roll from the rings, then locally"""
+        rings = ring.makeRings((6,), size=50)
+        ring.RingProducer(rings, seed=2).fill()
+        d = ring.RingDice(rings, take_chunk=8)
+        rolls = d.roll(40, 6, 1)
+        self.assertEqual(d.misses, 0)
+        assert 2 <= min(rolls) and max(rolls) <= 7
+        d.roll(20, 6)
+        self.assertEqual(d.misses, 10)
+        assert 3 <= d.rollsum(3, 6) <= 18
+        assert 1 <= d.roll(1, 8)[0] <= 8
+
+    def testProducer(self):
+        """a producer process should refill rings drained by other processes"""
+        rings = ring.makeRings((20,), size=1000)
+        producer = ring.RingProducer(rings, seed=3, interval=0.001)
+        producer.start()
+        try:
+            for i in range(100):
+                if rings[20].available() == 1000:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(rings[20].available(), 1000)
+            pid = os.fork()
+            if pid == 0:
+                ring.RingDice(rings).roll(600, 20)
+                os._exit(0)
+            os.waitpid(pid, 0)
+            for i in range(100):
+                if rings[20].available() == 1000:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(rings[20].available(), 1000)
+        finally:
+            producer.stop()
+
+    def waitFull(self, r):
+        for i in range(200):
+            if r.available() == r.size:
+                break
+            time.sleep(0.01)
+        self.assertEqual(r.available(), r.size)
+
+    def testGenerationsDiffer(self):
+        """fill() and each start() should put fresh faces in the rings"""
+        rings = ring.makeRings((1000,), size=50)
+        producer = ring.RingProducer(rings, seed=4, interval=0.001)
+        producer.fill()
+        batches = [rings[1000].take(50)]
+        producer.fill()
+        batches.append(rings[1000].take(50))
+        for i in range(2):
+            producer.start()
+            try:
+                self.waitFull(rings[1000])
+                batches.append(rings[1000].take(50))
+            finally:
+                producer.stop()
+        for i, a in enumerate(batches):
+            for b in batches[i+1:]:
+                self.assertNotEqual(a, b)
+
+
+if __name__ == '__main__':
+    unittest.main()
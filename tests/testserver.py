@@ -0,0 +1,140 @@
+"""testserver - unit tests for the dice server
+
+$Author$
+$Rev$
+$Date$
+"""
+
+__author__ = "$Author$"
+__version__ = "$Rev$"
+__date__ = "$Date$"
+
+import os
+import json
+import socket
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+
+import dyce
+from dyce import loadgen, server, tables
+
+from testdice import STARS_INI
+
+
+class DispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = server.Dispatcher(dyce.Dice(seed=1))
+
+    def testRequests(self):
+        """requests should get results, or errors"""
+        handle = self.dispatcher.handle
+        assert 3 <= handle({'expr': '3d6'})['result'] <= 18
+        self.assertEqual(len(handle({'expr': '1d20', 'count': 5})['result']),
+                         5)
+        tables.loadTable(StringIO(STARS_INI), 'stars')
+        assert handle({'table': 'stars', 'section': 'arity'})['result']
+        for bad in [{'expr': '3d6 +'}, {'nothing': 1}, 'text',
+                    {'expr': '1d6', 'seed': 4},
+                    {'table': 'no such table'}]:
+            assert 'error' in handle(bad), bad
+
+    def testSeededClients(self):
+        """seeded clients should replay their streams"""
+        handle = self.dispatcher.handle
+        first = handle({'expr': '1d100', 'count': 10, 'client': 'a',
+                        'seed': 9})
+        again = handle({'expr': '1d100', 'count': 10, 'client': 'a',
+                        'seed': 9})
+        self.assertEqual(first, again)
+        self.assertNotEqual(handle({'expr': '1d100', 'count': 10,
+                                    'client': 'a'}), first)
+
+    def testNoAssignment(self):
+        """requests should not set the process's dcalc variables"""
+        from dyce import dcalc
+        response = self.dispatcher.handle({'expr': 'set served 3'})
+        assert 'error' in response, response
+        assert 'served' not in dcalc.globalvars
+
+    def testMaxDice(self):
+        """requests rolling too many dice should get errors"""
+        handle = self.dispatcher.handle
+        limit = server.MAX_DICE
+        for expr in ['1000000000d6', '%sd6 + 1d4' % limit,
+                     '2 * (%sd6kh1 + 1d6)' % limit]:
+            response = handle({'expr': expr})
+            assert 'too many dice' in response.get('error', ''), response
+        self.assertEqual(handle({'expr': '%sd1' % limit}), {'result': limit})
+
+    def testQuerySeed(self):
+        """seeds given as strings should seed as ints"""
+        handle = self.dispatcher.handle
+        self.assertEqual(
+            handle({'expr': '1d100', 'count': 10, 'client': 'a',
+                    'seed': '9'}),
+            handle({'expr': '1d100', 'count': 10, 'client': 'a',
+                    'seed': 9}))
+
+    def testBatch(self):
+        """batches should be answered in order"""
+        responses = self.dispatcher.handle(
+            [{'expr': '1d6'}, {'expr': '10d1'}, {'expr': '1d6 +'},
+             {'expr': '10d1'}, {'expr': '2d1', 'count': 2}])
+        self.assertEqual(len(responses), 5)
+        assert 1 <= responses[0]['result'] <= 6
+        self.assertEqual(responses[1], {'result': 10})
+        assert 'error' in responses[2]
+        self.assertEqual(responses[3], {'result': 10})
+        self.assertEqual(responses[4], {'result': [2, 2]})
+
+
+class UnixServerTest(unittest.TestCase):
+    def testPipelined(self):
+        """a Unix socket server should answer pipelined lines"""
+        path = os.path.join(tempfile.mkdtemp(), 'dyce.sock')
+        srv = server.UnixRollServer(path)
+        thread = threading.Thread(target=srv.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(path)
+            sock.sendall('{"expr": "2d1"}\n' * 3 + '[{"expr": "1d1"}]\n')
+            rfile = sock.makefile('rb')
+            for i in range(3):
+                self.assertEqual(json.loads(rfile.readline()), {'result': 2})
+            self.assertEqual(json.loads(rfile.readline()), [{'result': 1}])
+            sock.close()
+            stats = loadgen.run(unix=path, requests=200, pipeline=4)
+            self.assertEqual(stats['requests'], 200)
+        finally:
+            srv.shutdown()
+            srv.server_close()
+            os.unlink(path)
+
+    def testSocketPath(self):
+        """a server should replace only stale sockets at its path"""
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'dyce.sock')
+        with open(path, 'w') as f:
+            f.write('keep me')
+        self.assertRaises(socket.error, server.UnixRollServer, path)
+        self.assertEqual(open(path).read(), 'keep me')
+        os.unlink(path)
+
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        srv = server.UnixRollServer(path)
+        try:
+            self.assertRaises(socket.error, server.UnixRollServer, path)
+        finally:
+            srv.server_close()
+            os.unlink(path)
+            os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()